@@ -0,0 +1,287 @@
+#Continuous ADC acquisition decoupled from rendering
+
+#The visualizers used to stop the display while collecting a full window of samples, then stop
+#sampling while the FFT ran and the LEDs updated. Here a background thread keeps reading the ADC into
+#a preallocated ring buffer, and the render loop just grabs the most recent N samples without waiting.
+
+#The ring buffer is single producer / single consumer and lock-free: the producer fills a block
+#in place and only then publishes it by advancing write_count. The reader checks write_count again
+#after copying to detect the (rare) case where the producer lapped it mid-copy.
+
+#With shared = True the samples, block timestamps, write_count and counters live in one
+#multiprocessing.shared_memory block, so the producer and consumer can be separate processes (see
+#Process_Pipeline.py). Any processes forked after the ring is created see the same buffer.
+
+#With demand_paced = True the producer doesn't run ahead of the consumer: it only fills another block while fewer
+#samples are waiting unread than the consumer asked for in its last read (WaitForDemand). That's for sources that
+#can go faster than realtime, like a capture replayed with Simulate.py --replay --fast, so the render loop still
+#sees the samples a frame at a time instead of the whole capture at once. The consumer in turn waits (up to
+#DEMAND_WAIT_TIMEOUT) in ReadNew for the samples it asks for, so a render loop that doesn't sleep between frames
+#(see Frame_Scheduler.py) doesn't spin on reads that come back short.
+
+#Counters:
+#    overruns  = reads where the render loop fell so far behind that samples were overwritten before it saw them
+#    underruns = reads where fewer than N new samples had arrived since the previous read (acquisition is too slow),
+#                for ReadNew N is the min_new the caller asks for
+import threading
+import time
+import numpy as np
+from multiprocessing import shared_memory
+
+DEFAULT_BLOCK_SIZE = 64
+
+#demand_paced default of new ring buffers, see above. ADC_Capture.InstallReplay sets it for fast replays
+DEMAND_PACED = False
+DEMAND_WAIT_TIMEOUT = 0.1 #seconds ReadNew waits for min_new samples on a demand_paced ring before it reads what's there
+
+
+class SampleRingBuffer:
+    def __init__(self, capacity, channels = 1, block_size = DEFAULT_BLOCK_SIZE, dtype = np.uint16, shared = False, demand_paced = None):
+        #round capacity up to a whole number of blocks so blocks never wrap
+        num_blocks = max(2, -(-capacity // block_size))
+        self.block_size = block_size
+        self.capacity = num_blocks * block_size
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self.demand_paced = DEMAND_PACED if demand_paced is None else demand_paced
+
+        #[write_count, overruns, underruns, read_count, demand], then the block times, then the samples, all in one buffer
+        times_offset = 5 * 8
+        samples_offset = times_offset + num_blocks * 8
+        size = samples_offset + self.capacity * channels * self.dtype.itemsize
+        self.shm = shared_memory.SharedMemory(create=True, size=size) if shared else None
+        buf = self.shm.buf if shared else bytearray(size)
+        self._counters = np.ndarray(5, np.int64, buf, 0)
+        self._counters[:] = 0
+        self.block_times = np.ndarray(num_blocks, np.float64, buf, times_offset) #time.monotonic() when each block was completed
+        self.samples = np.ndarray((self.capacity, channels), self.dtype, buf, samples_offset)
+
+    #total samples ever published, only the producer changes this
+    @property
+    def write_count(self):
+        return int(self._counters[0])
+
+    @write_count.setter
+    def write_count(self, value):
+        self._counters[0] = value
+
+    @property
+    def overruns(self):
+        return int(self._counters[1])
+
+    @overruns.setter
+    def overruns(self, value):
+        self._counters[1] = value
+
+    @property
+    def underruns(self):
+        return int(self._counters[2])
+
+    @underruns.setter
+    def underruns(self, value):
+        self._counters[2] = value
+
+    #write_count as of the consumer's last read, only the consumer changes this
+    @property
+    def _read_count(self):
+        return int(self._counters[3])
+
+    @_read_count.setter
+    def _read_count(self, value):
+        self._counters[3] = value
+
+    #new samples the consumer asked for in its last read, or is waiting for
+    @property
+    def demand(self):
+        return int(self._counters[4])
+
+    @demand.setter
+    def demand(self, value):
+        self._counters[4] = value
+
+    #Releases the shared memory, only the process that created the ring should call this
+    def Close(self):
+        if self.shm is None:
+            return
+        del self._counters, self.block_times, self.samples #the views have to go before the buffer can be closed
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+    #Producer side: returns a writable view of the next block, fill it and then call PublishBlock
+    def NextBlock(self):
+        pos = self.write_count % self.capacity
+        return self.samples[pos:pos + self.block_size]
+
+    def PublishBlock(self, timestamp):
+        pos = self.write_count % self.capacity
+        self.block_times[pos // self.block_size] = timestamp
+        self.write_count += self.block_size
+
+    def WriteBlock(self, block, timestamp):
+        self.NextBlock()[:] = block
+        self.PublishBlock(timestamp)
+
+    #Producer side: with demand_paced, blocks until the consumer wants more samples than are waiting unread.
+    #Returns False if stop_event (anything with is_set()) got set first
+    def WaitForDemand(self, stop_event = None, poll_interval = 0.0005):
+        while self.demand_paced and self.write_count - self._read_count >= max(self.demand, 1):
+            if stop_event is not None and stop_event.is_set():
+                return False
+            time.sleep(poll_interval)
+        return True
+
+    #Consumer side: copies the most recent n samples (oldest first) into out, shape (n, channels)
+    def ReadLatest(self, n, out = None):
+        if n > self.capacity - self.block_size:
+            raise ValueError('Cannot read {} samples from a ring buffer of {}'.format(n, self.capacity))
+        if out is None:
+            out = np.empty((n, self.channels), dtype=self.dtype)
+        self.demand = n
+
+        while True:
+            end = self.write_count
+            start = end - n
+            if start < 0: #not enough samples yet, pad the front with silence
+                out[:-start] = 0
+                self._CopyRange(0, end, out[-start:])
+            else:
+                self._CopyRange(start, end, out)
+            #the block being filled is one past end, so the copy is only torn if the producer got further than that
+            if self.write_count - start <= self.capacity - self.block_size:
+                break
+            self.overruns += 1
+
+        fresh = end - self._read_count
+        if fresh < n:
+            self.underruns += 1
+        elif fresh > self.capacity:
+            self.overruns += 1
+        self._read_count = end
+        return out
+
+    #Consumer side for streaming (ie the STFT): copies the samples published since the previous read, oldest
+    #first, into the front of out and returns that part of out. If more arrived than fit, only the newest are kept.
+    #min_new is how many new samples the caller needs to make progress (ie one STFT hop), fewer counts an underrun
+    def ReadNew(self, out, min_new = 0, poll_interval = 0.0005):
+        self.demand = min_new
+        if self.demand_paced and min_new > 0:
+            deadline = time.monotonic() + DEMAND_WAIT_TIMEOUT
+            while self.write_count - self._read_count < min_new and time.monotonic() < deadline:
+                time.sleep(poll_interval)
+        while True:
+            end = self.write_count
+            start = max(self._read_count, end - min(len(out), self.capacity - self.block_size))
+            self._CopyRange(start, end, out[:end - start])
+            if self.write_count - start <= self.capacity - self.block_size:
+                break
+            self.overruns += 1
+
+        if start > self._read_count:
+            self.overruns += 1 #samples were skipped
+        elif end - start < min_new:
+            self.underruns += 1
+        self._read_count = end
+        return out[:end - start]
+
+    def _CopyRange(self, start, end, out):
+        a = start % self.capacity
+        b = a + (end - start)
+        if b <= self.capacity:
+            out[:] = self.samples[a:b]
+        else:
+            split = self.capacity - a
+            out[:split] = self.samples[a:]
+            out[split:] = self.samples[:b - self.capacity]
+
+    #Measured sample rate (per channel) over the last span blocks, from the block timestamps
+    #Every timestamp is taken when a transfer returns, so it carries some scheduling jitter. The rate is the
+    #least squares slope of block number against time, which uses all span + 1 timestamps instead of just
+    #the first and last and so is much less sensitive to a single late block.
+    def SampleRate(self, span = 16):
+        blocks_written = self.write_count // self.block_size
+        span = min(span, blocks_written - 1, len(self.block_times) - 2)
+        if span < 1:
+            return 0.0
+        slots = np.arange(blocks_written - 1 - span, blocks_written) % len(self.block_times)
+        times = self.block_times[slots]
+        times = times - times.mean()
+        blocks = np.arange(span + 1) - span / 2
+        variance = np.dot(times, times)
+        if variance <= 0:
+            return 0.0
+        return np.dot(blocks, times) / variance * self.block_size
+
+    #Blocks until at least n samples have been written, used once at startup to prime the buffer
+    def WaitForSamples(self, n, timeout = None, poll_interval = 0.001):
+        self.demand = n
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.write_count < n:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(poll_interval)
+        return True
+
+
+#Smoothed SampleRate() of ring for code that uses the rate every frame (ie to pick FFT bins), so the
+#estimate does not wander from frame to frame. Each Update() moves the estimate smoothing of the way
+#towards the latest measurement, the first measurement is taken as is.
+class SampleRateEstimator:
+    def __init__(self, ring, span = 32, smoothing = 0.1):
+        self.ring = ring
+        self.span = span
+        self.smoothing = smoothing
+        self.rate = 0.0
+
+    def Update(self):
+        measured = self.ring.SampleRate(self.span)
+        if measured <= 0:
+            return self.rate
+        if self.rate == 0:
+            self.rate = measured
+        else:
+            self.rate += self.smoothing * (measured - self.rate)
+        return self.rate
+
+
+#Returns a fill_block function that reads each channel in turn with read_channel (ie ReadChannel), one call per sample
+def ChannelBlockReader(read_channel, channels):
+    channels = tuple(channels)
+    def fill_block(block):
+        block[:] = [[read_channel(ch) for ch in channels] for i in range(len(block))]
+    return fill_block
+
+
+#Background thread that keeps calling fill_block on the next block of ring and publishing it
+class AcquisitionThread:
+    def __init__(self, fill_block, ring):
+        self.fill_block = fill_block
+        self.ring = ring
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._Run, name='ADC acquisition', daemon=True)
+
+    def Start(self):
+        self._thread.start()
+        return self
+
+    def Stop(self, timeout = 1.0):
+        self._stop_event.set()
+        self._thread.join(timeout)
+
+    def _Run(self):
+        fill_block = self.fill_block
+        ring = self.ring
+        while ring.WaitForDemand(self._stop_event) and not self._stop_event.is_set():
+            fill_block(ring.NextBlock())
+            ring.PublishBlock(time.monotonic())
+
+
+#Convenience wrappers: create the ring buffer and start the acquisition thread
+def StartAcquisition(read_channel, channels, capacity, block_size = DEFAULT_BLOCK_SIZE):
+    ring = SampleRingBuffer(capacity, len(channels), block_size)
+    return AcquisitionThread(ChannelBlockReader(read_channel, channels), ring).Start()
+
+#Same, but with a batched reader (see MCP3004.py) that fills a whole block per SPI transfer
+def StartBulkAcquisition(reader, capacity, block_size = DEFAULT_BLOCK_SIZE):
+    ring = SampleRingBuffer(capacity, len(reader.channels), block_size)
+    return AcquisitionThread(reader.ReadInto, ring).Start()
@@ -0,0 +1,341 @@
+#Capture and replay of the raw ADC stream
+
+#To reproduce a glitch exactly, every conversion a script reads from the mcp3004 is recorded to disk, with when
+#it was read and which input the MUX had selected, and can later be fed back through the same code (ReadChannel,
+#MCP3004Reader, the acquisition thread, everything after) on any machine.
+
+#File format, little endian and append-only, so a capture cut short by a crash or power loss is still readable
+#up to its last complete chunk:
+#    file header   8 byte magic b'AVECAP01', f8 wall clock time the capture started
+#    chunk header  u4 kind, u4 count, f8 time.monotonic() when the chunk was read
+#    kind 1        conversions: count u2 samples, then count u1 channel ids, in the order they were converted
+#    kind 2        MUX mode: count bytes of ascii, 'stereo', 'mono' or 'off' (MUX output disabled, which is how the
+#                  scripts select the mic input and also how they leave the MUX on exit, the mic is channel 0)
+#Every chunk is padded to a multiple of 8 bytes, so the sample arrays of a memory-mapped capture are aligned.
+
+#Recording: RecordingSpiDev wraps a SpiDev and tees every xfer into a CaptureWriter, and MCP3004Reader tees the
+#conversions it reads with ioctl (which bypass xfer) the same way. A wrapped wiringpi records MUX changes.
+#The writer only queues the arrays, a background thread encodes and writes them, so the render loop never waits
+#on the disk. If the disk falls MAX_PENDING chunks behind, chunks are dropped and counted instead of blocking.
+#Only single process runs can be recorded, the multiprocess pipeline reads the ADC in a forked child.
+
+#Replay: CaptureFile memory-maps a capture, ReplaySpiDev answers every transfer with the next recorded
+#conversions, paced like the recording (realtime) or as fast as the script asks for them. A fast replay would
+#otherwise have the acquisition thread drain the whole capture before the script renders a single frame, so it
+#also turns on demand pacing of the sample ring buffers (see ADC_Acquisition.py): blocks are only read once the
+#render loop wants them, and every frame still gets its own samples (one hop for the spectrum visualizer, which
+#then renders every hop of the capture). The render loop's FrameScheduler stops sleeping between frames too (see
+#Frame_Scheduler.py), so the replay goes as fast as the script can render its frames.
+
+#usage on the Pi:        python ADC_Capture.py capture.avecap Script.py [script args...]
+#replay without a Pi:    python Simulate.py --replay capture.avecap [--fast] Script.py [script args...]
+#record the simulation:  python Simulate.py --record capture.avecap Script.py [script args...]
+import queue
+import runpy
+import sys
+import threading
+import time
+import types
+import numpy as np
+
+import ADC_Acquisition
+import Frame_Scheduler
+from MCP3004 import CommandChannels, DecodeReplies, EncodeReplies
+
+CAPTURE_MAGIC = b'AVECAP01'
+CHUNK_CONVERSIONS = 1
+CHUNK_MUX_MODE = 2
+FILE_HEADER = np.dtype([('magic', 'S8'), ('start_time', '<f8')])
+CHUNK_HEADER = np.dtype([('kind', '<u4'), ('count', '<u4'), ('time', '<f8')])
+
+MAX_PENDING = 4096 #chunks queued for the writer thread before new ones get dropped
+MUX_S0_PIN = 5
+MUX_E_PIN = 6 #Output Enable (active LOW)
+ADC_MIDPOINT = 512 #what a replay reads once the capture has run out
+
+
+#Bytes a chunk takes in the file, header and padding included
+def ChunkSize(kind, count):
+    kind, count = int(kind), int(count)
+    payload = 3 * count if kind == CHUNK_CONVERSIONS else count
+    return CHUNK_HEADER.itemsize + -(-payload // 8) * 8
+
+def EncodeChunk(kind, timestamp, payload, count):
+    header = np.array((kind, count, timestamp), dtype=CHUNK_HEADER).tobytes()
+    return header + payload + bytes(-len(payload) % 8)
+
+#'stereo', 'mono' or 'off' from the levels of the MUX pins, same as Hardware.SimulatedGpio.MuxMode()
+def MuxMode(s0_level, e_level):
+    if e_level == 1:
+        return 'off'
+    return 'mono' if s0_level == 1 else 'stereo'
+
+
+class CaptureWriter:
+    def __init__(self, path, max_pending = MAX_PENDING):
+        self.path = path
+        self._file = open(path, 'wb')
+        self._file.write(np.array((CAPTURE_MAGIC, time.time()), dtype=FILE_HEADER).tobytes())
+        self._queue = queue.Queue(maxsize=max_pending)
+        self.mux_mode = None
+        self.chunks = 0 #written
+        self.conversions = 0 #written
+        self.dropped = 0 #chunks dropped because the writer fell behind
+        self._thread = threading.Thread(target=self._Run, name='ADC capture', daemon=True)
+        self._thread.start()
+
+    def _Put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    #channels and values are the channel id and sample of every conversion, in order
+    def AddConversions(self, channels, values, timestamp = None):
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        self._Put((CHUNK_CONVERSIONS, timestamp, np.array(channels, dtype=np.uint8), np.array(values, dtype='<u2')))
+
+    def SetMuxMode(self, mode, timestamp = None):
+        if mode == self.mux_mode:
+            return
+        self.mux_mode = mode
+        self._Put((CHUNK_MUX_MODE, time.monotonic() if timestamp is None else timestamp, mode, None))
+
+    def _Run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            kind, timestamp, payload, values = item
+            if kind == CHUNK_CONVERSIONS:
+                self._file.write(EncodeChunk(kind, timestamp, values.tobytes() + payload.tobytes(), len(values)))
+                self.conversions += len(values)
+            else:
+                self._file.write(EncodeChunk(kind, timestamp, payload.encode('ascii'), len(payload)))
+            self.chunks += 1
+            if self._queue.empty(): #caught up, make what is written so far safe
+                self._file.flush()
+        self._file.close()
+
+    #Writes out everything still queued and closes the file
+    def Close(self, timeout = 5.0):
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def Summary(self):
+        return 'Capture {}: {} conversions in {} chunks, {} chunks dropped'.format(self.path, self.conversions, self.chunks, self.dropped)
+
+
+#SpiDev wrapper that records the conversions of every transfer, anything else goes straight to spi
+class RecordingSpiDev:
+    def __init__(self, spi, writer):
+        self._spi = spi
+        self._writer = writer
+
+    def __getattr__(self, name):
+        return getattr(self._spi, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._spi, name, value)
+
+    def RecordConversions(self, channels, values):
+        self._writer.AddConversions(channels, values)
+
+    def _Recorded(self, xfer, data, *args):
+        reply = xfer(data, *args)
+        self._writer.AddConversions(CommandChannels(data), DecodeReplies(reply))
+        return reply
+
+    def xfer(self, data, *args):
+        return self._Recorded(self._spi.xfer, data, *args)
+
+    def xfer2(self, data, *args):
+        return self._Recorded(self._spi.xfer2, data, *args)
+
+    def xfer3(self, data, *args):
+        return self._Recorded(self._spi.xfer3, data, *args)
+
+
+#Module objects standing in for spidev and wiringpi that record through writer
+def RecordingModules(spidev, wiringpi, writer):
+    recording_spidev = types.ModuleType('spidev')
+    recording_spidev.SpiDev = lambda *args: RecordingSpiDev(spidev.SpiDev(*args), writer)
+
+    recording_wiringpi = types.ModuleType('wiringpi')
+    for name in dir(wiringpi):
+        if not name.startswith('__'):
+            setattr(recording_wiringpi, name, getattr(wiringpi, name))
+    levels = {}
+    def digitalWrite(pin, level):
+        wiringpi.digitalWrite(pin, level)
+        levels[pin] = level
+        if pin in (MUX_S0_PIN, MUX_E_PIN) and MUX_E_PIN in levels: #the scripts set S0 first, then enable the output
+            writer.SetMuxMode(MuxMode(levels.get(MUX_S0_PIN, 0), levels[MUX_E_PIN]))
+    recording_wiringpi.digitalWrite = digitalWrite
+    return {'spidev': recording_spidev, 'wiringpi': recording_wiringpi}
+
+#Replaces spidev and wiringpi (the real ones, or the simulated ones if Hardware.py installed them first) with
+#recording versions, has to run before the script imports them
+def InstallRecorder(path):
+    import spidev
+    import wiringpi
+    writer = CaptureWriter(path)
+    sys.modules.update(RecordingModules(spidev, wiringpi, writer))
+    return writer
+
+
+#Read only, memory-mapped view of a capture file
+class CaptureFile:
+    def __init__(self, path):
+        self.path = path
+        self.data = np.memmap(path, dtype=np.uint8, mode='r')
+        if len(self.data) < FILE_HEADER.itemsize:
+            raise ValueError('{} is not an ADC capture'.format(path))
+        header = self.data[:FILE_HEADER.itemsize].view(FILE_HEADER)[0]
+        if header['magic'] != CAPTURE_MAGIC:
+            raise ValueError('{} is not an ADC capture'.format(path))
+        self.start_time = float(header['start_time'])
+
+        offsets, counts, times = [], [], []
+        self.mux_modes = [] #(time, mode) for every MUX change
+        pos = FILE_HEADER.itemsize
+        while pos + CHUNK_HEADER.itemsize <= len(self.data):
+            kind, count, timestamp = self.data[pos:pos + CHUNK_HEADER.itemsize].view(CHUNK_HEADER)[0].tolist()
+            size = ChunkSize(kind, count)
+            if pos + size > len(self.data): #the capture was cut off in the middle of this chunk
+                break
+            payload = pos + CHUNK_HEADER.itemsize
+            if kind == CHUNK_CONVERSIONS:
+                offsets.append(payload)
+                counts.append(count)
+                times.append(timestamp)
+            elif kind == CHUNK_MUX_MODE:
+                self.mux_modes.append((timestamp, self.data[payload:payload + count].tobytes().decode('ascii')))
+            pos += size
+        self.block_offsets = np.array(offsets, dtype=np.int64)
+        self.block_counts = np.array(counts, dtype=np.int64)
+        self.block_times = np.array(times, dtype=np.float64)
+        self.num_conversions = int(self.block_counts.sum())
+
+    def __len__(self):
+        return len(self.block_offsets)
+
+    #Samples of block i, a view into the file
+    def Values(self, i):
+        offset = self.block_offsets[i]
+        return self.data[offset:offset + 2 * self.block_counts[i]].view('<u2')
+
+    #Channel ids of block i, a view into the file
+    def Channels(self, i):
+        offset = self.block_offsets[i] + 2 * self.block_counts[i]
+        return self.data[offset:offset + self.block_counts[i]]
+
+    def Duration(self):
+        return float(self.block_times[-1] - self.block_times[0]) if len(self) > 1 else 0.0
+
+    def Summary(self):
+        modes = ' -> '.join(mode for t, mode in self.mux_modes) or 'none'
+        return '{}: {} conversions in {} blocks over {:.1f}s, MUX modes: {}'.format(
+            self.path, self.num_conversions, len(self), self.Duration(), modes)
+
+
+#Stand-in for spidev.SpiDev that answers with the conversions of a capture, in the order they were recorded.
+#The requested channels are expected to match the recorded ones (same script, same input), any that don't are
+#counted in channel_mismatches. With realtime set, a transfer returns no earlier than its last conversion was
+#read in the recording, relative to the first transfer. When the capture runs out on_end is called once and
+#every further conversion reads ADC_MIDPOINT.
+class ReplaySpiDev:
+    def __init__(self, capture, realtime = True, on_end = None):
+        self.capture = capture
+        self.realtime = realtime
+        self.on_end = on_end
+        self.max_speed_hz = 1000000
+        self.mode = 0
+        self.bits_per_word = 8
+        self.conversions = 0
+        self.transfers = 0
+        self.channel_mismatches = 0
+        self.finished = False
+        self._block = 0
+        self._pos = 0 #conversions of the current block already replayed
+        self._start = None #(time.monotonic(), capture time) of the first transfer
+
+    def open(self, bus, device):
+        self.bus = bus
+        self.device = device
+
+    def close(self):
+        pass
+
+    def xfer2(self, data):
+        self.transfers += 1
+        channels = CommandChannels(data)
+        values = np.full(len(channels), ADC_MIDPOINT, dtype=np.uint16)
+        filled = 0
+        block_time = None
+        while filled < len(values) and self._block < len(self.capture):
+            recorded = self.capture.Values(self._block)
+            take = min(len(values) - filled, len(recorded) - self._pos)
+            values[filled:filled + take] = recorded[self._pos:self._pos + take]
+            recorded_channels = self.capture.Channels(self._block)[self._pos:self._pos + take]
+            self.channel_mismatches += int(np.count_nonzero(recorded_channels != channels[filled:filled + take]))
+            block_time = self.capture.block_times[self._block]
+            filled += take
+            self._pos += take
+            if self._pos == len(recorded):
+                self._block += 1
+                self._pos = 0
+        self.conversions += filled
+
+        if self.realtime and block_time is not None:
+            if self._start is None:
+                self._start = (time.monotonic(), block_time)
+            delay = self._start[0] + (block_time - self._start[1]) - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        if filled < len(values) and not self.finished:
+            self.finished = True
+            if self.on_end is not None:
+                self.on_end()
+        return EncodeReplies(values).tolist()
+
+    xfer3 = xfer2
+    xfer = xfer2
+
+    def Summary(self):
+        return 'Replayed {} of {} conversions in {} transfers, {} channel mismatches'.format(
+            self.conversions, self.capture.num_conversions, self.transfers, self.channel_mismatches)
+
+
+#Replaces spidev with one that replays path, returns (capture, list the replay devices get added to)
+def InstallReplay(path, realtime = True, on_end = None):
+    capture = CaptureFile(path)
+    ADC_Acquisition.DEMAND_PACED = not realtime
+    Frame_Scheduler.PACED = realtime
+    devices = []
+    def SpiDev(*args):
+        spi = ReplaySpiDev(capture, realtime, on_end)
+        devices.append(spi)
+        return spi
+    spidev = types.ModuleType('spidev')
+    spidev.SpiDev = SpiDev
+    sys.modules['spidev'] = spidev
+    return capture, devices
+
+
+if __name__ == '__main__':
+    if(len(sys.argv) < 3):
+        sys.exit('usage: python ADC_Capture.py capture.avecap Script.py [script args...]')
+    writer = InstallRecorder(sys.argv[1])
+    script = sys.argv[2]
+    sys.argv = sys.argv[2:]
+    try:
+        runpy.run_path(script, run_name='__main__')
+    except (SystemExit, KeyboardInterrupt):
+        pass
+    writer.Close()
+    print(writer.Summary())
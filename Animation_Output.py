@@ -0,0 +1,41 @@
+import sys
+import neopixel
+import board
+from Pixel_Output import FrameOutput
+from Frame_Store import FrameStore, DEFAULT_STORE_DIR
+from Panel_Layout import LoadLayout
+from Animation_Playback import AnimationPlayer
+
+#Plays an animated GIF, or a directory of images as a frame sequence, on the panel (see Animation_Playback.py)
+#usage: python Animation_Output.py animation.gif|frame_directory [loops]
+#loops defaults to 0, which repeats until ctrl-c
+
+FRAME_STORE_DIR = DEFAULT_STORE_DIR
+PANEL_LAYOUT = None #panel layout file (see Panel_Layout.py), None uses $AVE_PANEL_LAYOUT or else the single 10x10 panel
+
+if(len(sys.argv) < 2):
+    sys.exit('usage: python Animation_Output.py animation.gif|frame_directory [loops]')
+loops = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+
+
+#Configure NeoPixel Strip
+pixel_pin = board.D18
+layout = LoadLayout(PANEL_LAYOUT)
+num_pixels = layout.num_pixels
+ORDER = neopixel.GRB
+
+pixels = neopixel.NeoPixel(pixel_pin, num_pixels, brightness=1.0, auto_write = False, pixel_order=ORDER)
+frame_output = FrameOutput(pixels, num_pixels, ORDER, layout = layout)
+
+player = AnimationPlayer(sys.argv[1], frame_output, FrameStore(FRAME_STORE_DIR))
+
+try:
+    player.Play(loops)
+
+except KeyboardInterrupt:
+    pass
+
+print('{} passes, '.format(player.passes) + player.scheduler.Summary())
+print('Frames shown: {}, skipped (unchanged): {}'.format(frame_output.frames_shown, frame_output.frames_skipped))
+pixels.deinit()
+sys.exit()
@@ -0,0 +1,149 @@
+#Animated GIF and frame sequence playback for the panel
+
+#Still_Image_Output.py shows still images only. Animations are played here at their own frame timing:
+#    DecodeFrames    decodes and downscales one frame at a time with PIL, from an animated GIF (or APNG/WebP)
+#                    or a directory of images played in name order
+#    FramePrefetcher runs a decoder in a background thread, at most depth frames ahead of playback
+#    AnimationPlayer shows every frame for its own duration on monotonic deadlines (FrameScheduler)
+#During the first pass the wire bytes of every frame are streamed into the frame store (Frame_Store.py) as they
+#are shown. Every later loop, and later runs with the same file and settings, play straight from the memory
+#mapped store without PIL. Decoded frames are never held beyond the prefetch queue, so memory stays bounded
+#however long the animation is.
+import os
+import queue
+import threading
+import numpy as np
+
+from Pixel_Map import PANEL_WIDTH, PANEL_HEIGHT, DEFAULT_ORIGIN
+from Frame_Store import FrameStore, StoreWriter, FrameKey, FrameSize, SourceHash
+from Frame_Scheduler import FrameScheduler
+
+DEFAULT_DURATION = 0.1 #seconds, for frames that don't carry their own (frame sequences, some GIFs)
+PREFETCH_DEPTH = 8 #decoded frames kept ahead of playback
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')
+
+_DONE = object() #end of the decoded frames
+
+
+#Image files of a frame sequence directory, in playback order
+def SequencePaths(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.lower().endswith(IMAGE_EXTENSIONS))
+
+#Yields (frame, duration) for every frame of path, frame is (height, width, 3) uint8 and duration in seconds
+def DecodeFrames(path, width = PANEL_WIDTH, height = PANEL_HEIGHT, default_duration = DEFAULT_DURATION):
+    from PIL import Image, ImageSequence
+    if os.path.isdir(path):
+        for frame_path in SequencePaths(path):
+            with Image.open(frame_path) as im:
+                im.draft('RGB', (width, height)) #JPEGs get decoded at a fraction of their full size
+                yield np.asarray(im.convert("RGB").resize((width, height)), dtype=np.uint8), default_duration
+        return
+
+    with Image.open(path) as im:
+        for frame in ImageSequence.Iterator(im):
+            duration = frame.info.get('duration', 0) / 1000.0 #GIF durations are in ms, 0 means unset
+            yield np.asarray(frame.convert("RGB").resize((width, height)), dtype=np.uint8), duration if duration > 0 else default_duration
+
+
+#Iterates over frames (any iterable) while a background thread keeps up to depth items decoded ahead.
+#An exception in the decoder is raised again in the thread iterating
+class FramePrefetcher:
+    def __init__(self, frames, depth = PREFETCH_DEPTH):
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._Run, args=(frames,), daemon=True)
+        self._thread.start()
+
+    #Blocks while the queue is full, gives up once Stop() was called
+    def _Put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _Run(self, frames):
+        try:
+            for item in frames:
+                if not self._Put(item):
+                    return
+            self._Put(_DONE)
+        except Exception as e:
+            self._Put(e)
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def Stop(self, timeout = 1.0):
+        self._stop.set()
+        self._thread.join(timeout)
+
+
+class AnimationPlayer:
+    #width and height default to the size of frame_output's layout, or the single panel
+    def __init__(self, path, frame_output, store = None, origin = DEFAULT_ORIGIN, width = None, height = None,
+                 default_duration = DEFAULT_DURATION, prefetch = PREFETCH_DEPTH):
+        if width is None or height is None:
+            width, height = FrameSize(frame_output)
+        self.path = path
+        self.frame_output = frame_output
+        self.store = FrameStore() if store is None else store
+        self.origin = tuple(origin)
+        self.width = width
+        self.height = height
+        self.default_duration = default_duration
+        self.prefetch = prefetch
+        self.key = FrameKey(SourceHash(path), width, height, self.origin, frame_output) + '-anim'
+        self.scheduler = FrameScheduler()
+        self.passes = 0 #complete passes through the animation
+
+    #Decodes, shows and stores every frame, the store entry is only kept if the pass runs to the end
+    def _FirstPass(self):
+        frames = FramePrefetcher(DecodeFrames(self.path, self.width, self.height, self.default_duration), self.prefetch)
+        writer = StoreWriter(self.store, self.key, os.path.abspath(self.path))
+        durations = []
+        try:
+            for frame, duration in frames:
+                writer.Write(self.frame_output.WriteFrame(frame, self.origin))
+                durations.append(duration)
+                self.scheduler.Wait(duration)
+                self.frame_output.Show()
+        except BaseException:
+            writer.Abort()
+            raise
+        finally:
+            frames.Stop()
+        if not durations:
+            writer.Abort()
+            raise ValueError('no frames in ' + self.path)
+        writer.Commit(durations=durations)
+
+    #(frames, durations) from the store, frames is a read only (num_frames, frame bytes) memory map, or None
+    def StoredFrames(self):
+        data = self.store.Get(self.key)
+        if data is None:
+            return None
+        durations = self.store.frames[self.key]['durations']
+        return data.reshape(len(durations), -1), durations
+
+    #Plays loops passes (0 is forever), the first one decodes unless the animation is already in the store
+    def Play(self, loops = 0):
+        stored = self.StoredFrames()
+        if stored is None:
+            self._FirstPass()
+            self.passes += 1
+            stored = self.StoredFrames()
+        frames, durations = stored
+        while loops == 0 or self.passes < loops:
+            for wire_bytes, duration in zip(frames, durations):
+                self.scheduler.Wait(duration)
+                self.frame_output.ShowWire(wire_bytes)
+            self.passes += 1
@@ -0,0 +1,85 @@
+#Streaming auto-gain for the visualizers
+
+#The spectrum used to be scaled with fixed constants (column 0 minus 10000, then / 500 for every column) and
+#the level meter assumed the ADC sits at 512, so quiet sources left the panel dark and loud ones pinned it.
+#Everything here keeps a handful of exponential running statistics per band and updates them in O(1) per
+#frame, no history is stored or rescanned:
+#    DCTracker      slow running mean of the raw samples, replaces the 512 midpoint
+#    BandNormalizer noise floor and peak of every band, maps each band onto the panel rows between the two
+
+#Every statistic moves towards the new value by 1 - exp(-dt / time_constant), dt being the real time since
+#the previous update, so the behaviour doesn't change with the frame rate or FFT window size.
+#The noise floor follows drops quickly and rises slowly (so it settles on the quiet parts of the signal),
+#the peak rises with the attack time and falls back with the release time.
+import math
+import time
+import numpy as np
+
+
+#Fraction of the way a running statistic moves in dt seconds, time_constant <= 0 means jump straight there
+def SmoothingFactor(dt, time_constant):
+    if time_constant <= 0:
+        return 1.0
+    return 1.0 - math.exp(-dt / time_constant)
+
+
+class DCTracker:
+    def __init__(self, channels = 1, time_constant = 2.0, initial = None):
+        self.time_constant = time_constant
+        self.offset = None if initial is None else np.full(channels, initial, dtype=np.float64)
+        self._last = None
+
+    #samples has shape (n, channels) or (channels,), returns them minus the tracked offset
+    def Update(self, samples, now = None):
+        samples = np.asarray(samples, dtype=np.float64)
+        now = time.monotonic() if now is None else now
+        mean = samples.reshape(-1, samples.shape[-1]).mean(axis=0)
+        if self.offset is None:
+            self.offset = mean
+        elif self._last is not None:
+            self.offset += SmoothingFactor(now - self._last, self.time_constant) * (mean - self.offset)
+        self._last = now
+        return samples - self.offset
+
+
+class BandNormalizer:
+    #attack/release are the peak time constants and floor_fall/floor_rise the noise floor ones, all in seconds
+    #min_range keeps the gain from blowing up near silence: the floor to peak span is at least min_range
+    #(in input units) and at least min_ratio times the floor
+    #link mixes every band's peak with the loudest band's, 0 normalizes each band on its own and 1 uses one gain for all
+    def __init__(self, num_bands, rows = 10, attack = 0.01, release = 1.5, floor_fall = 0.25, floor_rise = 10.0, min_range = 0.0, min_ratio = 1.0, link = 0.5):
+        self.num_bands = num_bands
+        self.rows = rows
+        self.attack = attack
+        self.release = release
+        self.floor_fall = floor_fall
+        self.floor_rise = floor_rise
+        self.min_range = min_range
+        self.min_ratio = min_ratio
+        self.link = link
+        self.floor = None
+        self.peak = None
+        self._last = None
+
+    #Returns the bands in row units, row y is lit when y <= value (same as the old band_mags / 500), so the
+    #noise floor comes out at -1 (nothing lit) and the peak at rows - 1 (whole column lit)
+    def Update(self, mags, now = None):
+        mags = np.asarray(mags, dtype=np.float64)
+        now = time.monotonic() if now is None else now
+        if self.floor is None: #start every floor at the quietest band, so a tone already playing still shows
+            self.floor = np.full_like(mags, mags.min())
+            self.peak = mags.copy()
+        else:
+            dt = now - self._last
+            change = mags - self.floor
+            self.floor += np.where(change > 0, SmoothingFactor(dt, self.floor_rise), SmoothingFactor(dt, self.floor_fall)) * change
+            change = mags - self.peak
+            self.peak += np.where(change > 0, SmoothingFactor(dt, self.attack), SmoothingFactor(dt, self.release)) * change
+        self._last = now
+
+        peak = self.peak
+        if self.link > 0:
+            peak = (1 - self.link) * peak + self.link * peak.max()
+        span = np.maximum(peak - self.floor, self.min_ratio * np.abs(self.floor))
+        np.maximum(span, max(self.min_range, 1e-12), out=span)
+        return (mags - self.floor) / span * self.rows - 1
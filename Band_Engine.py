@@ -0,0 +1,127 @@
+#Vectorized spectrum banding
+
+#The visualizers used to average the FFT magnitudes of each column with a python list per column (and the
+#stereo version redid that for every row). Here the rfft magnitudes are computed once per frame and
+#multiplied by a precomputed (columns x bins) weight matrix, where each row averages the bins of one column.
+#The matrix is only rebuilt when the number of samples, the column count or (for log/mel) the sample rate changes.
+
+#Band scales:
+#    'linear' = bins split evenly between the columns, same as the original visualizers
+#    'log'    = logarithmically spaced band edges between f_min and the nyquist frequency
+#    'mel'    = band edges evenly spaced on the mel scale between f_min and the nyquist frequency
+#    'custom' = relative column widths, ie FRAC_COLUMN_WIDTHS_MONO, spread across the bins
+import numpy as np
+
+BAND_SCALES = ('linear', 'log', 'mel', 'custom')
+
+
+def HzToMel(f):
+    return 2595.0 * np.log10(1.0 + np.asarray(f) / 700.0)
+
+def MelToHz(m):
+    return 700.0 * (10.0 ** (np.asarray(m) / 2595.0) - 1.0)
+
+
+#log and mel edges are placed in Hz, so they can't be worked out without the sample rate
+def CheckSampleRate(scale, sample_rate):
+    if scale in ('log', 'mel') and not sample_rate > 0:
+        raise ValueError('{} band scale needs a sample rate above 0, got {}'.format(scale, sample_rate))
+
+
+class BandEngine:
+    #skip_dc leaves bin 0 out of every band, the mono visualizer historically kept it (and subtracted it back out by hand)
+    #rate_tolerance is how far (relative) the measured sample rate can drift before log/mel edges are rebuilt
+    #sample_rate is used whenever Weights/Apply/Bands are called without one, log and mel need it from one or the other
+    def __init__(self, num_columns = 10, scale = 'linear', widths = None, f_min = 40.0, skip_dc = True, rate_tolerance = 0.02, sample_rate = None):
+        if scale not in BAND_SCALES:
+            raise ValueError('Unknown band scale {!r}, expected one of {}'.format(scale, BAND_SCALES))
+        if scale == 'custom':
+            if widths is None or len(widths) != num_columns:
+                raise ValueError('custom band scale needs one width per column')
+        if sample_rate is not None:
+            CheckSampleRate(scale, sample_rate)
+        self.num_columns = num_columns
+        self.scale = scale
+        self.widths = None if widths is None else np.asarray(widths, dtype=np.float64)
+        self.f_min = f_min
+        self.skip_dc = skip_dc
+        self.rate_tolerance = rate_tolerance
+        self.sample_rate = sample_rate
+
+        self.weights = None
+        self.edges = None
+        self._num_samples = None
+        self._sample_rate = None
+
+    #Only log and mel edges depend on the sample rate
+    def _NeedsRebuild(self, num_samples, sample_rate):
+        if self.weights is None or num_samples != self._num_samples:
+            return True
+        if self.scale in ('log', 'mel'):
+            return abs(sample_rate - self._sample_rate) > self.rate_tolerance * self._sample_rate
+        return False
+
+    #Bin index edges, column x averages bins edges[x] up to (but not including) edges[x+1]
+    def _BinEdges(self, num_samples, sample_rate):
+        lo = 1 if self.skip_dc else 0
+        hi = num_samples // 2 #the nyquist bin is left out, like the original fft[:num_samples // 2]
+        num_bins = hi - lo
+        if num_bins < self.num_columns:
+            raise ValueError('{} samples is too few for {} columns'.format(num_samples, self.num_columns))
+
+        if self.scale == 'linear':
+            column_bw = num_bins // self.num_columns
+            return lo + column_bw * np.arange(self.num_columns + 1)
+
+        if self.scale == 'custom':
+            frac = np.concatenate(([0.0], np.cumsum(self.widths))) / np.sum(self.widths)
+            edges = lo + np.rint(frac * num_bins)
+        else:
+            CheckSampleRate(self.scale, sample_rate)
+            f_max = sample_rate / 2
+            f_min = min(max(self.f_min, sample_rate / num_samples), f_max / 2)
+            if self.scale == 'log':
+                edges_hz = np.geomspace(f_min, f_max, self.num_columns + 1)
+            else:
+                edges_hz = MelToHz(np.linspace(HzToMel(f_min), HzToMel(f_max), self.num_columns + 1))
+            edges = np.rint(edges_hz * num_samples / sample_rate)
+            edges[0] = max(edges[0], lo)
+
+        #every column gets at least one bin, narrow low bands would otherwise be empty
+        edges = edges.astype(np.intp)
+        for x in range(1, len(edges)):
+            edges[x] = max(edges[x], edges[x-1] + 1)
+        excess = edges[-1] - hi
+        if excess > 0: #pushed past the top, pull the upper edges back down
+            for x in range(len(edges) - 1, 0, -1):
+                edges[x] = min(edges[x], hi - (len(edges) - 1 - x))
+        return edges
+
+    def Weights(self, num_samples, sample_rate = None):
+        if sample_rate is None:
+            sample_rate = self.sample_rate or 0.0
+        if self._NeedsRebuild(num_samples, sample_rate):
+            edges = self._BinEdges(num_samples, sample_rate)
+            weights = np.zeros((self.num_columns, num_samples // 2 + 1), dtype=np.float64)
+            for x in range(self.num_columns):
+                weights[x, edges[x]:edges[x+1]] = 1.0 / (edges[x+1] - edges[x])
+            self.weights = weights
+            self.edges = edges
+            self._num_samples = num_samples
+            self._sample_rate = sample_rate
+        return self.weights
+
+    #magnitudes is |rfft| with shape (..., num_samples // 2 + 1), returns mean magnitude per column (..., num_columns)
+    def Apply(self, magnitudes, num_samples, sample_rate = None):
+        return magnitudes @ self.Weights(num_samples, sample_rate).T
+
+    #samples has shape (num_samples,) or (channels, num_samples), returns (num_columns,) or (channels, num_columns)
+    def Bands(self, samples, sample_rate = None):
+        num_samples = samples.shape[-1]
+        magnitudes = np.abs(np.fft.rfft(samples, axis=-1))
+        return self.Apply(magnitudes, num_samples, sample_rate)
+
+    #Center frequency of each column in Hz, handy for labelling and tuning
+    def CenterFrequencies(self, num_samples, sample_rate):
+        self.Weights(num_samples, sample_rate)
+        return (self.edges[:-1] + self.edges[1:] - 1) / 2 * sample_rate / num_samples
@@ -0,0 +1,224 @@
+#Streaming onset and beat detection for the visualizers
+
+#The visualizers used to react to loudness only. Here rhythm is picked up from the band magnitudes they
+#already compute every frame (no second pass over the audio), with O(bands) work per frame and no history
+#rescanned:
+#    OnsetDetector  spectral flux, the mean rise of the band magnitudes since the last frame. An onset is
+#                   a frame where the flux goes over an adaptive threshold, the running mean of the flux plus
+#                   sensitivity times its running mean deviation (exponential, like Auto_Gain.py)
+#    TempoTracker   every onset votes the intervals to the last few onsets into a tempo histogram, folded into
+#                   one octave (MIN_BPM to 2 * MIN_BPM) so half and double time land on the same tempo. The
+#                   histogram decays with time, its peak is the tempo. This is the only part that isn't O(1), and
+#                   it only runs on onsets
+#    BeatDetector   both, plus a beat clock running at the tempo. Onsets that fall close to a predicted beat pull
+#                   the clock into phase (or half a beat over, if the off beats are clearly stronger), and it
+#                   keeps ticking through a few quiet beats before it stops
+#Visualizers call BeatDetector.Update(band_mags) once per frame and then read .onset, .beat (True on the frame
+#of an onset/beat), .bpm (None until a tempo is found) and .Pulse() (1.0 on a beat fading to 0) for effects.
+import math
+import time
+import numpy as np
+
+from Auto_Gain import SmoothingFactor
+
+MIN_BPM = 80.0 #tempos are folded into MIN_BPM up to 2 * MIN_BPM
+TEMPO_BINS = 80 #histogram bins across that octave, spaced evenly in log tempo
+ONSET_HISTORY = 8 #earlier onsets every onset measures its intervals to
+
+
+class OnsetDetector:
+    #threshold_time is the time constant (seconds) of the flux statistics, min_interval the shortest gap between
+    #two onsets and min_flux a floor under the threshold (in band magnitude units, 50 is well above the ADC noise
+    #in the visualizers' 1500 sample windows) so near silence doesn't trigger
+    def __init__(self, num_bands, sensitivity = 1.5, threshold_time = 1.0, min_interval = 0.1, min_flux = 50.0):
+        self.sensitivity = sensitivity
+        self.threshold_time = threshold_time
+        self.min_interval = min_interval
+        self.min_flux = min_flux
+        self._mags = np.zeros(num_bands, dtype=np.float64)
+        self._previous = None
+        self._rise = np.empty(num_bands, dtype=np.float64)
+        self.flux = 0.0
+        self.mean = 0.0
+        self.deviation = 0.0
+        self.threshold = min_flux
+        self.last_onset = None
+        self.onsets = 0
+        self._last = None
+
+    #Returns True if this frame is an onset, band_mags is anything with num_bands values
+    def Update(self, band_mags, now = None):
+        now = time.monotonic() if now is None else now
+        np.abs(np.ravel(band_mags), out=self._mags)
+        if self._previous is None:
+            self._previous = self._mags.copy()
+            self._last = now
+            return False
+        np.subtract(self._mags, self._previous, out=self._rise)
+        np.maximum(self._rise, 0.0, out=self._rise)
+        self._previous, self._mags = self._mags, self._previous
+        self.flux = float(self._rise.mean())
+
+        self.threshold = max(self.mean + self.sensitivity * self.deviation, self.min_flux)
+        onset = self.flux > self.threshold and (self.last_onset is None or now - self.last_onset >= self.min_interval)
+        if onset:
+            self.last_onset = now
+            self.onsets += 1
+
+        #the statistics are updated after the test, so an onset doesn't raise its own threshold
+        alpha = SmoothingFactor(now - self._last, self.threshold_time)
+        self.mean += alpha * (self.flux - self.mean)
+        self.deviation += alpha * (abs(self.flux - self.mean) - self.deviation)
+        self._last = now
+        return onset
+
+
+class TempoTracker:
+    #memory is the time constant (seconds) the histogram decays with, width the spread of every vote in bins
+    def __init__(self, min_bpm = MIN_BPM, bins = TEMPO_BINS, history = ONSET_HISTORY, memory = 8.0, width = 1.0, min_votes = 2.0):
+        self.min_bpm = min_bpm
+        self.bins = bins
+        self.memory = memory
+        self.width = width
+        self.min_votes = min_votes
+        self.histogram = np.zeros(bins, dtype=np.float64)
+        self.onset_times = np.full(history, -np.inf, dtype=np.float64) #ring of the last onsets
+        self._pos = 0
+        self._bin = np.arange(bins, dtype=np.float64)
+        #closer onsets vote more, the one before counts fully, the eighth back an eighth
+        self._weights = 1.0 / np.arange(1, history + 1, dtype=np.float64)
+        self._last = None
+        self.bpm = None
+
+    #Tempo of bin position b (can be fractional)
+    def BinTempo(self, b):
+        return self.min_bpm * 2.0 ** (b / self.bins)
+
+    def Onset(self, now):
+        if self._last is not None:
+            self.histogram *= math.exp(-(now - self._last) / self.memory)
+        self._last = now
+
+        #intervals to the earlier onsets, most recent first
+        order = (self._pos - 1 - np.arange(len(self.onset_times))) % len(self.onset_times)
+        intervals = now - self.onset_times[order]
+        valid = np.isfinite(intervals) & (intervals > 0)
+        if valid.any():
+            bpm = 60.0 / intervals[valid]
+            position = (np.log2(bpm / self.min_bpm) % 1.0) * self.bins #folded into the octave
+            #circular distance, the octave wraps around
+            distance = (self._bin[np.newaxis, :] - position[:, np.newaxis] + self.bins / 2) % self.bins - self.bins / 2
+            self.histogram += self._weights[valid] @ np.exp(-0.5 * (distance / self.width) ** 2)
+        self.onset_times[self._pos] = now
+        self._pos = (self._pos + 1) % len(self.onset_times)
+
+        peak = int(np.argmax(self.histogram))
+        if self.histogram[peak] < self.min_votes:
+            self.bpm = None
+            return self.bpm
+        #parabolic interpolation between the neighbouring bins
+        left, center, right = self.histogram[(peak - 1) % self.bins], self.histogram[peak], self.histogram[(peak + 1) % self.bins]
+        curvature = left - 2 * center + right
+        offset = 0.5 * (left - right) / curvature if curvature < 0 else 0.0
+        self.bpm = float(self.BinTempo(peak + offset))
+        return self.bpm
+
+    #How much the histogram peak stands out, 0 (flat) to 1 (a single tempo)
+    def Confidence(self):
+        total = self.histogram.sum()
+        return float(self.histogram.max() / total) if total > 0 else 0.0
+
+
+class BeatDetector:
+    #phase_window is how close (as a fraction of the beat period) an onset has to be to a predicted beat to move
+    #the clock, phase_gain how much of the difference it corrects. Onsets half way between beats are compared
+    #with the ones on the beats (running mean of their flux), the clock jumps half a beat when the off beat ones
+    #are switch_ratio times stronger. The clock stops after hold_beats beats without an onset near them.
+    #pulse_decay is the time constant (seconds) of Pulse()
+    def __init__(self, num_bands, sensitivity = 1.5, phase_window = 0.2, phase_gain = 0.5, switch_ratio = 1.5, hold_beats = 4,
+                 pulse_decay = 0.15, onsets = None, tempo = None):
+        self.onsets = OnsetDetector(num_bands, sensitivity) if onsets is None else onsets
+        self.tempo = TempoTracker() if tempo is None else tempo
+        self.phase_window = phase_window
+        self.phase_gain = phase_gain
+        self.switch_ratio = switch_ratio
+        self.hold_beats = hold_beats
+        self.pulse_decay = pulse_decay
+        self.onset = False
+        self.beat = False
+        self.bpm = None
+        self.last_beat = None
+        self.next_beat = None
+        self.beats = 0
+        self.phase_switches = 0
+        self._unconfirmed = 0 #beats in a row without an onset close to them
+        self._on_strength = 0.0 #running mean flux of the onsets on the beats
+        self._off_strength = 0.0 #and of the ones half way between
+
+    #band_mags is the frame's band magnitudes (any shape, ie (2, columns) in stereo), returns True on a beat
+    def Update(self, band_mags, now = None):
+        now = time.monotonic() if now is None else now
+        self.onset = self.onsets.Update(band_mags, now)
+        self.beat = False
+        if self.onset:
+            self.bpm = self.tempo.Onset(now)
+
+        if self.bpm is None:
+            #no tempo yet, every onset is a beat
+            if self.onset:
+                self._Beat(now, None)
+            return self.beat
+
+        period = 60.0 / self.bpm
+        if self.onset:
+            flux = self.onsets.flux
+            phase = ((now - self.last_beat) / period) % 1.0 if self.last_beat is not None else 0.0
+            if self.next_beat is None or self._unconfirmed >= self.hold_beats:
+                #(re)start the clock on this onset
+                self._on_strength = flux
+                self._off_strength = 0.0
+                self._Beat(now, period)
+            elif phase > 1.0 - self.phase_window:
+                self._on_strength += 0.25 * (flux - self._on_strength)
+                self._Beat(now, period) #a little early, the beat is now
+            elif phase < self.phase_window:
+                #a little late, the beat already ticked, move the clock towards the onset
+                self._on_strength += 0.25 * (flux - self._on_strength)
+                shift = self.phase_gain * phase * period
+                self.last_beat += shift
+                self.next_beat += shift
+                self._unconfirmed = 0
+            elif abs(phase - 0.5) < self.phase_window:
+                self._off_strength += 0.25 * (flux - self._off_strength)
+                if self._off_strength > self.switch_ratio * self._on_strength:
+                    #the stronger pulse is off the beat, move the clock half a beat over to it
+                    self._on_strength, self._off_strength = self._off_strength, self._on_strength
+                    self.phase_switches += 1
+                    self._Beat(now, period)
+        elif self.next_beat is not None and now >= self.next_beat and self._unconfirmed < self.hold_beats:
+            self._Beat(now, period)
+            self._unconfirmed += 1
+        return self.beat
+
+    def _Beat(self, now, period):
+        self.beat = True
+        self.beats += 1
+        self.last_beat = now
+        self.next_beat = None if period is None else now + period
+        if self.onset:
+            self._unconfirmed = 0
+
+    #1.0 right on a beat, fading out exponentially, 0.0 before the first beat
+    def Pulse(self, now = None):
+        if self.last_beat is None:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        return math.exp(-max(now - self.last_beat, 0.0) / self.pulse_decay)
+
+    def Stats(self):
+        return {'bpm': self.bpm, 'confidence': self.tempo.Confidence(), 'onsets': self.onsets.onsets, 'beats': self.beats,
+                'flux': self.onsets.flux, 'threshold': self.onsets.threshold, 'phase_switches': self.phase_switches}
+
+    def Summary(self):
+        bpm = 'no tempo' if self.bpm is None else '{:.1f} bpm (confidence {:.2f})'.format(self.bpm, self.tempo.Confidence())
+        return 'Beats: {}, {} onsets, {} beats'.format(bpm, self.onsets.onsets, self.beats)
@@ -0,0 +1,48 @@
+#Color morphing engine for Image_Color_Morph.py
+
+#The script shifts every color of a still image by a color picked from the wheel with the rolling average
+#of the audio level. It used to sum a 100 entry queue and shift the 100 pixels one by one in python every
+#frame, here:
+#    RollingAverage keeps a running sum over a fixed size numpy ring, so each new value costs O(1)
+#    ColorMorph shifts the whole image with one uint8 add (which wraps around like the old % 256), and keeps
+#    every shifted frame in a cache keyed by the quantized shift color, so a repeated color is just a lookup
+import numpy as np
+
+
+class RollingAverage:
+    def __init__(self, size, initial = 0):
+        self.values = np.full(size, initial, dtype=np.int64)
+        self.total = int(initial) * size
+        self.size = size
+        self._pos = 0
+
+    #Replaces the oldest value with value, returns the new average (rounded down like the old int(sum / n))
+    def Add(self, value):
+        value = int(value)
+        self.total += value - int(self.values[self._pos])
+        self.values[self._pos] = value
+        self._pos = (self._pos + 1) % self.size
+        return self.total // self.size
+
+    def Average(self):
+        return self.total // self.size
+
+
+class ColorMorph:
+    #image is (rows, columns, 3) uint8, wheel_table the (256, 3 or 4) table from Palette.WheelTable
+    #quantum is how many wheel levels make one step of shift, 25 gives the old int(color / 25)
+    def __init__(self, image, wheel_table, quantum = 25):
+        self.image = np.ascontiguousarray(image, dtype=np.uint8)
+        self.shifts = (wheel_table[:, :3] // quantum).astype(np.uint8) #quantized shift color of every wheel position
+        self._cache = {}
+
+    #Image shifted by the wheel color at pos (0 - 255), frames are shared between calls so don't modify them
+    def Frame(self, pos):
+        shift = self.shifts[pos]
+        key = shift.tobytes()
+        frame = self._cache.get(key)
+        if frame is None:
+            frame = self.image + shift #uint8 add, wraps around at 256
+            frame.setflags(write=False)
+            self._cache[key] = frame
+        return frame
@@ -0,0 +1,119 @@
+#Stand-in for spidev.SpiDev with an mcp3004 on the other end, so the ADC code can be tested and
+#benchmarked on a normal linux box.
+
+#Conversions are clocked like the real bus: every 3 byte command takes 24 SPI clocks, so at
+#max_speed_hz = 1000000 the simulated signal advances 24us per conversion. Each channel is fed by a
+#source function that maps an array of times (in seconds) to 10 bit ADC values.
+#With realtime = True transfers also take that long in wall clock time, so code reading the fake gets
+#the same sample rate it would get from the real bus instead of spinning as fast as the CPU allows.
+import time
+import wave
+import numpy as np
+
+from MCP3004 import CommandChannels, EncodeReplies
+
+
+#Sine wave centered on the ADC midpoint, like a line level signal through the HAT's bias network
+def SineSource(frequency = 440.0, amplitude = 300.0, offset = 512.0):
+    def source(t):
+        return offset + amplitude * np.sin(2 * np.pi * frequency * t)
+    return source
+
+#Linear frequency sweep from f0 to f1 every period seconds, repeating
+def ChirpSource(f0 = 100.0, f1 = 8000.0, period = 4.0, amplitude = 300.0, offset = 512.0):
+    def source(t):
+        tp = np.mod(t, period)
+        return offset + amplitude * np.sin(2 * np.pi * (f0 * tp + (f1 - f0) * tp * tp / (2 * period)))
+    return source
+
+def SilenceSource(offset = 512.0):
+    def source(t):
+        return np.full(len(t), offset)
+    return source
+
+def NoiseSource(amplitude = 100.0, offset = 512.0, seed = 0):
+    rng = np.random.default_rng(seed)
+    def source(t):
+        return offset + amplitude * rng.standard_normal(len(t))
+    return source
+
+#(audio, rate) of a WAV file, audio is (n, channels) float64 with full scale at +-1.0
+def ReadWav(path):
+    with wave.open(path, 'rb') as wav:
+        rate = wav.getframerate()
+        num_channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        frames = wav.readframes(wav.getnframes())
+
+    if width == 1:
+        audio = (np.frombuffer(frames, dtype=np.uint8).astype(np.float64) - 128) / 128
+    elif width == 2:
+        audio = np.frombuffer(frames, dtype='<i2').astype(np.float64) / 32768
+    elif width == 4:
+        audio = np.frombuffer(frames, dtype='<i4').astype(np.float64) / 2147483648
+    else:
+        raise ValueError('Unsupported WAV sample width: {} bytes'.format(width))
+    return audio.reshape(-1, num_channels), rate
+
+#Plays a WAV file (looped), channel is the file channel to use or 'mix' for the average of all of them.
+#Full scale audio is mapped to +-amplitude around the ADC midpoint.
+def WavSource(path, channel = 'mix', amplitude = 500.0, offset = 512.0):
+    audio, rate = ReadWav(path)
+    audio = audio.mean(axis=1) if channel == 'mix' else audio[:, channel]
+    audio = offset + amplitude * audio
+
+    def source(t):
+        return audio[(t * rate).astype(np.int64) % len(audio)]
+    return source
+
+
+class FakeSpiDev:
+    def __init__(self, sources = None, latency = 0.0, realtime = False):
+        #sources maps adc channel -> source function, unlisted channels read as silence
+        self.sources = dict(sources) if sources is not None else {}
+        self.latency = latency #extra seconds spent per transfer, to mimic the ioctl
+        self.realtime = realtime
+        self._start_time = None
+        self.max_speed_hz = 1000000
+        self.mode = 0
+        self.bits_per_word = 8
+        self.conversions = 0 #total conversions done, this is the simulated sample clock
+        self.transfers = 0
+        self._silence = SilenceSource()
+
+    def open(self, bus, device):
+        self.bus = bus
+        self.device = device
+
+    def close(self):
+        pass
+
+    def xfer2(self, data):
+        self.transfers += 1
+        if self.latency:
+            end = time.perf_counter() + self.latency
+            while time.perf_counter() < end:
+                pass
+
+        channels = CommandChannels(data)
+        n = len(channels)
+        t = (self.conversions + np.arange(n)) * 24.0 / self.max_speed_hz
+        self.conversions += n
+        if self.realtime:
+            if self._start_time is None:
+                self._start_time = time.monotonic()
+            done = self._start_time + self.conversions * 24.0 / self.max_speed_hz
+            delay = done - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        values = np.zeros(n, dtype=np.int64)
+        for ch in np.unique(channels):
+            mask = channels == ch
+            source = self.sources.get(int(ch), self._silence)
+            values[mask] = np.clip(np.rint(source(t[mask])), 0, 1023)
+
+        return EncodeReplies(values).tolist()
+
+    xfer3 = xfer2
+    xfer = xfer2
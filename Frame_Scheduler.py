@@ -0,0 +1,81 @@
+#Deadline based frame pacing
+
+#time.sleep(1/30) at the end of a loop sleeps a fixed amount no matter how long the frame took, so the real
+#frame rate drifts below the target. FrameScheduler keeps a grid of deadlines on time.monotonic_ns and
+#sleeps only for what is left of the current frame period.
+
+#When a frame overruns its deadline, up to max_catch_up late frames are run back to back to get back on
+#the grid, anything further behind than that is dropped (its deadline is skipped). max_catch_up = 0 means
+#always drop and resync. Jitter is how late each frame actually started compared to its deadline.
+#Wait(period) overrides the frame period for one frame, for content with its own per-frame timing (ie GIFs).
+#With paced = False Wait() never sleeps and every frame starts as soon as the last one is done, for sources that run
+#faster than realtime (a capture replayed with Simulate.py --replay --fast, see ADC_Capture.py).
+import time
+import numpy as np
+
+#paced default of new schedulers, ADC_Capture.InstallReplay clears it for fast replays
+PACED = True
+
+
+class FrameScheduler:
+    def __init__(self, fps = 30, max_catch_up = 0, history = 256, paced = None):
+        self.period_ns = int(round(1e9 / fps))
+        self.max_catch_up = max_catch_up
+        self.paced = PACED if paced is None else paced
+
+        self.frames = 0
+        self.missed_deadlines = 0 #frames that started after their deadline
+        self.dropped_frames = 0 #deadlines skipped entirely
+        self._jitter_ns = np.zeros(history, dtype=np.int64) #last history jitters, for percentiles
+        self._jitter_max_ns = 0
+        self._deadline = None
+        self._start_ns = None
+
+    #Blocks until the next frame is due, call once at the top of every loop iteration
+    #period (seconds) is how long this frame lasts, the default is 1 / fps
+    def Wait(self, period = None):
+        period_ns = self.period_ns if period is None else max(int(round(period * 1e9)), 1)
+        now = time.monotonic_ns()
+        if self._deadline is None: #first frame starts right away
+            self._deadline = now
+            self._start_ns = now
+        if not self.paced: #no deadlines to miss, the frame is due now
+            self._deadline = now
+
+        remaining = self._deadline - now
+        if remaining > 0:
+            time.sleep(remaining / 1e9)
+            now = time.monotonic_ns()
+        elif remaining < 0:
+            self.missed_deadlines += 1
+
+        jitter = now - self._deadline
+        self._jitter_ns[self.frames % len(self._jitter_ns)] = jitter
+        self._jitter_max_ns = max(self._jitter_max_ns, jitter)
+        self.frames += 1
+
+        #next deadline, skipping whatever is too far behind to catch up on
+        self._deadline += period_ns
+        overdue = (now - self._deadline) // period_ns + 1 if now >= self._deadline else 0 #deadlines already in the past
+        if overdue > self.max_catch_up:
+            skipped = overdue - self.max_catch_up
+            self._deadline += skipped * period_ns
+            self.dropped_frames += skipped
+
+    def Stats(self):
+        recent = self._jitter_ns[:min(self.frames, len(self._jitter_ns))]
+        elapsed = (time.monotonic_ns() - self._start_ns) / 1e9 if self._start_ns is not None else 0.0
+        return {
+            'frames': self.frames,
+            'fps': self.frames / elapsed if elapsed > 0 else 0.0,
+            'missed_deadlines': self.missed_deadlines,
+            'dropped_frames': self.dropped_frames,
+            'jitter_mean_us': float(np.mean(recent)) / 1e3 if len(recent) else 0.0,
+            'jitter_p99_us': float(np.percentile(recent, 99)) / 1e3 if len(recent) else 0.0,
+            'jitter_max_us': self._jitter_max_ns / 1e3,
+        }
+
+    def Summary(self):
+        stats = self.Stats()
+        return ('{frames} frames at {fps:.1f} fps, {missed_deadlines} missed deadlines, {dropped_frames} dropped, '
+                'jitter mean {jitter_mean_us:.0f}us p99 {jitter_p99_us:.0f}us max {jitter_max_us:.0f}us').format(**stats)
@@ -0,0 +1,197 @@
+#Pre-rendered on-disk store of still image frames
+
+#Showing an image used to mean importing PIL, decoding, converting and resizing the file and remapping it
+#onto the panel every time. The store keeps every image that was shown before as the exact bytes FrameOutput
+#sends to the strip (resized, Zig-Zag mapped, color ordered, brightness and gamma corrected), so showing it
+#again is a lookup in a memory-mapped file and one copy, without PIL.
+
+#Layout of the store directory:
+#    frames.bin   raw uint8 frames back to back
+#    index.json   {"version": 1, "frames": {key: {"offset", "size", "source"}}}
+#A key is made of the SHA-1 of the source file, the panel geometry, origin (or panel layout), color order, brightness and gamma,
+#so an edited image or a different setup misses the store and gets rendered again. Entries that no longer
+#match their source are dropped by Prune().
+#StoreWriter streams a multi-frame entry (ie an animation, see Animation_Playback.py) into frames.bin one frame
+#at a time, the entry is only added to the index once all of it is written.
+
+#Building the store ahead of time (no LEDs needed), with the same settings as Still_Image_Output.py:
+#usage: python Frame_Store.py [--store DIR] [--layout FILE] [--order GRB] [--brightness B] [--gamma G] [--prune] image [image ...]
+import argparse
+import hashlib
+import json
+import os
+import sys
+import numpy as np
+
+from Pixel_Map import PANEL_WIDTH, PANEL_HEIGHT, DEFAULT_ORIGIN
+
+STORE_VERSION = 1
+DEFAULT_STORE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ave', 'frames')
+
+
+#SHA-1 of a file, or of the names and contents of every file in a directory (a frame sequence)
+def SourceHash(path):
+    sha = hashlib.sha1()
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            if os.path.isfile(os.path.join(path, name)):
+                sha.update(name.encode() + b'\0' + SourceHash(os.path.join(path, name)).encode())
+        return sha.hexdigest()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+#Everything that changes the bytes of a stored frame
+def FrameKey(source_hash, width, height, origin, frame_output):
+    order = ''.join(str(i) for i in frame_output.wire_order)
+    if frame_output.layout is not None:
+        mapping = 'l' + frame_output.layout.key
+    else:
+        mapping = 'o{}{}'.format(origin[0], origin[1])
+    return '{}-{}x{}-{}-c{}-b{:g}-g{:g}'.format(source_hash, width, height, mapping, order, frame_output.brightness, frame_output.gamma)
+
+#Frame size frame_output takes, the layout's or else the single panel's
+def FrameSize(frame_output):
+    if frame_output.layout is not None:
+        return frame_output.layout.width, frame_output.layout.height
+    return PANEL_WIDTH, PANEL_HEIGHT
+
+#(height, width, 3) uint8 frame of the image at path, the only place PIL is needed
+def RenderImage(path, width = PANEL_WIDTH, height = PANEL_HEIGHT):
+    from PIL import Image
+    im = Image.open(path)
+    im = im.convert("RGB")
+    im = im.resize((width, height))
+    return np.asarray(im, dtype=np.uint8)
+
+
+class FrameStore:
+    def __init__(self, directory = DEFAULT_STORE_DIR):
+        self.directory = directory
+        self.data_path = os.path.join(directory, 'frames.bin')
+        self.index_path = os.path.join(directory, 'index.json')
+        self.frames = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                index = json.load(f)
+            if index.get('version') == STORE_VERSION:
+                self.frames = index['frames']
+        self._data = None #memory map of frames.bin, reopened after the file grows
+
+    def _Map(self):
+        if self._data is None and os.path.exists(self.data_path) and os.path.getsize(self.data_path) > 0:
+            self._data = np.memmap(self.data_path, dtype=np.uint8, mode='r')
+        return self._data
+
+    def _Add(self, key, entry):
+        self.frames[key] = entry
+        self._SaveIndex()
+        self._data = None
+
+    def _SaveIndex(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': STORE_VERSION, 'frames': self.frames}, f, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+    #Read only view of the stored bytes for key, or None
+    def Get(self, key):
+        entry = self.frames.get(key)
+        data = self._Map()
+        if entry is None or data is None or entry['offset'] + entry['size'] > len(data):
+            return None
+        return data[entry['offset']:entry['offset'] + entry['size']]
+
+    def Put(self, key, wire_bytes, source = None):
+        writer = StoreWriter(self, key, source)
+        writer.Write(wire_bytes)
+        writer.Commit()
+
+    #Wire bytes of the image at path for frame_output, rendered and stored first if they are not in the store yet
+    def Load(self, path, frame_output, origin = DEFAULT_ORIGIN, width = None, height = None):
+        if width is None or height is None:
+            width, height = FrameSize(frame_output)
+        key = FrameKey(SourceHash(path), width, height, origin, frame_output)
+        wire_bytes = self.Get(key)
+        if wire_bytes is None:
+            wire_bytes = frame_output.WriteFrame(RenderImage(path, width, height), origin).reshape(-1).copy()
+            self.Put(key, wire_bytes, os.path.abspath(path))
+        return wire_bytes
+
+    #Drops entries whose source file is gone or has changed, or whose bytes are missing from frames.bin (deleted
+    #or truncated), and rewrites frames.bin without them
+    def Prune(self):
+        data = self._Map()
+        data_size = 0 if data is None else len(data)
+        keep = {}
+        for key, entry in self.frames.items():
+            if entry['offset'] + entry['size'] > data_size:
+                continue
+            source = entry.get('source')
+            if source is not None and os.path.exists(source) and key.startswith(SourceHash(source)):
+                keep[key] = entry
+        tmp_path = self.data_path + '.tmp'
+        offset = 0
+        with open(tmp_path, 'wb') as f:
+            for key, entry in keep.items():
+                f.write(data[entry['offset']:entry['offset'] + entry['size']].tobytes())
+                keep[key] = dict(entry, offset=offset)
+                offset += entry['size']
+        self._data = None
+        os.replace(tmp_path, self.data_path)
+        removed = len(self.frames) - len(keep)
+        self.frames = keep
+        self._SaveIndex()
+        return removed
+
+
+#Appends one entry to the store piece by piece, extra fields passed to Commit() are kept in its index entry.
+#Bytes of an aborted entry stay in frames.bin, unreferenced, until the next Prune()
+class StoreWriter:
+    def __init__(self, store, key, source = None):
+        self.store = store
+        self.key = key
+        self.source = source
+        os.makedirs(store.directory, exist_ok=True)
+        self._file = open(store.data_path, 'ab')
+        self.offset = self._file.tell()
+        self.size = 0
+
+    def Write(self, wire_bytes):
+        wire_bytes = np.ascontiguousarray(wire_bytes, dtype=np.uint8)
+        self._file.write(wire_bytes.tobytes())
+        self.size += wire_bytes.nbytes
+
+    def Commit(self, **info):
+        self._file.close()
+        self.store._Add(self.key, dict(info, offset=self.offset, size=self.size, source=self.source))
+
+    def Abort(self):
+        self._file.close()
+
+
+if __name__ == '__main__':
+    from Pixel_Output import FrameOutput, SimulatedStrip
+    from Panel_Layout import LoadLayout
+
+    parser = argparse.ArgumentParser(description='Render images into the frame store used by Still_Image_Output.py')
+    parser.add_argument('--store', default=DEFAULT_STORE_DIR)
+    parser.add_argument('--layout', help='panel layout file (see Panel_Layout.py), default is the single 10x10 panel')
+    parser.add_argument('--order', default='GRB', help='neopixel color order of the strip')
+    parser.add_argument('--brightness', type=float, default=1.0)
+    parser.add_argument('--gamma', type=float, default=1.0)
+    parser.add_argument('--prune', action='store_true', help='drop entries whose source image changed or is gone')
+    parser.add_argument('images', nargs='*')
+    args = parser.parse_args()
+
+    store = FrameStore(args.store)
+    layout = LoadLayout(args.layout)
+    frame_output = FrameOutput(SimulatedStrip(layout.num_pixels, pixel_order=args.order), layout.num_pixels, args.order,
+                               args.brightness, args.gamma, layout=layout)
+    for path in args.images:
+        store.Load(path, frame_output)
+        print('stored ' + path)
+    if args.prune:
+        print('pruned {} stale frames'.format(store.Prune()))
+    sys.exit()
@@ -0,0 +1,140 @@
+#Sparse band analysis for slow CPUs
+
+#The spectrum visualizers only show a handful of columns, but the FFT path (STFT.py then Band_Engine.py) computes
+#all fft_size // 2 + 1 bins of every window and then averages them into the columns. GoertzelBands evaluates just
+#a few DFT bins inside every column instead and keeps them up to date as samples arrive:
+#    sliding DFT  every bin is a running sum of the samples times a twiddle that only depends on the sample's
+#                 position in time (mod fft_size), so a new block of n samples is added, and the n samples it pushes
+#                 out of the window taken out, with one (bins x n) twiddle matrix product, the same as n steps of a
+#                 Goertzel filter for every bin at once. Nothing else is touched until the bands are read
+#    window       the periodic windows of STFT.py are sums of a few cosines, so windowing is done on the bins by
+#                 mixing every bin with its neighbours (hann: X[k] - (X[k-1] + X[k+1]) / 2). The phase the bins are
+#                 kept at differs from the window's by a turn per bin, which only changes the mix, so Bands() turns
+#                 the few mix coefficients instead of every bin and gets exactly the bins of the windowed FFT
+#    bands        every column is split into bins_per_band equal slices and the bin in the middle of each slice
+#                 stands for it, the column is the mean of those weighted by the width of their slice. The bins the
+#                 DC leaks into (up to the reach of the window) are always their own slice, the DC is far bigger
+#                 than anything else and would swamp a column if a single bin stood for it
+#The work grows with the number of bins evaluated instead of with fft_size, and it is spread over the blocks as
+#they come in rather than done all at once for every frame. The sums are recomputed from the window every
+#resync_hops hops so rounding errors don't build up.
+#It is an estimate: noise reads close to the FFT path on average but flickers more from frame to frame with fewer
+#bins, and a pure tone that falls between the sampled bins of a wide column reads lower. More bins_per_band narrows
+#both gaps at the cost of speed. Half_FFT_Bands.py is the closer alternative, Goertzel_Bands_Benchmark.py times both
+#against the FFT path and measures the difference.
+import numpy as np
+
+from STFT import MakeWindow
+
+BINS_PER_BAND = 4
+RESYNC_HOPS = 1000
+
+
+#(offsets, coefficients) that window a bin from its neighbours: windowed[k] = sum(c * X[k + offset]).
+#Taken from the DFT of the window, which for the cosine sum windows has only a few non zero terms
+def WindowTaps(window, size, tolerance = 1e-9):
+    spectrum = np.fft.fft(MakeWindow(window, size)) / size
+    offsets = np.arange(-(size // 2), size - size // 2)
+    coefficients = spectrum[offsets % size].real #even windows have a real spectrum
+    keep = np.abs(coefficients) > tolerance
+    #X_windowed[k] = sum over m of W[m] X[k - m], so a tap at window bin m reads bin k - m
+    return -offsets[keep], coefficients[keep]
+
+#(bins, weights) evaluated for each column: at most per_band bins, each in the middle of an equal slice of the
+#column and weighted by the share of the column it stands for. Bins below exact_below are always evaluated
+def SampledBins(edges, per_band = BINS_PER_BAND, exact_below = 0):
+    columns = []
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        exact = np.arange(lo, min(max(exact_below, lo), hi))
+        start = lo + len(exact)
+        count = min(per_band, hi - start)
+        bounds = np.unique(np.rint(np.linspace(start, hi, count + 1)).astype(np.intp)) if count > 0 else np.array([start])
+        bins = np.concatenate((exact, (bounds[:-1] + bounds[1:] - 1) // 2))
+        weights = np.concatenate((np.ones(len(exact)), np.diff(bounds))) / (hi - lo)
+        columns.append((bins.astype(np.intp), weights))
+    return columns
+
+
+class GoertzelBands:
+    #bands is the BandEngine picking the columns, Push() works like StreamingSTFT.Push() and Bands() replaces
+    #StreamingSTFT.Spectrum() followed by BandEngine.Apply()
+    def __init__(self, fft_size, hop_size, bands, window = 'hann', channels = 1, bins_per_band = BINS_PER_BAND, resync_hops = RESYNC_HOPS):
+        if not 0 < hop_size <= fft_size:
+            raise ValueError('hop_size must be between 1 and fft_size')
+        self.fft_size = fft_size
+        self.hop_size = hop_size
+        self.channels = channels
+        self.bands = bands
+        self.bins_per_band = bins_per_band
+        self.resync_hops = resync_hops
+        self.tap_offsets, self.tap_coefficients = WindowTaps(window, fft_size)
+
+        self._input = np.zeros((fft_size, channels), dtype=np.float64) #the last fft_size samples, oldest first
+        self._time = 0 #position of the oldest sample of the window, mod fft_size
+        self._pending = 0 #samples pushed since the last hop
+        self.hops = 0 #total hops completed
+        self._since_resync = 0
+        self._edges = None #band edges the bins were picked for, nothing is tracked before the first Bands()
+        self.num_bins = 0 #bins kept up to date
+
+    #Picks the bins for the band edges and starts their sums from the current window
+    def _Build(self, edges):
+        columns = SampledBins(edges, self.bins_per_band, self.tap_offsets.max() + 1)
+        picked = np.concatenate([bins for bins, weights in columns])
+        #every picked bin needs its neighbours under the window taps, bins past the ends wrap around like the DFT
+        needed = np.unique((picked[:, np.newaxis] + self.tap_offsets[np.newaxis, :]) % self.fft_size)
+        #for every picked bin and tap, where the bin the tap reads is among the needed ones
+        self._tap_index = np.searchsorted(needed, (picked[np.newaxis, :] + self.tap_offsets[:, np.newaxis]) % self.fft_size)
+        #tap_turns[t, tap] is the tap's coefficient turned by the phase the window starting at time t gives its offset
+        self._tap_turns = self.tap_coefficients * np.exp(2j * np.pi * np.outer(np.arange(self.fft_size), self.tap_offsets) / self.fft_size)
+        self._band_weights = np.zeros((len(picked), len(columns)), dtype=np.float64)
+        start = 0
+        for x, (bins, weights) in enumerate(columns):
+            self._band_weights[start:start + len(bins), x] = weights
+            start += len(bins)
+
+        #twiddle[t, 2j] and [t, 2j + 1] are the real and imaginary part of exp(-2j pi needed[j] t / fft_size) for the time
+        #t of a sample, interleaved so the (channels, 2 x needed) real sums can be read as complex ones. Twice around so
+        #any block of up to fft_size samples is one slice
+        phase = -2 * np.pi * np.outer(np.arange(2 * self.fft_size) % self.fft_size, needed) / self.fft_size
+        self._twiddle = np.stack((np.cos(phase), np.sin(phase)), axis=2).reshape(2 * self.fft_size, 2 * len(needed))
+        self._edges = edges
+        self.num_bins = len(needed)
+        self._Resync()
+
+    def _Resync(self):
+        self._sums = self._input.T @ self._twiddle[self._time:self._time + self.fft_size]
+        self._since_resync = 0
+
+    #Appends new samples, shape (n, channels), to the sliding window and returns how many hops they completed
+    def Push(self, samples):
+        n = len(samples)
+        if n >= self.fft_size:
+            self._input[:] = samples[-self.fft_size:]
+            self._time = (self._time + n) % self.fft_size
+            if self._edges is not None:
+                self._Resync()
+        elif n > 0:
+            if self._edges is not None:
+                #the new samples land on the twiddles of the ones they push out, fft_size samples earlier
+                self._sums += (samples - self._input[:n]).T @ self._twiddle[self._time:self._time + n]
+            self._input[:-n] = self._input[n:]
+            self._input[-n:] = samples
+            self._time = (self._time + n) % self.fft_size
+        self._pending += n
+        hops, self._pending = divmod(self._pending, self.hop_size)
+        self.hops += hops
+        self._since_resync += hops
+        if self._edges is not None and self._since_resync >= self.resync_hops:
+            self._Resync()
+        return hops
+
+    #Band magnitudes of the current window, (channels, columns) like BandEngine.Apply on the STFT spectrum
+    def Bands(self, sample_rate = None):
+        self.bands.Weights(self.fft_size, sample_rate)
+        if self.bands.edges is not self._edges: #first call, or log/mel edges moved with the sample rate
+            self._Build(self.bands.edges)
+        #the window starts at _time, which turns bin k by exp(2j pi k _time / fft_size). Within one windowed bin the
+        #taps only differ by their offset, and the magnitude doesn't see the common turn
+        windowed = self._tap_turns[self._time] @ self._sums.view(np.complex128)[:, self._tap_index]
+        return np.abs(windowed) @ self._band_weights
@@ -0,0 +1,118 @@
+#Times the band engines that skip most FFT bins, the sliding DFT of Goertzel_Bands.py and the half FFT of
+#Half_FFT_Bands.py, against the FFT path (StreamingSTFT + BandEngine) per spectrum frame, for the mono and stereo
+#visualizer settings. Both have to compute their bins exactly like the FFT, the half FFT has to keep its band
+#magnitudes within BAND_TOLERANCE of the FFT path's on every frame, and the sliding DFT (an estimate from a few bins
+#per column) its average band level on noise within LEVEL_TOLERANCE. The numbers depend a lot on the machine, run it
+#on the one the visualizer is for (the machine is printed in the header)
+#usage: python Goertzel_Bands_Benchmark.py [bins_per_band ...]
+import sys
+import time
+import platform
+import numpy as np
+
+from STFT import StreamingSTFT
+from Stereo_FFT import StereoSpectrum
+from Band_Engine import BandEngine
+from Goertzel_Bands import GoertzelBands, SampledBins, BINS_PER_BAND
+from Half_FFT_Bands import HalfFFTBands, ColumnWeights, EXACT_BINS
+
+NUM_SAMPLES = 1500 #same as Spectrum_Visualizer.py
+HOP_SIZE = 256
+SAMPLE_RATE = 20000.0
+COLUMNS = 10
+FRAMES = 2000
+BAND_TOLERANCE = 0.05 #largest median relative difference of the half FFT from the FFT path's band magnitudes
+LEVEL_TOLERANCE = 0.1 #largest relative difference of the sliding DFT's average band level on noise
+
+
+#ADC counts of a few tones over noise, (n, channels) uint16
+def TestSignal(n, channels, seed = 1):
+    rng = np.random.default_rng(seed)
+    t = np.arange(n) / SAMPLE_RATE
+    tones = sum(a * np.sin(2 * np.pi * f * t) for a, f in ((150, 220.0), (80, 1250.0), (40, 5300.0)))
+    return (512 + tones[:, np.newaxis] + 30 * rng.standard_normal((n, channels))).clip(0, 1023).astype(np.uint16)
+
+#ADC counts of noise around the mid point, (n, channels) uint16
+def NoiseSignal(n, channels, seed = 2):
+    rng = np.random.default_rng(seed)
+    return (512 + 100 * rng.standard_normal((n, channels))).clip(0, 1023).astype(np.uint16)
+
+#Median seconds per frame of pushing one hop and computing the bands, and the bands of every frame, for every
+#(push, bands) pair of paths. The paths take turns on every hop so a busy patch of the machine slows them alike
+def TimeFrames(paths, samples, frames = FRAMES):
+    hops = samples[:frames * HOP_SIZE].reshape(frames, HOP_SIZE, -1)
+    for hop in hops[:50]: #warm up
+        for push, bands in paths:
+            push(hop)
+            bands()
+    times = np.zeros((len(paths), frames), dtype=np.int64)
+    results = [[] for path in paths]
+    for i, hop in enumerate(hops):
+        for p, (push, bands) in enumerate(paths):
+            start = time.perf_counter_ns()
+            push(hop)
+            results[p].append(bands())
+            times[p, i] = time.perf_counter_ns() - start
+    return [(float(np.median(t)) / 1e9, np.array(r)) for t, r in zip(times, results)]
+
+#Mean band level of the sliding DFT over the FFT path's on noise, (channels, columns)
+def NoiseLevel(channels, scale, bins_per_band, frames = FRAMES // 4):
+    engine = BandEngine(COLUMNS // channels, scale)
+    stft = StreamingSTFT(NUM_SAMPLES, HOP_SIZE, 'hann', channels)
+    goertzel = GoertzelBands(NUM_SAMPLES, HOP_SIZE, BandEngine(COLUMNS // channels, scale), 'hann', channels, bins_per_band)
+    (unused, full), (unused, bands) = TimeFrames([
+        (stft.Push, lambda: engine.Apply(stft.Spectrum(), NUM_SAMPLES, SAMPLE_RATE)),
+        (goertzel.Push, lambda: goertzel.Bands(SAMPLE_RATE))], NoiseSignal((frames + 60) * HOP_SIZE, channels), frames)
+    return bands.mean(axis=0) / full.mean(axis=0)
+
+
+#(engine, bins, fft seconds, engine seconds, band diff) for the half FFT and the sliding DFT with every bins_per_band
+def Compare(channels, scale, bins_per_band):
+    columns = COLUMNS // channels
+    samples = TestSignal((FRAMES + 60) * HOP_SIZE, channels)
+
+    engine = BandEngine(columns, scale)
+    spectrum = StereoSpectrum(NUM_SAMPLES, 'auto') if channels == 2 else None
+    stft = StreamingSTFT(NUM_SAMPLES, HOP_SIZE, 'hann', channels, spectrum)
+    half_fft = HalfFFTBands(NUM_SAMPLES, HOP_SIZE, BandEngine(columns, scale), 'hann', channels)
+    goertzels = [GoertzelBands(NUM_SAMPLES, HOP_SIZE, BandEngine(columns, scale), 'hann', channels, n) for n in bins_per_band]
+    paths = [(stft.Push, lambda: engine.Apply(stft.Spectrum(), NUM_SAMPLES, SAMPLE_RATE)),
+             (half_fft.Push, lambda: half_fft.Bands(SAMPLE_RATE))]
+    paths += [(g.Push, lambda g=g: g.Bands(SAMPLE_RATE)) for g in goertzels]
+    (fft_time, full), *timed = TimeFrames(paths, samples)
+
+    #all of them have seen the same samples now, the bins they average have to match the FFT's exactly
+    magnitudes = stft.Spectrum()
+    expected = magnitudes @ ColumnWeights(half_fft.bands.edges, NUM_SAMPLES, half_fft.step, EXACT_BINS).T
+    assert np.allclose(half_fft.Bands(SAMPLE_RATE), expected, rtol=1e-9, atol=1e-6)
+    for g in goertzels:
+        columns = SampledBins(g.bands.edges, g.bins_per_band, g.tap_offsets.max() + 1)
+        expected = np.array([[(m[bins] * weights).sum() for bins, weights in columns] for m in magnitudes])
+        assert np.allclose(g.Bands(SAMPLE_RATE), expected, rtol=1e-9, atol=1e-6)
+
+    rows = []
+    for (engine_time, bands), (name, num_bins) in zip(timed, [('half_fft', half_fft.num_bins)] + [('goertzel {}'.format(g.bins_per_band), g.num_bins) for g in goertzels]):
+        rows.append((name, num_bins, fft_time, engine_time, float(np.median(np.abs(bands - full) / full))))
+
+    #the half FFT has to follow the FFT path on every frame
+    difference = rows[0][-1]
+    assert difference <= BAND_TOLERANCE, '{} {} half_fft band diff {:.1%} over {:.0%}'.format(channels, scale, difference, BAND_TOLERANCE)
+    #the sliding DFT flickers more the fewer bins it has, but has to read noise at the same level on average
+    for n in bins_per_band:
+        level = np.abs(NoiseLevel(channels, scale, n) - 1).max()
+        assert level <= LEVEL_TOLERANCE, '{} {} goertzel {} noise level off by {:.1%}, over {:.0%}'.format(channels, scale, n, level, LEVEL_TOLERANCE)
+    return rows
+
+
+if __name__ == '__main__':
+    bins_per_band = [int(n) for n in sys.argv[1:]] or [BINS_PER_BAND]
+
+    print('{} ({}), numpy {}'.format(platform.machine(), platform.processor() or platform.platform(), np.__version__))
+    print('{} samples per window, {} per hop, {} frames'.format(NUM_SAMPLES, HOP_SIZE, FRAMES))
+    print('{:>7} {:>7} {:>11} {:>6} {:>10} {:>12} {:>8} {:>11}'.format('input', 'scale', 'engine', 'bins', 'fft (us)', 'engine (us)', 'speedup', 'band diff'))
+    for channels in (1, 2):
+        for scale in ('linear', 'log'):
+            for name, num_bins, fft_time, engine_time, difference in Compare(channels, scale, bins_per_band):
+                print('{:>7} {:>7} {:>11} {:>6} {:>10.1f} {:>12.1f} {:>7.2f}x {:>10.1%}'.format(
+                    'stereo' if channels == 2 else 'mono', scale, name, num_bins, fft_time * 1e6, engine_time * 1e6,
+                    fft_time / engine_time, difference))
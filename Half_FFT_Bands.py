@@ -0,0 +1,119 @@
+#Band analysis for slow CPUs, on half of the FFT bins
+
+#The spectrum visualizers only show a handful of columns, but the FFT path (STFT.py then Band_Engine.py) computes
+#all fft_size // 2 + 1 bins of every window and then averages them into the columns. The wide columns don't need
+#every bin to get that average, a column only has to be covered densely enough that no tone falls through:
+#    even bins    the bins 0, 2, 4, ... of an fft_size window are the bins of a half size FFT of the window folded
+#                 in half (x[n] + x[n + fft_size / 2]), about half the work of the full FFT. Every odd bin of a
+#                 column counts as the mean of the even bins on either side of it. A tapered window spreads every
+#                 tone over at least 3 bins and the main lobe falls off about linearly between them, so the column
+#                 still sees the whole tone, wherever it is (ie the DC leaking into bin 1 of the lowest column)
+#    exact bins   columns narrower than exact_bins are averaged over all their bins like the FFT path does, the odd
+#                 ones as one row of a DFT matrix each (what a Goertzel filter computes). That costs about as much per
+#                 bin as the FFT saves, so it's off by default, for the few lowest columns of log and mel layouts
+#                 where a tone next to the column edge can make the estimate of a narrow column far off
+#Noise spreads evenly over the bins, so the columns come out within a few percent of the FFT path on average, and the
+#exact ones the same. Goertzel_Bands.py evaluates fewer bins still, Goertzel_Bands_Benchmark.py times both of them
+#against the FFT path and checks the difference.
+#The rect window leaves an on-bin tone in a single bin, so with it (or an odd fft_size) every bin is computed.
+import numpy as np
+
+from STFT import MakeWindow, FFT_HAS_OUT
+
+EXACT_BINS = 0 #columns narrower than this many bins are averaged over all of them
+
+
+#Weights averaging the fft_size // 2 + 1 bins into every column, (columns, bins) like BandEngine.Weights(), but only
+#on every step-th bin (and its neighbours) for columns of at least exact_bins bins
+def ColumnWeights(edges, fft_size, step = 2, exact_bins = EXACT_BINS):
+    num_bins = fft_size // 2 + 1
+    weights = np.zeros((len(edges) - 1, num_bins), dtype=np.float64)
+    for x, (lo, hi) in enumerate(zip(edges[:-1], edges[1:])):
+        if step == 1 or hi - lo < exact_bins:
+            weights[x, lo:hi] = 1.0
+        else:
+            for b in range(lo, hi):
+                if b % step == 0:
+                    weights[x, b] += 1.0
+                else:
+                    above = b + 1 if b + 1 < num_bins else b - 1 #the top bin is even with an even fft_size
+                    weights[x, b - 1] += 0.5
+                    weights[x, above] += 0.5
+        weights[x] /= hi - lo
+    return weights
+
+
+class HalfFFTBands:
+    #bands is the BandEngine picking the columns, Push() works like StreamingSTFT.Push() and Bands() replaces
+    #StreamingSTFT.Spectrum() followed by BandEngine.Apply()
+    def __init__(self, fft_size, hop_size, bands, window = 'hann', channels = 1, exact_bins = EXACT_BINS):
+        if not 0 < hop_size <= fft_size:
+            raise ValueError('hop_size must be between 1 and fft_size')
+        self.fft_size = fft_size
+        self.hop_size = hop_size
+        self.channels = channels
+        self.bands = bands
+        self.exact_bins = exact_bins
+        self.step = 1 if window == 'rect' or fft_size % 2 else 2 #every step-th bin comes from the folded FFT
+        self.window = MakeWindow(window, fft_size)[:, np.newaxis]
+
+        self._input = np.zeros((fft_size, channels), dtype=np.float64) #the last fft_size samples, oldest first
+        self._windowed = np.empty_like(self._input)
+        self._fold = np.empty((fft_size // self.step, channels), dtype=np.float64)
+        self._spectrum = np.empty((fft_size // self.step // 2 + 1, channels), dtype=np.complex128)
+        self._pending = 0 #samples pushed since the last hop
+        self.hops = 0 #total hops completed
+        self._edges = None #band edges the weights were built for
+        self.num_bins = 0 #bins evaluated for every window
+
+    #Splits the column weights into the bins of the folded FFT and the exact ones computed on their own
+    def _Build(self, edges):
+        weights = ColumnWeights(edges, self.fft_size, self.step, self.exact_bins)
+        odd_bins = [b for b in range(len(weights[0])) if b % self.step and weights[:, b].any()]
+
+        #X[k] is the sum of w[n] x[n] exp(-2j pi k n / fft_size), kept as stacked real cos and sin rows with the window
+        #folded in so the raw samples go through one real matrix product
+        phase = 2 * np.pi * np.outer(odd_bins, np.arange(self.fft_size)) / self.fft_size
+        self._odd_basis = np.concatenate((np.cos(phase), -np.sin(phase))) * self.window.T
+        #the exact magnitudes go after the folded FFT's, so one product with the weights averages both into the columns
+        self._weights = np.ascontiguousarray(np.concatenate((weights[:, ::self.step], weights[:, odd_bins]), axis=1).T)
+        self._magnitudes = np.empty((self.channels, len(self._weights)), dtype=np.float64)
+        self._edges = edges
+        self.num_bins = int(np.count_nonzero(weights.any(axis=0)))
+
+    #Appends new samples, shape (n, channels), to the sliding window and returns how many hops they completed
+    def Push(self, samples):
+        n = len(samples)
+        if n >= self.fft_size:
+            self._input[:] = samples[-self.fft_size:]
+        elif n > 0:
+            self._input[:-n] = self._input[n:]
+            self._input[-n:] = samples
+        self._pending += n
+        hops, self._pending = divmod(self._pending, self.hop_size)
+        self.hops += hops
+        return hops
+
+    #Band magnitudes of the current window, (channels, columns) like BandEngine.Apply on the STFT spectrum
+    def Bands(self, sample_rate = None):
+        self.bands.Weights(self.fft_size, sample_rate)
+        if self.bands.edges is not self._edges: #first call, or log/mel edges moved with the sample rate
+            self._Build(self.bands.edges)
+
+        windowed = np.multiply(self._input, self.window, out=self._windowed)
+        if self.step == 2:
+            half = self.fft_size // 2
+            np.add(windowed[:half], windowed[half:], out=self._fold)
+        else:
+            self._fold[:] = windowed
+        if FFT_HAS_OUT:
+            spectrum = np.fft.rfft(self._fold, axis=0, out=self._spectrum)
+        else:
+            spectrum = np.fft.rfft(self._fold, axis=0)
+        num_folded = len(spectrum)
+        np.abs(spectrum.T, out=self._magnitudes[:, :num_folded])
+        if len(self._odd_basis):
+            real_imag = self._odd_basis @ self._input
+            num_odd = len(real_imag) // 2
+            np.hypot(real_imag[:num_odd].T, real_imag[num_odd:].T, out=self._magnitudes[:, num_folded:])
+        return self._magnitudes @ self._weights
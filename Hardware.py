@@ -0,0 +1,140 @@
+#Hardware abstraction for the A.V.E. HAT
+
+#Every script talks to the hardware through four modules: spidev (the mcp3004 ADC, read with ReadChannel),
+#wiringpi (the MUX S0_pin/E_pin), board and neopixel (the pixel strip). On the Pi those are the real
+#libraries. InstallSimulatedHardware() registers stand-ins for all four in sys.modules instead, so the
+#visualizers run unchanged on a plain linux machine and their hot paths can be profiled and tested:
+#    spidev   -> Fake_SpiDev.FakeSpiDev fed from a WAV file or a synthetic signal generator
+#    wiringpi -> SimulatedGpio, which records every pin write and tracks the selected MUX mode
+#    board    -> pin names only
+#    neopixel -> an in-memory strip (Pixel_Output.SimulatedStrip) that records frames and their timestamps
+#Simulate.py is a command line wrapper that does this and then runs one of the scripts.
+
+#ADC Channel list:
+# channel | Input
+#=================
+#       0 | MIC
+#       1 | AUX L
+#       2 | AUX R
+#       3 | AUX MONO
+
+#MUX Channel List:
+# S0 | Input
+#=================
+#  0 | Stereo
+#  1 | Mono
+import sys
+import time
+import types
+
+from Fake_SpiDev import FakeSpiDev, ChirpSource, NoiseSource, WavSource
+from Pixel_Output import SimulatedStrip
+
+S0_PIN = 5
+E_PIN = 6 #Output Enable (active LOW)
+
+#same names the neopixel library uses
+RGB = 'RGB'
+GRB = 'GRB'
+RGBW = 'RGBW'
+GRBW = 'GRBW'
+
+
+#ADC sources for every channel, from a WAV file if given (L and R from its first two channels) or else
+#a synthetic test signal: frequency sweeps at different speeds on L and R, their mix on MONO and a noisier mix on the MIC
+def DefaultSources(wav_path = None):
+    if wav_path is not None:
+        left = WavSource(wav_path, 0)
+        try:
+            right = WavSource(wav_path, 1)
+        except IndexError: #mono file
+            right = left
+        mix = WavSource(wav_path, 'mix')
+        return {0: mix, 1: left, 2: right, 3: mix}
+
+    left = ChirpSource(100, 10000, 4.0, 250)
+    right = ChirpSource(100, 10000, 2.5, 250)
+    noise = NoiseSource(20)
+    mix = lambda t: (left(t) + right(t)) / 2
+    return {0: lambda t: mix(t) + noise(t) - 512, 1: left, 2: right, 3: mix}
+
+
+#wiringpi stand-in, pin states and a timestamped history of every write
+class SimulatedGpio:
+    def __init__(self):
+        self.modes = {}
+        self.levels = {}
+        self.history = [] #(time.monotonic(), pin, level)
+        self.mux_modes = ['off'] #every MUX mode selected so far, in order
+
+    def wiringPiSetupGpio(self):
+        return 0
+
+    def pinMode(self, pin, mode):
+        self.modes[pin] = mode
+
+    def digitalWrite(self, pin, level):
+        self.levels[pin] = level
+        self.history.append((time.monotonic(), pin, level))
+        if self.MuxMode() != self.mux_modes[-1]:
+            self.mux_modes.append(self.MuxMode())
+
+    def digitalRead(self, pin):
+        return self.levels.get(pin, 0)
+
+    #'stereo', 'mono' or 'off' from the S0 and E pins
+    def MuxMode(self):
+        if self.levels.get(E_PIN, 1) == 1:
+            return 'off'
+        return 'mono' if self.levels.get(S0_PIN, 0) == 1 else 'stereo'
+
+
+#Everything InstallSimulatedHardware created, so tests and benchmarks can look inside
+class SimulatedHardware:
+    def __init__(self, sources, realtime = True, transmit_time_per_pixel = 30e-6, max_frames = 10000):
+        self.sources = sources
+        self.realtime = realtime
+        self.transmit_time_per_pixel = transmit_time_per_pixel
+        self.max_frames = max_frames
+        self.gpio = SimulatedGpio()
+        self.spi_devices = []
+        self.strips = []
+
+    def SpiDev(self):
+        spi = FakeSpiDev(self.sources, realtime=self.realtime)
+        self.spi_devices.append(spi)
+        return spi
+
+    #Same signature as neopixel.NeoPixel
+    def NeoPixel(self, pin, n, bpp = 3, brightness = 1.0, auto_write = True, pixel_order = None):
+        if pixel_order is None:
+            pixel_order = GRB if bpp == 3 else GRBW
+        strip = SimulatedStrip(n, brightness, pixel_order, n * self.transmit_time_per_pixel, self.max_frames)
+        self.strips.append(strip)
+        return strip
+
+    def Modules(self):
+        spidev = types.ModuleType('spidev')
+        spidev.SpiDev = self.SpiDev
+
+        wiringpi = types.ModuleType('wiringpi')
+        for name in ('wiringPiSetupGpio', 'pinMode', 'digitalWrite', 'digitalRead'):
+            setattr(wiringpi, name, getattr(self.gpio, name))
+
+        board = types.ModuleType('board')
+        board.__getattr__ = lambda name: name #any pin name, ie board.D18
+
+        neopixel = types.ModuleType('neopixel')
+        neopixel.NeoPixel = self.NeoPixel
+        neopixel.RGB, neopixel.GRB, neopixel.RGBW, neopixel.GRBW = RGB, GRB, RGBW, GRBW
+
+        return {'spidev': spidev, 'wiringpi': wiringpi, 'board': board, 'neopixel': neopixel}
+
+
+#Registers the simulated spidev, wiringpi, board and neopixel modules, has to run before the script imports them
+def InstallSimulatedHardware(wav_path = None, sources = None, realtime = True, **kwargs):
+    if sources is None:
+        sources = DefaultSources(wav_path)
+    hardware = SimulatedHardware(sources, realtime, **kwargs)
+    sys.modules.update(hardware.Modules())
+    return hardware
@@ -4,83 +4,22 @@ import board
 import spidev
 import time
 import wiringpi
-import queue
 from PIL import Image
-
-
-#Neopixels rows are commonly soldered end to end  into a Zig-Zag pattern to minimize wiring,
-#but this can make addressing of individual pixels more complicated
-
-#This function is an output driver for our neopixel panel, it takes a 1 or 2 dimensional list  as input,
-#flips the necessary rows to generate proper output, and returns a 1 dimensional list that can be directly
-#copied to the neopixel object.
-#optional arg origin is used to specify (in cartesian coordinates) where the 0th pixel of input_arr should be assigned.
-#    (0,0) = bottom left corner
-#    (0,1) = top left corner
-#    (1,0) = bottom right corner
-#    (1,1) = top right corner
-
-#For the particular panel we are using, the first pixel is physically in the bottom right corner.
-def ZigZag(input_lst, is1D = True, origin = (0,1) ):
-    output_lst = [(0,0,0) for i in range(100)]
-    im = Image.new(mode='RGB', size=(10,10))
-
-    if (is1D):
-        input_lst_cp = input_lst
-    else: #2D array input
-        input_lst_cp = [input_lst[x][y] for x in range(10) for y in range(10)]
-
-    #Load into Image object to flip image into correct orientation
-    im.putdata(input_lst_cp)
-
-    if(origin[0] == 1):
-        im = im.transpose(Image.FLIP_LEFT_RIGHT)
-    if(origin[1] == 1):
-        im = im.transpose(Image.FLIP_TOP_BOTTOM)
-
-    im_data = list(im.getdata())
-
-    for y in range(10):
-        for x in range(10):
-            if( y % 2 == 0): #Even rows need to be flipped horizontally
-                output_lst[(10*y) + x] = im_data[(10*y) + (9-x)]
-            else: #Odd rows can be mapped as is
-                output_lst[(10*y) + x] = im_data[(10*y) + x]
-    return output_lst
-
-#Like ZigZag but for 1-Dimensional array of tuples
-def ZigZag1D(input_arr):
-    output_arr = [(0,0,0) for i in range(100)]
-
-    for y in range(10):
-        for x in range(10):
-            if( y % 2 == 0):# Even rows need to be flipped horizontally
-                output_arr[(10*y) + x] = input_arr[(10*y) + (9-x)]
-            else: #Odd rows can be mapped as is
-                output_arr[(10*y) + x] = input_arr[(10*y) + x]
-    return output_arr
-
-def wheel(pos):
-    # Input a value 0 to 255 to get a color value.
-    # The colours are a transition r - g - b - back to r.
-    if pos < 0 or pos > 255:
-        r = g = b = 0
-    elif pos < 85:
-        r = int(pos * 3)
-        g = int(255 - pos*3)
-        b = 0
-    elif pos < 170:
-        pos -= 85
-        r = int(255 - pos*3)
-        g = 0
-        b = int(pos*3)
-    else:
-        pos -= 170
-        r = 0
-        g = int(pos*3)
-        b = int(255 - pos*3)
-    return (r, g, b) if ORDER == neopixel.RGB or ORDER == neopixel.GRB else (r, g, b, 0)
-
+import numpy as np
+from Pixel_Output import FrameOutput
+from Palette import WheelTable
+from Frame_Scheduler import FrameScheduler
+from ADC_Acquisition import StartBulkAcquisition
+from MCP3004 import MCP3004Reader
+from Auto_Gain import DCTracker
+from Color_Morph import RollingAverage, ColorMorph
+from Panel_Layout import LoadLayout
+from STFT import StreamingSTFT
+from Band_Engine import BandEngine
+from Beat_Detector import BeatDetector
+
+
+#Frames are remapped onto the Zig-Zag wired panel and written to the strip by FrameOutput (Pixel_Output.py)
 
 #ADC Channel list:
 # channel | Input
@@ -90,22 +29,7 @@ def wheel(pos):
 #       1 | AUX R
 #       3 | AUX MONO
 
-#function to read SPI data from mcp3004
-def ReadChannel(channel):
-    adc = spi.xfer2([1,(8+channel)<<4, 0])
-    data = ((adc[1]&3) << 8) + adc[2]
-    return data
-
-def ShiftImage(shift_color):
-    for i in range(len(IM_DATA_ORIG)):
-        curr_pixel = IM_DATA_ORIG[i]
-        curr_pixel_r = (curr_pixel[0] + shift_color[0]) % 256
-        curr_pixel_g = (curr_pixel[1] + shift_color[1]) % 256
-        curr_pixel_b = (curr_pixel[2] + shift_color[2]) % 256
-        im_data_new[i] = (curr_pixel_r, curr_pixel_g, curr_pixel_b)
-    return im_data_new
-
-    #MUX Channel List:
+#MUX Channel List:
 # S0 | Input
 #=================
 #  0 | Stereo
@@ -127,8 +51,11 @@ input_err_msg = 'No input selected! Try running again, this time passing one of
 #stereo
 #mono
 #mic
+#followed by the path of the image to morph
+
+if(len(sys.argv) < 3):
+    sys.exit(input_err_msg)
 
-    
 elif(str(sys.argv[1]) == 'mono' or str(sys.argv[1]) == 'stereo'):
     wiringpi.digitalWrite(S0_pin, 1) #Select Mono MUX output
     wiringpi.digitalWrite(E_pin, 0) #Enable MUX output
@@ -142,67 +69,87 @@ else:
     sys.exit(input_err_msg)
 
 
+#Panel layout file (see Panel_Layout.py), None uses $AVE_PANEL_LAYOUT or else the single 10x10 panel
+PANEL_LAYOUT = None
+layout = LoadLayout(PANEL_LAYOUT)
+
 #Configure NeoPixel Strip
 pixel_pin = board.D18
-num_pixels = 100
+num_pixels = layout.num_pixels
 ORDER = neopixel.GRB
 
+FRAME_RATE = 60 #target frames per second
+
+#wheel(pos) for every pos from 0 to 255, precomputed once
+wheel_table = WheelTable(ORDER)
+
 pixels = neopixel.NeoPixel(pixel_pin, num_pixels, brightness=0.5, auto_write = False, pixel_order=ORDER)
+#brightness is applied through a lookup table in FrameOutput, which then writes whole frames to the strip
+frame_output = FrameOutput(pixels, num_pixels, ORDER, layout = layout)
 
 im = Image.open(sys.argv[2]) #open the image
 im = im.convert("RGB")
-im = im.resize((10,10))
-
-IM_DATA_ORIG = list(im.getdata())
+im = im.resize((layout.width, layout.height))
 
+#image[row][column] with row 0 at the top, shifted by one uint8 add per new color and cached (see Color_Morph.py)
+morph = ColorMorph(np.asarray(im, dtype=np.uint8), wheel_table)
 
-image = [[(0, 0, 0) for x in range(10)] for y in range(10)]
-
+#The color comes from the average level of the last NUM_SAMPLES frames, kept as a running sum. The original read
+#one sample per frame, now every frame's level is the mean of all samples that came in since the last one, each
+#wrapped with % 256 first like the single samples were
 NUM_SAMPLES = 100
-samples = queue.Queue(NUM_SAMPLES)
-
-
-
+levels = RollingAverage(NUM_SAMPLES)
+
+#On every beat the colors jump BEAT_WHEEL_STEP positions further around the wheel, 0 turns it off.
+#Beats come from a small STFT of the same samples, BEAT_FFT_SIZE per window and a new one every BEAT_HOP_SIZE,
+#averaged into BEAT_BANDS bands (see Beat_Detector.py)
+BEAT_WHEEL_STEP = 32
+BEAT_FFT_SIZE = 512
+BEAT_HOP_SIZE = 256
+BEAT_BANDS = 8
+beat_stft = StreamingSTFT(BEAT_FFT_SIZE, BEAT_HOP_SIZE)
+beat_bands = BandEngine(BEAT_BANDS)
+beats = BeatDetector(BEAT_BANDS)
+beat_shift = 0
+
+#The ADC is read in the background, every frame uses the mean level of all samples that came in since the last one.
+#The level is measured from the tracked DC offset instead of an assumed 512 midpoint
+spi = spidev.SpiDev()
+spi.open(0,0)
+spi.max_speed_hz=1000000
+acquisition = StartBulkAcquisition(MCP3004Reader(spi, (adc_ch,)), 8192)
+ring = acquisition.ring
+sample_buf = np.empty((ring.capacity, 1), dtype=np.uint16)
+dc = DCTracker(1, initial = 512)
+
+
+#Paces the loop on monotonic deadlines
+scheduler = FrameScheduler(FRAME_RATE)
 
 try:
-    while (samples.full() == False):
-        curr_sample = int(abs(ReadChannel(adc_ch) - 512) % 256)
-        samples.put(curr_sample)
     while True:
-        #read ADC data
-        curr_avg = 0
-        for sample in list(samples):
-            curr_avg = curr_avg + sample
-        curr_avg = int(curr_avg / NUM_SAMPLES)
-
-
-        #determine color to shift
-        curr_color = wheel(curr_avg)
-        shift_r = int(curr_color[0] / 25)
-        shift_g = int(curr_color[1] / 25)
-        shift_b = int(curr_color[2] / 25)
-        shift_color = (shift_r, shift_g, shift_b)
-        #shift image
-        im_data = ShiftImage(shift_color)
-        #output image
-        output_data = ZigZag(im_data)
-        for i in range(num_pixels):
-        pixels[i] = output_data[i]
-        pixels.show()
-
-        samples.get()
-        samples.put()
-        
-
-
-            
+        scheduler.Wait()
+        #read ADC data, a frame without a whole beat hop of new samples counts as an ADC underrun
+        new_samples = ring.ReadNew(sample_buf, BEAT_HOP_SIZE)
+        if(len(new_samples) > 0):
+            curr_sample = int((np.abs(dc.Update(new_samples)) % 256).mean())
+            curr_avg = levels.Add(curr_sample)
+            if(BEAT_WHEEL_STEP and beat_stft.Push(new_samples) > 0):
+                if(beats.Update(beat_bands.Apply(beat_stft.Spectrum()[0], BEAT_FFT_SIZE))):
+                    beat_shift = (beat_shift + BEAT_WHEEL_STEP) % 256
+        else:
+            curr_avg = levels.Average()
+
+        #shift image by the wheel color of the average level (moved along on the beats) and output it
+        frame_output.ShowFrame(morph.Frame((curr_avg + beat_shift) % 256))
+
 
 except KeyboardInterrupt:
+    acquisition.Stop()
+    print('ADC overruns: {}, underruns: {}'.format(ring.overruns, ring.underruns))
+    print(scheduler.Summary())
+    print(beats.Summary())
+    print('Frames shown: {}, skipped (unchanged): {}'.format(frame_output.frames_shown, frame_output.frames_skipped))
     pixels.deinit()
     wiringpi.digitalWrite(E_pin, 1) #disable MUX output
     sys.exit()
-
-
-
-
-pixels.show()
\ No newline at end of file
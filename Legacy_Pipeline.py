@@ -0,0 +1,228 @@
+#The original (baseline commit) visualizer code paths, kept as a reference for the benchmarks
+
+#These are the per-frame functions from the first version of Spectrum_Visualizer.py, Level_Visualizer.py and
+#Image_Color_Morph.py, with the module globals (spi, pixels, image, channels) turned into arguments and each
+#frame split into its stages so they can be timed one at a time. The code inside each stage is unchanged,
+#except StereoSpectrumVisualizer which did not compile: the missing colons and the stray "column" line are fixed.
+import time
+import numpy as np
+from PIL import Image
+
+
+#function to read SPI data from mcp3004
+def ReadChannel(spi, channel):
+    adc = spi.xfer2([1,(8+channel)<<4, 0])
+    data = ((adc[1]&3) << 8) + adc[2]
+    return data
+
+#function to set color of pixels based on row height
+def ColorPicker(row_num, state):
+    if (not state):
+        return (0, 0, 0)
+    elif (row_num <= 4):
+        return (0, 255, 0)
+    elif (row_num >= 5 and row_num <= 7):
+        return (255, 128, 0)
+    else: #row_num = 8 or 9
+        return(255, 0, 0)
+
+#This function takes a 2D array of tuples, which is easier to visualize, and flips rows needed to
+#produce desired output on Zig-Zagged neopixel panel, returning a 1D array to be outputted
+def ZigZag(input_arr):
+    output_arr = [(0,0,0) for i in range(100)]
+
+    for y in range(10):
+        for x in range(10):
+            if( y % 2 == 0):# Even rows need to be flipped horizontally
+                output_arr[(10*y) + x] = input_arr[9-x][y]
+            else: #Odd rows can be mapped as is
+                output_arr[(10*y) + x] = input_arr[x][y]
+    return output_arr
+
+#PIL based ZigZag from Image_Color_Morph.py and Still_Image_Output.py
+def ZigZagPIL(input_lst, is1D = True, origin = (0,1) ):
+    output_lst = [(0,0,0) for i in range(100)]
+    im = Image.new(mode='RGB', size=(10,10))
+
+    if (is1D):
+        input_lst_cp = input_lst
+    else: #2D array input
+        input_lst_cp = [input_lst[x][y] for x in range(10) for y in range(10)]
+
+    #Load into Image object to flip image into correct orientation
+    im.putdata(input_lst_cp)
+
+    if(origin[0] == 1):
+        im = im.transpose(Image.FLIP_LEFT_RIGHT)
+    if(origin[1] == 1):
+        im = im.transpose(Image.FLIP_TOP_BOTTOM)
+
+    im_data = list(im.getdata())
+
+    for y in range(10):
+        for x in range(10):
+            if( y % 2 == 0): #Even rows need to be flipped horizontally
+                output_lst[(10*y) + x] = im_data[(10*y) + (9-x)]
+            else: #Odd rows can be mapped as is
+                output_lst[(10*y) + x] = im_data[(10*y) + x]
+    return output_lst
+
+#Like ZigZag but for 1-Dimensional array of tuples
+def ZigZag1D(input_arr):
+    output_arr = [(0,0,0) for i in range(100)]
+
+    for y in range(10):
+        for x in range(10):
+            if( y % 2 == 0):# Even rows need to be flipped horizontally
+                output_arr[(10*y) + x] = input_arr[(10*y) + (9-x)]
+            else: #Odd rows can be mapped as is
+                output_arr[(10*y) + x] = input_arr[(10*y) + x]
+    return output_arr
+
+def NewImage():
+    return [[(0, 0, 0) for x in range(10)] for y in range(10)]
+
+
+#Stages of MonoSpectrumVisualizer
+
+def MonoAcquire(spi, adc_ch, num_samples):
+    #Sample time and ADC value from channel
+    sample_tuples = [(time.time(), ReadChannel(spi, adc_ch)) for i in range(num_samples)]
+
+    #Separate time and sample values
+    start_time = sample_tuples[0][0]
+    times = [t[0]-start_time for t in sample_tuples]
+    sample = [t[1] for t in sample_tuples]
+
+    sampling_frequency = num_samples/times[-1]
+    return sample, sampling_frequency
+
+def MonoFFT(sample, num_samples):
+    fft = np.fft.fft(sample)
+    fft = fft[:num_samples // 2] #We only care about the first half since FFT is symmetric
+    return fft
+
+def MonoBands(fft):
+    column_bw = len(fft) // 10
+    mags_normalized = []
+    for x in range(10):
+        #Average the magnitudes of the frequencies in each output band
+        band_mag = np.mean( [ abs(fft[x*column_bw+w]) for w in range(column_bw) ] )
+        if(x == 0):
+            band_mag -= 10000
+        mags_normalized.append(band_mag / 500)
+    return mags_normalized
+
+def MonoColors(mags_normalized, image):
+    for x in range(10):
+        mag_normalized = mags_normalized[x]
+        #turn on neopixels in each respective column
+        for y in range(10):
+            if (y <= mag_normalized):
+                image[x][y] = ColorPicker(y, 1)
+            else:
+                image[x][y] = ColorPicker(y, 0)
+    return image
+
+def WriteAndShow(pixels, output):
+    for i in range(100):
+        pixels[i] = output[i]
+
+    pixels.show()
+
+def MonoSpectrumVisualizer(spi, pixels, image, adc_ch = 3, num_samples = 1500):
+    sample, sampling_frequency = MonoAcquire(spi, adc_ch, num_samples)
+    fft = MonoFFT(sample, num_samples)
+    MonoColors(MonoBands(fft), image)
+    WriteAndShow(pixels, ZigZag(image))
+
+
+#Stages of StereoSpectrumVisualizer
+
+def StereoAcquire(spi, adc_ch_L, adc_ch_R, num_samples):
+    #Sample time and ADC value from channel
+    sample_tuples = [(time.time(), ReadChannel(spi, adc_ch_L), ReadChannel(spi, adc_ch_R)) for i in range(num_samples)]
+
+    #Separate time and sample values
+    start_time = sample_tuples[0][0]
+    times = [t[0]-start_time for t in sample_tuples]
+    sample_L = [t[1] for t in sample_tuples]
+    sample_R = [t[2] for t in sample_tuples]
+
+    sampling_frequency = num_samples/times[-1]
+    return sample_L, sample_R, sampling_frequency
+
+def StereoFFT(sample_L, sample_R, num_samples):
+    fft_L = np.fft.fft(sample_L)
+    fft_L = fft_L[1:num_samples // 2] #We only care about the first half since FFT is symmetric
+
+    fft_R = np.fft.fft(sample_R)
+    fft_R = fft_R[1:num_samples // 2]
+    return fft_L, fft_R
+
+#The original recomputed the band means for every row, banding and coloring can't be separated
+def StereoBandsAndColors(fft_L, fft_R, image):
+    column_bw = len(fft_L) // 5 #len(fft_L) == len(fft_R)
+
+    for y in range(10):
+        for x in range(5):
+            #Average the magnitudes of the frequencies in each output band
+            band_mag_L = np.mean( [ abs(fft_L[x*column_bw+w]) for w in range(column_bw) ] )
+            band_mag_R = np.mean( [ abs(fft_R[x*column_bw+w]) for w in range(column_bw) ] )
+            if(x == 0):
+                band_mag_L -= 10000
+                band_mag_R -= 10000
+
+            mag_normalized_L = band_mag_L / 500 # normalize to value between 0 and 10 to compare against row height
+            mag_normalized_R = band_mag_R / 500
+            #turn on neopixels in each respective column
+            if(mag_normalized_L < y):
+                image[4 - x][y] = ColorPicker(y, 1)
+            if(mag_normalized_R < y):
+                image[5 + x][y] = ColorPicker(y, 0)
+    return image
+
+def StereoSpectrumVisualizer(spi, pixels, image, adc_ch_L = 1, adc_ch_R = 2, num_samples = 1500):
+    sample_L, sample_R, sampling_frequency = StereoAcquire(spi, adc_ch_L, adc_ch_R, num_samples)
+    fft_L, fft_R = StereoFFT(sample_L, sample_R, num_samples)
+    StereoBandsAndColors(fft_L, fft_R, image)
+    WriteAndShow(pixels, ZigZag(image))
+
+
+#Level_Visualizer.py
+
+def StereoLevelVisualizer(spi, pixels, image, adc_ch_L = 1, adc_ch_R = 2):
+    #Calculate pk-pk magnitude of each channel
+    l_mag = 2*abs(512 - ReadChannel(spi, adc_ch_L))
+    r_mag = 2*abs(512 - ReadChannel(spi, adc_ch_R))
+
+    l_comp = int((l_mag/1024) * 10)
+    r_comp = int((r_mag/1024) * 10)
+
+    #produce image
+    for y in range(10):
+        for x in range(5): #left half
+            if(y <= l_comp):
+                image[x][y] = ColorPicker(y, 1)
+            else:
+                image[x][y] = ColorPicker(y, 0)
+        for x in range(5,10): #right half
+            if(y <= r_comp):
+                image[x][y] = ColorPicker(y, 1)
+            else:
+                image[x][y] = ColorPicker(y, 0)
+
+    WriteAndShow(pixels, ZigZag(image))
+
+def MonoLevelVisualizer(spi, pixels, image, adc_ch = 3):
+    ch_mag = 2*abs(512 - ReadChannel(spi, adc_ch))
+    ch_comp = int((ch_mag/1024) * 10)
+
+    for x in range(10):
+        for y in range(10):
+            if(y <= ch_comp):
+                image[x][y] = ColorPicker(y, 1)
+            else:
+                image[x][y] = ColorPicker(y, 0)
+
+    WriteAndShow(pixels, ZigZag(image))
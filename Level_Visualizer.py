@@ -1,11 +1,17 @@
 #CompE DP1 prototype by Clovis Tessier and Patrick Cullen
 
 import spidev
-import time
 import sys
 import neopixel
 import board
 import wiringpi
+import numpy as np
+from Pixel_Output import FrameOutput
+from Palette import BarPalette, BarHeights
+from Frame_Scheduler import FrameScheduler
+from Metrics import StartMetrics
+from Auto_Gain import DCTracker, BandNormalizer
+from Panel_Layout import LoadLayout
 
 
 #ADC Channel list:
@@ -22,88 +28,43 @@ def ReadChannel(channel):
     data = ((adc[1]&3) << 8) + adc[2]
     return data
 
-#function to set color of pixels based on row height
-def ColorPicker(row_num, state):
-    if (not state):
-        return (0, 0, 0)
-    elif (row_num <= 4):
-        return (0, 255, 0)
-    elif (row_num >= 5 and row_num <= 7):
-        return (255, 128, 0)
-    else: #row_num = 8 or 9
-        return(255, 0, 0)
-
-#Neopixels are physically soldered into a Zig-Zag pattern to minimize wiring,
-#but this messes up addressing on neopixel software object.
-    
-#This function takes a 2D array of tuples, which is easier to visualize, and flips rows needed to
-#produce desired output on Zig-Zagged neopixel panel, returning a 1D array to be outputted
-def ZigZag(input_arr):
-    output_arr = [(0,0,0) for i in range(100)]
-
-    for y in range(10):
-        for x in range(10):
-            if( y % 2 == 0):# Even rows need to be flipped horizontally
-                output_arr[(10*y) + x] = input_arr[9-x][y]
-            else: #Odd rows can be mapped as is
-                output_arr[(10*y) + x] = input_arr[x][y]
-    return output_arr
 
 
 
 #Visualizes left and right channel magnitudes on
 #respective halves of neopixel matrix
 def StereoLevelVisualizer():
-    #Calculate pk-pk magnitude of each channel
-    l_mag = 2*abs(512 - ReadChannel(adc_ch_L))
-    r_mag = 2*abs(512 - ReadChannel(adc_ch_R))
+    #Calculate magnitude of each channel around its tracked DC offset
+    l_mag, r_mag = np.abs(dc.Update([ReadChannel(adc_ch_L), ReadChannel(adc_ch_R)]))
+    metrics.Lap('read')
 
     #These comparison values are compared against
-    #the row of the pixel
-    l_comp = int((l_mag/1024) * 10)
-    r_comp = int((r_mag/1024) * 10)
-
-    #produce image
-    for y in range(10):
-        for x in range(5): #left half
-            if(y <= l_comp):
-                image[x][y] = ColorPicker(y, 1)
-            else:
-                image[x][y] = ColorPicker(y, 0)
-        for x in range(5,10): #right half
-            if(y <= r_comp):
-                image[x][y] = ColorPicker(y, 1)
-            else:
-                image[x][y] = ColorPicker(y, 0)
-
-    #flip image
-    output = ZigZag(image)
+    #the row of the pixel, scaled between each channel's noise floor and peak
+    l_comp, r_comp = gain.Update([l_mag, r_mag])
 
-    #map to neopixel strip and update
-    for i in range(100):
-        pixels[i] = output[i]
+    #produce image, left half from l_comp and right half from r_comp
+    heights = BarHeights(np.repeat([l_comp, r_comp], stereo_columns), layout.height)
+    bars.Frame(heights, out=image)
+    metrics.Lap('render')
 
-    pixels.show()
+    #flip image onto the Zig-Zag panel and update the strip in one bulk write
+    frame_output.ShowFrame(image)
+    metrics.Lap('show')
 
 
 #Visualizes MONO AUX or MIC channel magnitude on neopixel matrix
 def MonoLevelVisualizer():
-    ch_mag = 2*abs(512 - ReadChannel(adc_ch))
-    ch_comp = int((ch_mag/1024) * 10)
+    ch_mag = np.abs(dc.Update([ReadChannel(adc_ch)]))
+    metrics.Lap('read')
+    ch_comp = gain.Update(ch_mag)[0]
 
-    for x in range(10):
-        for y in range(10):
-            if(y <= ch_comp):
-                image[x][y] = ColorPicker(y, 1)
-            else:
-                image[x][y] = ColorPicker(y, 0)
+    heights = BarHeights(np.full(layout.width, ch_comp), layout.height)
+    bars.Frame(heights, out=image)
+    metrics.Lap('render')
 
-    output = ZigZag(image)
-
-    for i in range(100):
-        pixels[i] = output[i]
-        
-    pixels.show()
+    #flip image onto the Zig-Zag panel and update the strip in one bulk write
+    frame_output.ShowFrame(image)
+    metrics.Lap('show')
 
 
 
@@ -157,26 +118,67 @@ spi = spidev.SpiDev()
 spi.open(0,0)
 spi.max_speed_hz=1000000
 
+#Panel layout file (see Panel_Layout.py), None uses $AVE_PANEL_LAYOUT or else the single 10x10 panel
+PANEL_LAYOUT = None
+layout = LoadLayout(PANEL_LAYOUT)
+
 #Configure NeoPixel Strip
 pixel_pin = board.D18
-num_pixels = 100
+num_pixels = layout.num_pixels
 ORDER = neopixel.GRB
 
+FRAME_RATE = 30 #target frames per second
+AUTO_GAIN_MIN_RANGE = 20 #smallest floor to peak span of a level in ADC counts, keeps silence dark
+
+#Per stage timings and frame counters (see Metrics.py), logged as a JSON line every METRICS_LOG_INTERVAL seconds
+#and served on METRICS_ADDRESS (a localhost port or Unix socket path). AVE_METRICS=0 disables everything
+METRICS = True
+METRICS_LOG_INTERVAL = 30
+METRICS_ADDRESS = None
+
 pixels = neopixel.NeoPixel(pixel_pin, num_pixels, brightness=0.2, auto_write = False, pixel_order=ORDER)
+#brightness is applied through a lookup table in FrameOutput, which then writes whole frames to the strip
+frame_output = FrameOutput(pixels, num_pixels, ORDER, layout = layout)
+
+#image[row][column] with row 0 at the top of the panel, bar heights are counted up from the bottom row
+image = np.zeros((layout.height, layout.width, 3), dtype=np.uint8)
+
+#Colors of each row when lit (green, orange then red at the top), see Palette.py for gradients
+bars = BarPalette(layout.height)
+
+#columns of the left and right level in stereo
+stereo_columns = [layout.width // 2, layout.width - layout.width // 2]
+
+#The ADC midpoint is tracked instead of assumed to be 512, and the levels are scaled between their running
+#noise floor and peak (see Auto_Gain.py). AUTO_GAIN_MIN_RANGE caps the gain, in ADC counts
+num_channels = 2 if isStereo else 1
+dc = DCTracker(num_channels, initial = 512)
+gain = BandNormalizer(num_channels, layout.height, min_range = AUTO_GAIN_MIN_RANGE)
+
+#Paces the loop on monotonic deadlines, so slow frames don't drag the frame rate below FRAME_RATE
+scheduler = FrameScheduler(FRAME_RATE)
 
-image = [[(0, 0, 0) for x in range(10)] for y in range(10)]
+#counters the objects above already keep are only read when the metrics are published
+reporter = StartMetrics(METRICS, METRICS_LOG_INTERVAL, METRICS_ADDRESS)
+metrics = reporter.metrics
+metrics.AddSource('scheduler', scheduler.Stats)
+metrics.AddSource('output', lambda: {'frames_shown': frame_output.frames_shown, 'frames_skipped': frame_output.frames_skipped})
 
 try:
     while True:
+        scheduler.Wait()
+        metrics.BeginFrame()
         if (isStereo):
             StereoLevelVisualizer()
         else: #MONO AUX or MIX input
             MonoLevelVisualizer()
+        metrics.EndFrame()
 
-        time.sleep(1/30)
-            
 
 except KeyboardInterrupt:
+	reporter.Stop()
+	print(scheduler.Summary())
+	print('Frames shown: {}, skipped (unchanged): {}'.format(frame_output.frames_shown, frame_output.frames_skipped))
 	pixels.deinit()
 	wiringpi.digitalWrite(E_pin, 1) #disable MUX output
 	sys.exit()
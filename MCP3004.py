@@ -0,0 +1,165 @@
+#Batched reader for the mcp3004 ADC
+
+#ReadChannel does one spi.xfer2([1,(8+channel)<<4,0]) per sample, so every sample pays for a python call
+#and an ioctl. This packs many 3 byte conversion commands into one transfer (channels interleaved, ie
+#L R L R ... for stereo) and decodes all the replies at once with vectorized bit operations.
+
+#The mcp3004 only starts a new conversion on a falling edge of CS, and xfer2 holds CS low for the whole
+#buffer. So on a real spidev device the commands are sent as one SPI_IOC_MESSAGE made of 3 byte segments
+#with cs_change set, which is still a single ioctl. Objects without fileno() (like FakeSpiDev) get a
+#plain xfer2/xfer3 of the packed buffer.
+
+#ADC Channel list:
+# channel | Input
+#=================
+#       0 | MIC
+#       1 | AUX L
+#       2 | AUX R
+#       3 | AUX MONO
+import ctypes
+import fcntl
+import numpy as np
+
+SPIDEV_BUFSIZ = 4096 #default size limit of one spidev transfer in bytes
+MAX_CONVERSIONS_PER_XFER = SPIDEV_BUFSIZ // 3
+MAX_SEGMENTS_PER_MESSAGE = 511 #SPI_IOC_MESSAGE size field is 14 bits, 511 * 32 bytes is the most that fits
+
+
+#struct spi_ioc_transfer from linux/spi/spidev.h
+class SpiIocTransfer(ctypes.Structure):
+    _fields_ = [
+        ('tx_buf', ctypes.c_uint64),
+        ('rx_buf', ctypes.c_uint64),
+        ('len', ctypes.c_uint32),
+        ('speed_hz', ctypes.c_uint32),
+        ('delay_usecs', ctypes.c_uint16),
+        ('bits_per_word', ctypes.c_uint8),
+        ('cs_change', ctypes.c_uint8),
+        ('tx_nbits', ctypes.c_uint8),
+        ('rx_nbits', ctypes.c_uint8),
+        ('word_delay_usecs', ctypes.c_uint8),
+        ('pad', ctypes.c_uint8),
+    ]
+
+#_IOW('k', 0, char[n * sizeof(struct spi_ioc_transfer)])
+def SPI_IOC_MESSAGE(n):
+    return (1 << 30) | ((n * ctypes.sizeof(SpiIocTransfer)) << 16) | (ord('k') << 8)
+
+
+#3 byte command for a single ended conversion on channel: start bit, SGL/DIFF + channel, don't care
+def ConversionCommand(channel):
+    return [1, (8+channel)<<4, 0]
+
+#Command buffer for num_samples conversions of each channel in channels, interleaved
+def BuildCommandBuffer(channels, num_samples):
+    frame = []
+    for ch in channels:
+        frame += ConversionCommand(ch)
+    return frame * num_samples
+
+#Decodes a flat list/bytes/uint8 array of 3 byte replies into a uint16 array of 10 bit samples
+def DecodeReplies(reply, out = None):
+    if isinstance(reply, np.ndarray):
+        raw = reply.reshape(-1, 3)
+    else:
+        raw = np.frombuffer(bytes(reply), dtype=np.uint8).reshape(-1, 3)
+    if out is None:
+        out = np.empty(len(raw), dtype=np.uint16)
+    np.bitwise_and(raw[:, 1], 3, out=out, dtype=np.uint16)
+    np.left_shift(out, 8, out=out)
+    np.bitwise_or(out, raw[:, 2], out=out)
+    return out
+
+#Channel of every 3 byte conversion command in a flat list/bytes/uint8 array, as a uint8 array
+def CommandChannels(commands):
+    if isinstance(commands, np.ndarray):
+        raw = commands.reshape(-1, 3)
+    else:
+        raw = np.frombuffer(bytes(commands), dtype=np.uint8).reshape(-1, 3)
+    return (raw[:, 1] >> 4) & 7
+
+#Reverse of DecodeReplies, the 3 byte replies the ADC sends for 10 bit samples, as a flat uint8 array
+def EncodeReplies(values):
+    values = np.asarray(values, dtype=np.uint16)
+    reply = np.zeros((len(values), 3), dtype=np.uint8)
+    reply[:, 1] = values >> 8 #null bit, B9, B8
+    reply[:, 2] = values & 0xff
+    return reply.reshape(-1)
+
+
+#One SPI_IOC_MESSAGE of 3 byte segments, CS is released between segments so every command is its own conversion.
+#The transfer descriptors and tx/rx buffers are built once and reused for every call.
+class SegmentedTransfer:
+    def __init__(self, spi, commands):
+        self.spi = spi
+        self.tx = np.array(commands, dtype=np.uint8)
+        self.rx = np.zeros_like(self.tx)
+        num_segments = len(self.tx) // 3
+        self.segments = (SpiIocTransfer * num_segments)()
+        for i, seg in enumerate(self.segments):
+            seg.tx_buf = self.tx.ctypes.data + 3*i
+            seg.rx_buf = self.rx.ctypes.data + 3*i
+            seg.len = 3
+            seg.speed_hz = spi.max_speed_hz
+            seg.bits_per_word = 8
+            seg.cs_change = 1
+        self.segments[-1].cs_change = 0 #let the driver release CS normally at the end of the message
+        self.request = SPI_IOC_MESSAGE(num_segments)
+
+    def __call__(self):
+        fcntl.ioctl(self.spi.fileno(), self.request, self.segments)
+        return self.rx
+
+
+class MCP3004Reader:
+    def __init__(self, spi, channels, max_conversions = None):
+        self.spi = spi
+        self.channels = tuple(channels)
+        self.segmented = hasattr(spi, 'fileno')
+        if max_conversions is None:
+            max_conversions = MAX_SEGMENTS_PER_MESSAGE if self.segmented else MAX_CONVERSIONS_PER_XFER
+        elif self.segmented:
+            max_conversions = min(max_conversions, MAX_SEGMENTS_PER_MESSAGE)
+        #number of sample frames (one conversion per channel) that fit in a single transfer
+        self.frames_per_xfer = max(1, max_conversions // len(self.channels))
+        #xfer3 splits transfers bigger than the spidev buffer inside the C extension (spidev >= 3.5)
+        if(max_conversions > MAX_CONVERSIONS_PER_XFER and hasattr(spi, 'xfer3')):
+            self._xfer = spi.xfer3
+        else:
+            self._xfer = spi.xfer2
+        self._transfers = {}
+        #ioctl transfers bypass xfer2, so a recording spi (see ADC_Capture.py) gets those conversions from here
+        self._record = getattr(spi, 'RecordConversions', None) if self.segmented else None
+        self._channel_ids = np.tile(np.array(self.channels, dtype=np.uint8), self.frames_per_xfer)
+
+    #Returns a function that runs the transfer for num_frames sample frames and returns the replies
+    def _Transfer(self, num_frames):
+        if num_frames not in self._transfers:
+            commands = BuildCommandBuffer(self.channels, num_frames)
+            if self.segmented:
+                self._transfers[num_frames] = SegmentedTransfer(self.spi, commands)
+            else:
+                self._transfers[num_frames] = lambda xfer=self._xfer, commands=commands: xfer(commands)
+        return self._transfers[num_frames]
+
+    #Fills out, a C contiguous uint16 array of shape (num_frames, len(channels)), with as few transfers as possible
+    #out can also be any writable buffer of unsigned shorts (ie array('H')), holding the frames interleaved
+    def ReadInto(self, out):
+        nch = len(self.channels)
+        if isinstance(out, np.ndarray):
+            flat = out.reshape(-1)
+        else:
+            flat = np.frombuffer(out, dtype=np.uint16)
+        num_frames = len(flat) // nch
+        pos = 0
+        while pos < num_frames:
+            count = min(self.frames_per_xfer, num_frames - pos)
+            reply = self._Transfer(count)()
+            DecodeReplies(reply, flat[pos*nch:(pos+count)*nch])
+            if self._record is not None:
+                self._record(self._channel_ids[:count*nch], flat[pos*nch:(pos+count)*nch])
+            pos += count
+        return out
+
+    def Read(self, num_frames):
+        return self.ReadInto(np.empty((num_frames, len(self.channels)), dtype=np.uint16))
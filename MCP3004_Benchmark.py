@@ -0,0 +1,59 @@
+#Compares the per-sample ReadChannel loop against the batched MCP3004Reader, on the FakeSpiDev
+#usage: python MCP3004_Benchmark.py [num_samples] [ioctl_latency_us]
+import sys
+import time
+import numpy as np
+
+from Fake_SpiDev import FakeSpiDev, SineSource
+from MCP3004 import MCP3004Reader
+from Legacy_Pipeline import ReadChannel
+
+
+def MakeSpi(latency):
+    spi = FakeSpiDev({1: SineSource(440), 2: SineSource(1000), 3: SineSource(440)}, latency=latency)
+    spi.open(0,0)
+    spi.max_speed_hz=1000000
+    return spi
+
+
+def PerCallMono(spi, num_samples):
+    return [ReadChannel(spi, 3) for i in range(num_samples)]
+
+def PerCallStereo(spi, num_samples):
+    return [(ReadChannel(spi, 1), ReadChannel(spi, 2)) for i in range(num_samples)]
+
+
+def Rate(fn, num_samples, repeats = 5):
+    best = float('inf')
+    for i in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return num_samples / best
+
+
+if __name__ == '__main__':
+    num_samples = int(sys.argv[1]) if len(sys.argv) > 1 else 1500
+    latency = float(sys.argv[2]) * 1e-6 if len(sys.argv) > 2 else 0.0
+
+    #Both paths have to read the same values from the same point in the simulated signal
+    spi_a, spi_b = MakeSpi(0), MakeSpi(0)
+    bulk = MCP3004Reader(spi_b, (1, 2)).Read(num_samples)
+    assert np.array_equal(bulk, np.array(PerCallStereo(spi_a, num_samples), dtype=np.uint16))
+
+    print('{} samples per channel, {:.0f}us simulated ioctl latency'.format(num_samples, latency * 1e6))
+    spi = MakeSpi(latency)
+    mono_reader = MCP3004Reader(spi, (3,))
+    stereo_reader = MCP3004Reader(spi, (1, 2))
+    mono_out = np.empty((num_samples, 1), dtype=np.uint16)
+    stereo_out = np.empty((num_samples, 2), dtype=np.uint16)
+
+    results = [
+        ('ReadChannel loop, mono', Rate(lambda: PerCallMono(spi, num_samples), num_samples)),
+        ('MCP3004Reader, mono', Rate(lambda: mono_reader.ReadInto(mono_out), num_samples)),
+        ('ReadChannel loop, stereo', Rate(lambda: PerCallStereo(spi, num_samples), num_samples)),
+        ('MCP3004Reader, stereo', Rate(lambda: stereo_reader.ReadInto(stereo_out), num_samples)),
+    ]
+    for name, rate in results:
+        print('{:<28} {:>12.0f} samples/s per channel'.format(name, rate))
+    print('Real bus limit at {} Hz: {:.0f} conversions/s'.format(spi.max_speed_hz, spi.max_speed_hz / 24))
@@ -0,0 +1,236 @@
+#Lightweight always-on instrumentation for the visualizer loops
+
+#Each frame is split into stages with Lap(), which costs one perf_counter_ns() call and a few integer adds,
+#and the time of every stage goes into a histogram with power of two buckets (in ns) so percentiles can be
+#read at any point without keeping every sample. Counters that other objects already keep (ADC overruns,
+#scheduler drops, skipped frames...) are not copied on the hot path, they are pulled from sources registered
+#with AddSource() only when a snapshot is taken.
+
+#Snapshots are published as a periodic JSON log line and/or over HTTP (GET /metrics on a localhost port
+#or a Unix socket path). With StartMetrics(enabled = False) the loops get NullMetrics, whose methods do
+#nothing, so the instrumentation can be switched off completely without touching the loops.
+#ie:    curl http://127.0.0.1:8765/metrics
+#       curl --unix-socket /tmp/ave-metrics.sock http://localhost/metrics
+import http.server
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+
+
+NUM_BUCKETS = 40 #bucket i holds times with bit_length i, ie [2^(i-1), 2^i) ns, the last one is everything above ~4.5 min
+
+
+class StageHistogram:
+    def __init__(self):
+        self.counts = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def Add(self, ns):
+        self.counts[min(ns.bit_length(), NUM_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    #Upper edge of the bucket holding the q-th percentile, so within a factor of 2 of the real value
+    def Percentile(self, q):
+        if self.count == 0:
+            return 0
+        rank = q / 100 * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank and c:
+                return min(1 << i, self.max_ns)
+        return self.max_ns
+
+    def Summary(self):
+        return {
+            'count': self.count,
+            'mean_us': self.total_ns / self.count / 1e3 if self.count else 0.0,
+            'p50_us': self.Percentile(50) / 1e3,
+            'p90_us': self.Percentile(90) / 1e3,
+            'p99_us': self.Percentile(99) / 1e3,
+            'max_us': self.max_ns / 1e3,
+        }
+
+
+class Metrics:
+    enabled = True
+
+    def __init__(self):
+        self.stages = {}
+        self.gauges = {}
+        self.sources = {}
+        self.frames = 0
+        self._lap_ns = None
+        self._frame_start_ns = None
+        self._start = time.monotonic()
+
+    #Call at the start of every frame, the first Lap() is timed from here
+    def BeginFrame(self):
+        self._frame_start_ns = self._lap_ns = time.perf_counter_ns()
+
+    #Records the time since the last BeginFrame()/Lap() under stage
+    def Lap(self, stage):
+        now = time.perf_counter_ns()
+        hist = self.stages.get(stage)
+        if hist is None:
+            hist = self.stages[stage] = StageHistogram()
+        hist.Add(now - self._lap_ns)
+        self._lap_ns = now
+
+    #Records the whole frame time, from BeginFrame()
+    def EndFrame(self):
+        self.Record('frame', time.perf_counter_ns() - self._frame_start_ns)
+        self.frames += 1
+
+    #Records a time measured elsewhere, ie in another thread
+    def Record(self, stage, ns):
+        hist = self.stages.get(stage)
+        if hist is None:
+            hist = self.stages[stage] = StageHistogram()
+        hist.Add(ns)
+
+    def Set(self, name, value):
+        self.gauges[name] = value
+
+    #fn() returns a dict of values, called every time a snapshot is taken
+    def AddSource(self, name, fn):
+        self.sources[name] = fn
+
+    def Snapshot(self):
+        uptime = time.monotonic() - self._start
+        snapshot = {
+            'time': time.time(),
+            'uptime_s': uptime,
+            'frames': self.frames,
+            'fps': self.frames / uptime if uptime > 0 else 0.0,
+            'stages': {name: hist.Summary() for name, hist in list(self.stages.items())},
+        }
+        snapshot.update(self.gauges)
+        for name, fn in list(self.sources.items()):
+            snapshot[name] = fn()
+        return snapshot
+
+
+#Same interface as Metrics, does nothing
+class NullMetrics:
+    enabled = False
+
+    def BeginFrame(self):
+        pass
+
+    def Lap(self, stage):
+        pass
+
+    def EndFrame(self):
+        pass
+
+    def Record(self, stage, ns):
+        pass
+
+    def Set(self, name, value):
+        pass
+
+    def AddSource(self, name, fn):
+        pass
+
+    def Snapshot(self):
+        return {}
+
+
+#Writes one JSON line of metrics every interval seconds
+class MetricsLogger:
+    def __init__(self, metrics, interval, stream = None):
+        self.metrics = metrics
+        self.interval = interval
+        self.stream = stream if stream is not None else sys.stderr
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._Run, name='metrics logger', daemon=True)
+
+    def Start(self):
+        self._thread.start()
+        return self
+
+    def Stop(self):
+        self._stop_event.set()
+
+    def _Run(self):
+        while not self._stop_event.wait(self.interval):
+            self.stream.write('metrics ' + json.dumps(self.metrics.Snapshot()) + '\n')
+            self.stream.flush()
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = json.dumps(self.server.metrics.Snapshot()).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+    def address_string(self):
+        return str(self.client_address)
+
+class _TCPMetricsServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+class _UnixMetricsServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+#Serves GET /metrics on address, a port number on localhost or the path of a Unix socket
+class MetricsServer:
+    def __init__(self, metrics, address):
+        if isinstance(address, str):
+            if os.path.exists(address):
+                os.unlink(address)
+            self.server = _UnixMetricsServer(address, _MetricsHandler)
+        else:
+            self.server = _TCPMetricsServer(('127.0.0.1', address), _MetricsHandler)
+        self.server.metrics = metrics
+        self.address = address
+        self._thread = threading.Thread(target=self.server.serve_forever, name='metrics server', daemon=True)
+
+    def Start(self):
+        self._thread.start()
+        return self
+
+    def Stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+
+#Metrics plus the reporters publishing it
+class MetricsReporter:
+    def __init__(self, metrics, log_interval = None, address = None):
+        self.metrics = metrics
+        self.logger = MetricsLogger(metrics, log_interval).Start() if log_interval else None
+        self.server = MetricsServer(metrics, address).Start() if address is not None else None
+
+    def Stop(self):
+        if self.logger is not None:
+            self.logger.Stop()
+        if self.server is not None:
+            self.server.Stop()
+
+#log_interval in seconds, address is a localhost port or Unix socket path, None turns either one off
+#The AVE_METRICS environment variable overrides enabled, AVE_METRICS=0 turns everything off
+def StartMetrics(enabled = True, log_interval = None, address = None):
+    if os.environ.get('AVE_METRICS', '1' if enabled else '0') == '0':
+        return MetricsReporter(NullMetrics())
+    return MetricsReporter(Metrics(), log_interval, address)
@@ -0,0 +1,384 @@
+#UDP frame streaming to networked LED controllers
+
+#Instead of one Pi per panel, finished frames can be sent over the network in one of two common LED protocols:
+#    ddp   Distributed Display Protocol, port 4048: 10 byte header, up to 1440 data bytes per packet, the last
+#          packet of a frame has the push flag set. Sequence numbers go 1 to 15.
+#    e131  E1.31 (sACN), port 5568: 126 byte header, one DMX universe of up to 512 slots per packet (170 RGB
+#          pixels), universes numbered from 1. Sequence numbers go 0 to 255.
+#Every frame goes out as RGB (or RGBW) in strip order, whatever color order the local strip would use.
+
+#NetworkStrip stands in for a neopixel object, so FrameOutput (and so every script) drives it unchanged: its
+#show() sends the framebuffer. The packet headers are built once, only their sequence byte changes per frame, and
+#each packet is sent with sendmsg() straight from the header row and a slice of the frame, so there is no
+#per-pixel (or per-byte) python work. Frames that cannot be sent (the socket buffer is full) are dropped and counted.
+
+#FrameReceiver is the other end, so a second A.V.E. node can drive its pixels from the network. It assembles
+#packets into frames and keeps statistics:
+#    frames      complete frames received
+#    dropped     frames never seen, from gaps in the sequence numbers
+#    late        packets from a frame older than the current one (reordered by the network), ignored
+#    incomplete  frames that were shown (ddp push) or given up on (e131, a newer frame started) without all their data
+
+#usage:
+#    python Network_Output.py send HOST[:PORT] [--protocol ddp|e131] Script.py [script args...]
+#    python Network_Output.py receive [--bind ADDR[:PORT]] [--protocol ddp|e131] [--pixels N]
+#Without a Pi both ends run on simulated hardware over loopback, ie:
+#    python Simulate.py --seconds 10 Network_Output.py receive
+#    python Simulate.py --seconds 10 Network_Output.py send 127.0.0.1 Spectrum_Visualizer.py stereo
+import argparse
+import runpy
+import socket
+import sys
+import time
+import types
+import uuid
+import numpy as np
+
+from Pixel_Output import WireOrder
+
+DDP_PORT = 4048
+DDP_HEADER_SIZE = 10
+DDP_MAX_DATA = 1440 #480 RGB pixels, keeps packets under a 1500 byte MTU
+DDP_VERSION = 0x40
+DDP_PUSH = 0x01
+DDP_TYPE = {3: 0x0B, 4: 0x1B} #RGB / RGBW, 8 bits per channel
+DDP_DEFAULT_ID = 1 #display
+
+E131_PORT = 5568
+E131_HEADER_SIZE = 126
+E131_MAX_SLOTS = 512
+E131_IDENTIFIER = b'ASC-E1.17\0\0\0'
+E131_SEQUENCE_OFFSET = 111
+E131_UNIVERSE_OFFSET = 113
+E131_COUNT_OFFSET = 123
+
+RECEIVE_BUFFER_SIZE = 2048
+RECEIVE_POLL_INTERVAL = 0.5 #seconds the receive loop waits for a packet before checking for Ctrl-C again
+
+
+#Header rows (one per packet) and the (offset, length) of the frame each packet carries
+class DDPPacketizer:
+    name = 'ddp'
+    port = DDP_PORT
+    sequence_modulo = 15
+
+    def __init__(self, frame_bytes, bpp = 3):
+        offsets = np.arange(0, frame_bytes, DDP_MAX_DATA - DDP_MAX_DATA % bpp)
+        lengths = np.minimum(frame_bytes - offsets, DDP_MAX_DATA - DDP_MAX_DATA % bpp)
+        self.headers = np.zeros((len(offsets), DDP_HEADER_SIZE), dtype=np.uint8)
+        self.headers[:, 0] = DDP_VERSION
+        self.headers[-1, 0] |= DDP_PUSH
+        self.headers[:, 2] = DDP_TYPE[bpp]
+        self.headers[:, 3] = DDP_DEFAULT_ID
+        self.headers[:, 4:8] = offsets.astype('>u4').view(np.uint8).reshape(-1, 4)
+        self.headers[:, 8:10] = lengths.astype('>u2').view(np.uint8).reshape(-1, 2)
+        self.slices = list(zip(offsets.tolist(), lengths.tolist()))
+
+    #sequence counts frames from 0, DDP numbers them 1 to 15 (0 means unnumbered)
+    def SetSequence(self, sequence):
+        self.headers[:, 1] = sequence % 15 + 1
+
+    #(sequence from 0, or None if unnumbered, offset, data, push) of a received packet, or None if it isn't one
+    @staticmethod
+    def Parse(packet):
+        if len(packet) < DDP_HEADER_SIZE or packet[0] & 0xC0 != DDP_VERSION:
+            return None
+        header = DDP_HEADER_SIZE + (4 if packet[0] & 0x10 else 0) #timecode
+        offset = int.from_bytes(packet[4:8], 'big')
+        length = int.from_bytes(packet[8:10], 'big')
+        sequence = packet[1] & 0x0F
+        return (sequence - 1 if sequence else None), offset, packet[header:header + length], bool(packet[0] & DDP_PUSH)
+
+
+class E131Packetizer:
+    name = 'e131'
+    port = E131_PORT
+    sequence_modulo = 256
+
+    def __init__(self, frame_bytes, bpp = 3, universe = 1, source_name = 'A.V.E.', priority = 100, cid = None):
+        universe_bytes = E131_MAX_SLOTS - E131_MAX_SLOTS % bpp #pixels never straddle universes
+        offsets = np.arange(0, frame_bytes, universe_bytes)
+        lengths = np.minimum(frame_bytes - offsets, universe_bytes)
+        self.universe = universe
+        self.universe_bytes = universe_bytes
+        cid = uuid.uuid4().bytes if cid is None else cid
+
+        self.headers = np.zeros((len(offsets), E131_HEADER_SIZE), dtype=np.uint8)
+        def Put(offset, values, dtype):
+            values = np.broadcast_to(np.asarray(values, dtype=dtype), len(offsets))
+            self.headers[:, offset:offset + np.dtype(dtype).itemsize] = values.astype(dtype).view(np.uint8).reshape(len(offsets), -1)
+        packet_lengths = E131_HEADER_SIZE + lengths
+        Put(0, 0x0010, '>u2') #preamble size
+        self.headers[:, 4:16] = np.frombuffer(E131_IDENTIFIER, dtype=np.uint8)
+        Put(16, 0x7000 | (packet_lengths - 16), '>u2') #root layer flags and length
+        Put(18, 0x00000004, '>u4') #VECTOR_ROOT_E131_DATA
+        self.headers[:, 22:38] = np.frombuffer(cid, dtype=np.uint8)
+        Put(38, 0x7000 | (packet_lengths - 38), '>u2') #framing layer
+        Put(40, 0x00000002, '>u4') #VECTOR_E131_DATA_PACKET
+        source_name = source_name.encode('ascii')[:63] #null terminated in 64 bytes
+        self.headers[:, 44:44 + len(source_name)] = np.frombuffer(source_name, dtype=np.uint8)
+        self.headers[:, 108] = priority
+        Put(E131_UNIVERSE_OFFSET, universe + np.arange(len(offsets)), '>u2')
+        Put(115, 0x7000 | (packet_lengths - 115), '>u2') #DMP layer
+        self.headers[:, 117] = 0x02 #VECTOR_DMP_SET_PROPERTY
+        self.headers[:, 118] = 0xA1 #address and data type
+        Put(121, 1, '>u2') #address increment
+        Put(E131_COUNT_OFFSET, 1 + lengths, '>u2') #start code + slots
+        self.slices = list(zip(offsets.tolist(), lengths.tolist()))
+
+    def SetSequence(self, sequence):
+        self.headers[:, E131_SEQUENCE_OFFSET] = sequence % 256
+
+    #Same as DDPPacketizer.Parse, push is None since E1.31 has no end of frame marker. universe is the first one of the frame
+    @staticmethod
+    def Parse(packet, universe = 1, universe_bytes = E131_MAX_SLOTS - E131_MAX_SLOTS % 3):
+        if len(packet) < E131_HEADER_SIZE or packet[4:16] != E131_IDENTIFIER or packet[125] != 0:
+            return None
+        slots = int.from_bytes(packet[E131_COUNT_OFFSET:E131_COUNT_OFFSET + 2], 'big') - 1
+        offset = (int.from_bytes(packet[E131_UNIVERSE_OFFSET:E131_UNIVERSE_OFFSET + 2], 'big') - universe) * universe_bytes
+        return packet[E131_SEQUENCE_OFFSET], offset, packet[E131_HEADER_SIZE:E131_HEADER_SIZE + slots], None
+
+PROTOCOLS = {'ddp': DDPPacketizer, 'e131': E131Packetizer}
+
+
+#'host', 'host:port' or (host, port) to (host, port), with the protocol's port by default
+def ParseAddress(address, default_port):
+    if isinstance(address, tuple):
+        return address
+    host, _, port = address.rpartition(':') if ':' in address else (address, '', '')
+    return host, int(port) if port else default_port
+
+
+#neopixel-like strip whose show() sends the frame over UDP. pixel_order is the order FrameOutput writes buf in
+#(the script's ORDER), frames are reordered to RGB(W) on the way out.
+class NetworkStrip:
+    def __init__(self, num_pixels, address, protocol = 'ddp', pixel_order = 'RGB', brightness = 1.0):
+        self.n = num_pixels
+        self.bpp = len(pixel_order)
+        self.brightness = brightness
+        self.packetizer = PROTOCOLS[protocol](num_pixels * self.bpp, self.bpp)
+        self.address = ParseAddress(address, self.packetizer.port)
+        self.buf = bytearray(num_pixels * self.bpp)
+        self._pixels = np.frombuffer(self.buf, dtype=np.uint8).reshape(num_pixels, self.bpp)
+        #wire byte of each color channel, None when buf already is RGB(W)
+        to_rgb = np.argsort(WireOrder(pixel_order))
+        self._to_rgb = None if (to_rgb == np.arange(self.bpp)).all() else to_rgb
+        self._frame = np.empty((num_pixels, self.bpp), dtype=np.uint8)
+        self._frame_view = memoryview(self._frame.reshape(-1))
+        self._header_views = [memoryview(row) for row in self.packetizer.headers]
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.sequence = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0 #could not be sent in full
+        self.packets_sent = 0
+        self.bytes_sent = 0
+
+    def __len__(self):
+        return self.n
+
+    def show(self):
+        if self._to_rgb is None:
+            self._frame[:] = self._pixels
+        else:
+            np.take(self._pixels, self._to_rgb, axis=1, out=self._frame)
+        self.packetizer.SetSequence(self.sequence)
+        self.sequence += 1
+        try:
+            for header, (offset, length) in zip(self._header_views, self.packetizer.slices):
+                self.bytes_sent += self.socket.sendmsg([header, self._frame_view[offset:offset + length]], [], 0, self.address)
+                self.packets_sent += 1
+        except OSError: #BlockingIOError when the socket buffer is full, or the network is down
+            self.frames_dropped += 1
+            return
+        self.frames_sent += 1
+
+    def deinit(self):
+        self.socket.close()
+
+    def Stats(self):
+        return {'frames_sent': self.frames_sent, 'frames_dropped': self.frames_dropped, 'packets_sent': self.packets_sent, 'bytes_sent': self.bytes_sent}
+
+    def Summary(self):
+        return '{} to {}:{}: {frames_sent} frames sent, {frames_dropped} dropped, {packets_sent} packets, {bytes_sent} bytes'.format(
+            self.packetizer.name, self.address[0], self.address[1], **self.Stats())
+
+
+class FrameReceiver:
+    def __init__(self, num_pixels, bind = '0.0.0.0', protocol = 'ddp', bpp = 3, universe = 1):
+        self.packetizer = PROTOCOLS[protocol]
+        self.frame_bytes = num_pixels * bpp
+        self.address = ParseAddress(bind, self.packetizer.port)
+        if protocol == 'e131':
+            universe_bytes = E131_MAX_SLOTS - E131_MAX_SLOTS % bpp
+            self._parse = lambda packet: E131Packetizer.Parse(packet, universe, universe_bytes)
+        else:
+            self._parse = DDPPacketizer.Parse
+        self.frame = np.zeros((num_pixels, bpp), dtype=np.uint8)
+        self._frame_flat = self.frame.reshape(-1)
+        self._packet = bytearray(RECEIVE_BUFFER_SIZE)
+        self._packet_view = memoryview(self._packet)
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(self.address)
+
+        self._sequence = None #of the frame being assembled
+        self._received = 0 #bytes of it received so far
+        self._shown = True #the frame being assembled has already been returned or counted
+        self.frames = 0
+        self.dropped = 0
+        self.late = 0
+        self.incomplete = 0
+        self.packets = 0
+        self.invalid = 0 #packets that were not of the protocol or out of the frame
+        self._last_frame_time = None
+        self._interval_max = 0.0
+
+    #How far sequence is ahead of the frame being assembled, negative for older frames
+    def _Distance(self, sequence):
+        modulo = self.packetizer.sequence_modulo
+        return (sequence - self._sequence + modulo // 2) % modulo - modulo // 2
+
+    def _StartFrame(self, sequence):
+        if self._sequence is not None:
+            if not self._shown:
+                self.incomplete += 1
+            if sequence is not None:
+                self.dropped += max(0, self._Distance(sequence) - 1)
+        self._sequence = sequence
+        self._received = 0
+        self._shown = False
+
+    def _Completed(self, complete):
+        self._shown = True
+        if complete:
+            self.frames += 1
+        else:
+            self.incomplete += 1
+        now = time.monotonic()
+        if self._last_frame_time is not None:
+            self._interval_max = max(self._interval_max, now - self._last_frame_time)
+        self._last_frame_time = now
+        return self.frame
+
+    #Waits up to timeout seconds (None forever) for the next packet, returns the (num_pixels, bpp) RGB(W) frame
+    #when that packet completed one, otherwise None. The frame is only valid until the next call.
+    def Receive(self, timeout = None):
+        self.socket.settimeout(timeout)
+        try:
+            size = self.socket.recv_into(self._packet)
+        except socket.timeout:
+            return None
+        self.packets += 1
+        parsed = self._parse(self._packet_view[:size])
+        if parsed is None:
+            self.invalid += 1
+            return None
+        sequence, offset, data, push = parsed
+        if offset < 0 or offset + len(data) > self.frame_bytes:
+            self.invalid += 1
+            return None
+
+        if sequence is None: #unnumbered, every push ends a frame
+            if self._shown:
+                self._StartFrame(None)
+        elif self._sequence is None or sequence != self._sequence:
+            if self._sequence is not None and self._Distance(sequence) < 0:
+                self.late += 1
+                return None
+            self._StartFrame(sequence)
+        elif self._shown: #repeated packet of a frame already shown
+            self.late += 1
+            return None
+        self._frame_flat[offset:offset + len(data)] = np.frombuffer(data, dtype=np.uint8)
+        self._received += len(data)
+
+        if push: #ddp, show whatever arrived
+            return self._Completed(self._received >= self.frame_bytes)
+        if push is None and self._received >= self.frame_bytes:
+            return self._Completed(True)
+        return None
+
+    def close(self):
+        self.socket.close()
+
+    def Stats(self):
+        return {'frames': self.frames, 'dropped': self.dropped, 'late': self.late, 'incomplete': self.incomplete,
+                'packets': self.packets, 'invalid': self.invalid, 'interval_max_ms': self._interval_max * 1e3}
+
+    def Summary(self):
+        return '{} on {}:{}: {frames} frames, {dropped} dropped, {late} late packets, {incomplete} incomplete, {packets} packets, {invalid} invalid, longest gap {interval_max_ms:.1f}ms'.format(
+            self.packetizer.name, self.address[0], self.address[1], **self.Stats())
+
+
+#Replaces neopixel (the real one, or the simulated one from Hardware.py) with one whose strips send to address,
+#has to run before the script imports it. Returns the list the strips get added to
+def InstallNetworkOutput(address, protocol = 'ddp'):
+    strips = []
+    original = sys.modules.get('neopixel')
+    def NeoPixel(pin, n, bpp = 3, brightness = 1.0, auto_write = True, pixel_order = None):
+        if pixel_order is None:
+            pixel_order = 'GRB' if bpp == 3 else 'GRBW'
+        strip = NetworkStrip(n, address, protocol, pixel_order, brightness)
+        strips.append(strip)
+        return strip
+    neopixel = types.ModuleType('neopixel')
+    neopixel.NeoPixel = NeoPixel
+    for name in ('RGB', 'GRB', 'RGBW', 'GRBW'):
+        setattr(neopixel, name, getattr(original, name, name) if original is not None else name)
+    sys.modules['neopixel'] = neopixel
+    return strips
+
+
+def ParseArgs(argv):
+    parser = argparse.ArgumentParser(description='Send A.V.E. frames over UDP, or drive the pixels from UDP frames')
+    commands = parser.add_subparsers(dest='command', required=True)
+    send = commands.add_parser('send', help='run a script with its strip sent over the network')
+    send.add_argument('address', help='HOST or HOST:PORT of the controller')
+    send.add_argument('--protocol', choices=sorted(PROTOCOLS), default='ddp')
+    send.add_argument('script')
+    send.add_argument('script_args', nargs=argparse.REMAINDER)
+    receive = commands.add_parser('receive', help='show frames received from the network on the local strip')
+    receive.add_argument('--bind', default='0.0.0.0', help='ADDR or ADDR:PORT to listen on')
+    receive.add_argument('--protocol', choices=sorted(PROTOCOLS), default='ddp')
+    receive.add_argument('--pixels', type=int, default=100)
+    receive.add_argument('--brightness', type=float, default=0.2)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = ParseArgs(sys.argv[1:])
+
+    if args.command == 'send':
+        strips = InstallNetworkOutput(args.address, args.protocol)
+        sys.argv = [args.script] + args.script_args
+        try:
+            runpy.run_path(args.script, run_name='__main__')
+        except (SystemExit, KeyboardInterrupt):
+            pass
+        for strip in strips:
+            print(strip.Summary())
+        sys.exit()
+
+    import board
+    import neopixel
+    from Pixel_Output import FrameOutput
+
+    pixels = neopixel.NeoPixel(board.D18, args.pixels, brightness=args.brightness, auto_write = False, pixel_order=neopixel.GRB)
+    frame_output = FrameOutput(pixels, args.pixels, neopixel.GRB)
+    receiver = FrameReceiver(args.pixels, args.bind, args.protocol)
+    try:
+        while True:
+            #poll so a Ctrl-C (or the end of Simulate.py --seconds) gets through while no packets arrive
+            frame = receiver.Receive(RECEIVE_POLL_INTERVAL)
+            if frame is not None:
+                frame_output.Show(frame)
+    except KeyboardInterrupt:
+        pass
+    print(receiver.Summary())
+    print('Frames shown: {}, skipped (unchanged): {}'.format(frame_output.frames_shown, frame_output.frames_skipped))
+    receiver.close()
+    pixels.deinit()
+    sys.exit()
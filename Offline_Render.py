@@ -0,0 +1,215 @@
+#Offline, faster than realtime rendering of the visualizers from WAV files
+
+#Runs the spectrum and level visualizer math over a recorded file without a Pi (or the simulated hardware) and
+#saves every frame, for previewing band layouts and auto-gain settings, and as reference output for the live
+#MonoSpectrumVisualizer/StereoSpectrumVisualizer math.
+
+#The live STFT (STFT.py) computes one windowed FFT per frame as samples come in. Here all the analysis windows
+#are strided views into the whole signal (no copies), and STFT_BATCH of them at a time go through one 2-D
+#np.fft.rfft and one band weight matrix product. Only the running statistics of the auto-gain are updated frame
+#by frame, exactly like the live visualizers do, with each frame's audio time as the clock.
+#--verify renders the same frames a second time through StreamingSTFT and reports any difference.
+
+#The audio is mapped to ADC counts like the simulated ADC does (Fake_SpiDev.WavSource), and can be resampled to
+#the ADC rate with --sample-rate. With --fps the spectrum is only computed for the newest complete window at every
+#display frame, like the live render loop, otherwise there is one frame per hop.
+#Output is picked by the file extension:
+#    .npy  (frames, height, width, 3) uint8 array, row 0 at the top (10x10, or the size of --layout)
+#    .gif  animated preview, scaled up by --gif-scale (GIFs can't go faster than 50 fps, so frames are dropped to fit)
+#    other raw frame dump, the same bytes back to back
+#usage: python Offline_Render.py [--mode spectrum|level] [--input mono|stereo] [options] song.wav out.npy|out.gif|out.raw
+import argparse
+import math
+import os
+import sys
+import time
+import numpy as np
+
+from Fake_SpiDev import ReadWav
+from STFT import MakeWindow, StreamingSTFT, STFT_WINDOWS
+from Band_Engine import BAND_SCALES
+from Auto_Gain import DCTracker, BandNormalizer
+from Palette import BarPalette, BarHeights
+from Spectrum_Bars import SpectrumHeights, SpectrumPalette, NUM_SAMPLES, HOP_SIZE, FFT_WINDOW, BAND_SCALE, AUTO_GAIN_MIN_RANGE, BEAT_FLASH_COLOR
+from Panel_Layout import LoadLayout
+from Pixel_Map import PANEL_WIDTH, PANEL_HEIGHT
+
+#The spectrum settings and height math are Spectrum_Visualizer.py's own (see Spectrum_Bars.py), these are the same as Level_Visualizer.py
+LEVEL_FRAME_RATE = 30
+LEVEL_MIN_RANGE = 20
+
+#Full scale audio is +-ADC_AMPLITUDE around ADC_OFFSET, same as Fake_SpiDev.WavSource
+ADC_AMPLITUDE = 500.0
+ADC_OFFSET = 512.0
+
+STFT_BATCH = 1024 #windows per batched FFT, bounds memory on long files
+GIF_MAX_FPS = 50
+
+
+#(samples, rate), samples is (n, 1) or (n, 2) uint16 ADC counts. Mono is the mix of every channel, stereo
+#the first two (a mono file feeds both sides)
+def AdcSamples(path, stereo = False, sample_rate = None, offset = 0.0, seconds = None):
+    audio, rate = ReadWav(path)
+    if stereo:
+        audio = audio[:, :2] if audio.shape[1] > 1 else np.repeat(audio, 2, axis=1)
+    else:
+        audio = audio.mean(axis=1, keepdims=True)
+    audio = audio[int(offset * rate):]
+    if seconds is not None:
+        audio = audio[:int(seconds * rate)]
+    if sample_rate is not None and sample_rate != rate: #nearest earlier sample, like the simulated ADC
+        index = (np.arange(int(len(audio) * sample_rate / rate)) * (rate / sample_rate)).astype(np.int64)
+        audio = audio[index]
+        rate = sample_rate
+    return np.clip(np.rint(ADC_OFFSET + ADC_AMPLITUDE * audio), 0, 1023).astype(np.uint16), rate
+
+#First sample of the analysis window of every frame. With fps set, the newest complete window at each
+#display frame, windows that no display frame gets to are never computed
+def WindowStarts(num_samples, fft_size, hop_size, rate, fps = None):
+    last = num_samples - fft_size
+    if last < 0:
+        return np.empty(0, dtype=np.int64)
+    if fps is None:
+        return np.arange(0, last + 1, hop_size, dtype=np.int64)
+    ends = np.floor(np.arange(fft_size / rate, num_samples / rate, 1.0 / fps) * rate).astype(np.int64)
+    return np.unique((np.minimum(ends, num_samples) - fft_size) // hop_size * hop_size)
+
+#Windowed |rfft| of the window at every start, yielded in (batch, channels, fft_size // 2 + 1) blocks
+def BatchedSpectra(samples, starts, fft_size, window = FFT_WINDOW, batch = STFT_BATCH):
+    windows = np.lib.stride_tricks.sliding_window_view(samples, fft_size, axis=0) #(n - fft_size + 1, channels, fft_size) view
+    window = MakeWindow(window, fft_size)
+    for i in range(0, len(starts), batch):
+        yield np.abs(np.fft.rfft(windows[starts[i:i + batch]] * window, axis=-1))
+
+#(frames, rows, columns, 3) frames for (frames, columns) bar heights, in one gather. With a FlashPalette, flash
+#is the background flash of every frame (0.0 to 1.0)
+def BarFrames(bars, heights, flash = None):
+    if flash is None:
+        return np.ascontiguousarray(np.moveaxis(bars.Frame(heights), 1, 0))
+    levels = np.clip(np.rint(np.asarray(flash) * (bars.levels - 1)), 0, bars.levels - 1).astype(np.intp)
+    bitmaps = np.stack([palette.column_bitmaps for palette in bars.palettes]) #(levels, rows, rows + 1, 3)
+    return np.ascontiguousarray(np.moveaxis(bitmaps[levels[:, np.newaxis], :, heights], 2, 1))
+
+
+#(frames, times, beats) for the spectrum visualizer, times is the audio time (seconds) each frame's window ends at
+#and beats the BeatDetector after the last frame
+def SpectrumFrames(samples, rate, fft_size = NUM_SAMPLES, hop_size = HOP_SIZE, window = FFT_WINDOW, scale = BAND_SCALE,
+                   min_range = AUTO_GAIN_MIN_RANGE, fps = None, batch = STFT_BATCH, width = PANEL_WIDTH, height = PANEL_HEIGHT,
+                   flash_color = BEAT_FLASH_COLOR):
+    spectrum = SpectrumHeights(samples.shape[1] == 2, scale, min_range, width, height)
+    starts = WindowStarts(len(samples), fft_size, hop_size, rate, fps)
+    times = (starts + fft_size) / rate
+    heights = np.empty((len(starts), width), dtype=np.intp)
+    flash = np.empty(len(starts), dtype=np.float64)
+    i = 0
+    for fft_mags in BatchedSpectra(samples, starts, fft_size, window, batch):
+        for band_mags in spectrum.bands.Apply(fft_mags, fft_size, rate):
+            heights[i] = spectrum.Heights(band_mags, times[i])
+            flash[i] = spectrum.Flash(times[i], flash_color)
+            i += 1
+    return BarFrames(SpectrumPalette(height, flash_color), heights, flash), times, spectrum.beats
+
+#Same frames through StreamingSTFT, one window at a time like the live visualizer, to check SpectrumFrames against
+def StreamingSpectrumFrames(samples, rate, fft_size = NUM_SAMPLES, hop_size = HOP_SIZE, window = FFT_WINDOW, scale = BAND_SCALE,
+                            min_range = AUTO_GAIN_MIN_RANGE, fps = None, width = PANEL_WIDTH, height = PANEL_HEIGHT,
+                            flash_color = BEAT_FLASH_COLOR):
+    spectrum = SpectrumHeights(samples.shape[1] == 2, scale, min_range, width, height)
+    stft = StreamingSTFT(fft_size, hop_size, window, samples.shape[1])
+    bars = SpectrumPalette(height, flash_color)
+    starts = WindowStarts(len(samples), fft_size, hop_size, rate, fps)
+    frames = np.empty((len(starts), height, width, 3), dtype=np.uint8)
+    pushed = 0
+    for i, start in enumerate(starts):
+        stft.Push(samples[pushed:start + fft_size])
+        pushed = start + fft_size
+        band_mags = spectrum.bands.Apply(stft.Spectrum(), fft_size, rate)
+        bars.Frame(spectrum.Heights(band_mags, pushed / rate), spectrum.Flash(pushed / rate, flash_color), out=frames[i])
+    return frames
+
+#(frames, times) for the level visualizer, which reads one sample per channel every frame
+def LevelFrames(samples, rate, fps = LEVEL_FRAME_RATE, min_range = LEVEL_MIN_RANGE, width = PANEL_WIDTH, height = PANEL_HEIGHT):
+    channels = samples.shape[1]
+    times = np.arange(0, len(samples) / rate, 1.0 / fps)
+    picked = samples[(times * rate).astype(np.int64)]
+    dc = DCTracker(channels, initial = 512)
+    gain = BandNormalizer(channels, height, min_range = min_range)
+    columns = [width // 2, width - width // 2] if channels == 2 else [width]
+    heights = np.empty((len(times), width), dtype=np.intp)
+    for i in range(len(times)):
+        comp = gain.Update(np.abs(dc.Update(picked[i], times[i])), times[i])
+        heights[i] = BarHeights(np.repeat(comp, columns), height)
+    return BarFrames(BarPalette(height), heights), times
+
+
+def SaveFrames(frames, path, frame_rate, gif_scale = 10):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.npy':
+        np.save(path, frames)
+    elif extension == '.gif':
+        from PIL import Image
+        step = max(1, math.ceil(frame_rate / GIF_MAX_FPS))
+        duration = int(round(1000.0 * step / frame_rate))
+        images = [Image.fromarray(frame.repeat(gif_scale, axis=0).repeat(gif_scale, axis=1)) for frame in frames[::step]]
+        images[0].save(path, save_all=True, append_images=images[1:], duration=duration, loop=0)
+    else:
+        frames.tofile(path)
+
+
+def ParseArgs(argv):
+    parser = argparse.ArgumentParser(description='Render visualizer frames from a WAV file, faster than realtime')
+    parser.add_argument('wav')
+    parser.add_argument('output', help='.npy, .gif or anything else for a raw frame dump')
+    parser.add_argument('--mode', choices=('spectrum', 'level'), default='spectrum')
+    parser.add_argument('--input', choices=('mono', 'stereo'), default='mono')
+    parser.add_argument('--sample-rate', type=float, help='resample to this ADC rate first, default is the file rate')
+    parser.add_argument('--offset', type=float, default=0.0, help='seconds to skip at the start of the file')
+    parser.add_argument('--seconds', type=float, help='seconds of audio to render, default is all of it')
+    parser.add_argument('--fft-size', type=int, default=NUM_SAMPLES)
+    parser.add_argument('--hop-size', type=int, default=HOP_SIZE)
+    parser.add_argument('--window', choices=STFT_WINDOWS, default=FFT_WINDOW)
+    parser.add_argument('--band-scale', choices=BAND_SCALES, default=BAND_SCALE)
+    parser.add_argument('--min-range', type=float, help='auto-gain min_range, default is the visualizer\'s')
+    parser.add_argument('--fps', type=float, help='display frame rate, default is one frame per hop (spectrum) or {} (level)'.format(LEVEL_FRAME_RATE))
+    parser.add_argument('--no-beat-flash', action='store_true', help='leave out the background flash on the beats')
+    parser.add_argument('--layout', help='panel layout file (see Panel_Layout.py) to take the frame size from')
+    parser.add_argument('--gif-scale', type=int, default=10, help='pixels per LED in GIF previews')
+    parser.add_argument('--verify', action='store_true', help='check the batched spectrum against StreamingSTFT')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = ParseArgs(sys.argv[1:])
+    samples, rate = AdcSamples(args.wav, args.input == 'stereo', args.sample_rate, args.offset, args.seconds)
+
+    layout = LoadLayout(args.layout)
+
+    start = time.perf_counter()
+    if args.mode == 'spectrum':
+        min_range = AUTO_GAIN_MIN_RANGE if args.min_range is None else args.min_range
+        flash_color = None if args.no_beat_flash else BEAT_FLASH_COLOR
+        frames, times, beats = SpectrumFrames(samples, rate, args.fft_size, args.hop_size, args.window, args.band_scale, min_range, args.fps,
+                                              width = layout.width, height = layout.height, flash_color = flash_color)
+        frame_rate = args.fps if args.fps is not None else rate / args.hop_size
+    else:
+        frame_rate = LEVEL_FRAME_RATE if args.fps is None else args.fps
+        frames, times = LevelFrames(samples, rate, frame_rate, LEVEL_MIN_RANGE if args.min_range is None else args.min_range,
+                                    layout.width, layout.height)
+    elapsed = time.perf_counter() - start
+    if len(frames) == 0:
+        sys.exit('{} is too short for a single frame'.format(args.wav))
+
+    audio_seconds = len(samples) / rate
+    print('{} frames at {:.1f} fps from {:.1f}s of audio in {:.2f}s ({:.0f}x realtime)'.format(
+        len(frames), frame_rate, audio_seconds, elapsed, audio_seconds / elapsed if elapsed > 0 else float('inf')))
+    if args.mode == 'spectrum':
+        print(beats.Summary())
+
+    if args.verify and args.mode == 'spectrum':
+        reference = StreamingSpectrumFrames(samples, rate, args.fft_size, args.hop_size, args.window, args.band_scale, min_range, args.fps,
+                                            layout.width, layout.height, flash_color)
+        mismatched = int(np.count_nonzero((reference != frames).any(axis=(1, 2, 3))))
+        print('verify: {} of {} frames differ from StreamingSTFT'.format(mismatched, len(frames)))
+
+    SaveFrames(frames, args.output, frame_rate, args.gif_scale)
+    print('saved ' + args.output)
+    sys.exit(1 if args.verify and args.mode == 'spectrum' and mismatched else 0)
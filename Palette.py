@@ -0,0 +1,119 @@
+#Precomputed color lookup tables
+
+#ColorPicker(row_num, state) used to be called for every pixel of every frame, and wheel(pos) redid its
+#branching arithmetic for every value. Everything here is computed once as uint8 tables instead:
+#    row colors     (rows, 2, 3)            [row, on/off] -> color, row 0 is the bottom row
+#    column bitmaps (rows, rows + 1, 3)     [row from the top, bar height] -> color
+#    wheel          (256, 3) or (256, 4)    the rainbow wheel, with a white channel for RGBW strips
+#A whole bar graph frame is then a single gather of the column bitmaps by a vector of column heights.
+#Gradient palettes compile to the same tables.
+import numpy as np
+
+#Same colors ColorPicker used: green for rows 0-4, orange for 5-7, red for 8 and 9, taller panels keep the
+#same proportions (bottom half green, up to 80% orange, red above)
+def DefaultRowColors(rows = 10):
+    row = np.arange(rows)
+    colors = np.empty((rows, 3), dtype=np.uint8)
+    colors[row < rows * 0.5] = (0, 255, 0)
+    colors[(row >= rows * 0.5) & (row < rows * 0.8)] = (255, 128, 0)
+    colors[row >= rows * 0.8] = (255, 0, 0)
+    return colors
+
+#stops is a list of (position, (r, g, b)) with position from 0.0 to 1.0, returns size interpolated colors
+def GradientColors(stops, size):
+    stops = sorted(stops)
+    positions = np.array([p for p, c in stops], dtype=np.float64)
+    colors = np.array([c for p, c in stops], dtype=np.float64)
+    x = np.linspace(0.0, 1.0, size)
+    out = np.empty((size, colors.shape[1]), dtype=np.uint8)
+    for ch in range(colors.shape[1]):
+        out[:, ch] = np.rint(np.interp(x, positions, colors[:, ch]))
+    return out
+
+#(rows, 2, 3) table, [row, 0] is off (black, or the background color) and [row, 1] is on
+def RowColorTable(row_colors, background = None):
+    row_colors = np.asarray(row_colors, dtype=np.uint8)
+    table = np.zeros((len(row_colors), 2, row_colors.shape[1]), dtype=np.uint8)
+    if background is not None:
+        table[:, 0] = background
+    table[:, 1] = row_colors
+    return table
+
+#(rows, rows + 1, 3) table, column [:, h] is a bar of height h with row 0 at the top like the frames
+def ColumnBitmaps(row_colors, background = None):
+    rows = len(row_colors)
+    table = RowColorTable(row_colors, background)
+    lit = np.arange(rows)[:, np.newaxis] < np.arange(rows + 1)[np.newaxis, :] #[y from the bottom, height]
+    bitmaps = table[np.arange(rows)[:, np.newaxis], lit.astype(np.intp)]
+    return np.ascontiguousarray(bitmaps[::-1])
+
+#Number of lit rows per column for normalized magnitudes, row y is lit when y <= magnitude like before
+def BarHeights(mags_normalized, rows = 10):
+    heights = np.floor(mags_normalized) + 1
+    return np.clip(heights, 0, rows).astype(np.intp)
+
+
+class BarPalette:
+    #background is the color of the unlit pixels, black by default
+    def __init__(self, rows = 10, row_colors = None, background = None):
+        if row_colors is None:
+            row_colors = DefaultRowColors(rows)
+        self.rows = rows
+        self.row_colors = RowColorTable(row_colors, background)
+        self.column_bitmaps = ColumnBitmaps(row_colors, background)
+
+    @classmethod
+    def FromGradient(cls, stops, rows = 10):
+        return cls(rows, GradientColors(stops, rows))
+
+    #heights is one bar height per column, returns a (rows, columns, 3) frame
+    def Frame(self, heights, out = None):
+        return np.take(self.column_bitmaps, heights, axis=1, out=out)
+
+
+#Bars over a background that flashes, ie on every beat (see Beat_Detector.py). The background fades through
+#levels precomputed palettes, from black up to color, so a flashing frame costs the same single gather
+class FlashPalette:
+    def __init__(self, rows = 10, color = (0, 0, 64), levels = 16, row_colors = None):
+        color = np.asarray(color, dtype=np.float64)
+        self.levels = levels
+        self.palettes = [BarPalette(rows, row_colors, np.rint(color * level / (levels - 1)).astype(np.uint8)) for level in range(levels)]
+        self.rows = rows
+
+    #flash goes from 0.0 (black background) to 1.0 (background at color)
+    def Frame(self, heights, flash = 0.0, out = None):
+        level = min(max(int(round(flash * (self.levels - 1))), 0), self.levels - 1)
+        return self.palettes[level].Frame(heights, out)
+
+
+#Vectorized version of wheel(pos) from Image_Color_Morph.py: r - g - b - back to r.
+#order is the neopixel pixel_order, strips with a white channel get a fourth, always off, channel.
+def WheelTable(order = 'GRB'):
+    pos = np.arange(256)
+    r = np.zeros(256, dtype=np.int64)
+    g = np.zeros(256, dtype=np.int64)
+    b = np.zeros(256, dtype=np.int64)
+
+    first = pos < 85
+    r[first] = pos[first] * 3
+    g[first] = 255 - pos[first] * 3
+
+    second = (pos >= 85) & (pos < 170)
+    p = pos[second] - 85
+    r[second] = 255 - p * 3
+    b[second] = p * 3
+
+    third = pos >= 170
+    p = pos[third] - 170
+    g[third] = p * 3
+    b[third] = 255 - p * 3
+
+    channels = [r, g, b] if len(order) == 3 else [r, g, b, np.zeros(256, dtype=np.int64)]
+    return np.stack(channels, axis=1).astype(np.uint8)
+
+#256 entry gradient in the same form as WheelTable
+def GradientTable(stops, order = 'GRB'):
+    table = GradientColors(stops, 256)
+    if len(order) == 4:
+        table = np.concatenate((table, np.zeros((256, 1), dtype=np.uint8)), axis=1)
+    return table
@@ -0,0 +1,119 @@
+#Multi-panel layouts
+
+#A layout describes a wall of Zig-Zag wired tiles chained one after another on the data line (ie three 10x10
+#panels making a 30x10 wall, or four making 20x20) and compiles it into one index map, the same kind ZigZagMap
+#builds for a single panel: strip pixel i takes the color of flattened frame pixel index_map[i]. FrameOutput
+#folds that map and the color order into its byte gather, so a frame of any size still goes to the strip with
+#a single np.take, and the visualizers just render into a (height, width, 3) frame.
+
+#Layout files are JSON:
+#    {
+#     "tile_width": 10, "tile_height": 10,
+#     "tiles": [
+#      {"x": 0, "y": 0, "rotation": 0, "origin": [0, 1]},
+#      {"x": 10, "y": 0, "rotation": 180, "origin": [0, 1]}
+#     ]
+#    }
+#Tiles are listed in the order they are chained. x, y is the column and row (row 0 at the top) of the tile's
+#top left corner in the frame, rotation is how far the tile is turned clockwise (0, 90, 180 or 270) and origin
+#is where its first pixel is, as for ZigZagMap, with the tile seen unrotated. A tile can override the size with
+#its own "width" and "height", and the layout can set "width" and "height" to make the frame bigger than the
+#tiles cover (the pixels without a tile are never sent).
+
+#Checking a layout file (prints the strip pixel number of every frame pixel):
+#usage: python Panel_Layout.py layout.json
+import hashlib
+import json
+import os
+import sys
+import numpy as np
+
+from Pixel_Map import ZigZagMap, PANEL_WIDTH, PANEL_HEIGHT, DEFAULT_ORIGIN
+
+TILE_ROTATIONS = (0, 90, 180, 270)
+
+
+class PanelLayout:
+    #tiles is a list of dicts like the ones in a layout file
+    def __init__(self, tiles, tile_width = PANEL_WIDTH, tile_height = PANEL_HEIGHT, width = None, height = None):
+        self.tiles = []
+        for tile in tiles:
+            tile = {
+                'x': int(tile.get('x', 0)),
+                'y': int(tile.get('y', 0)),
+                'rotation': int(tile.get('rotation', 0)) % 360,
+                'origin': tuple(tile.get('origin', DEFAULT_ORIGIN)),
+                'width': int(tile.get('width', tile_width)),
+                'height': int(tile.get('height', tile_height)),
+            }
+            if tile['rotation'] not in TILE_ROTATIONS:
+                raise ValueError('Tile rotation must be one of {}, not {}'.format(TILE_ROTATIONS, tile['rotation']))
+            self.tiles.append(tile)
+        if not self.tiles:
+            raise ValueError('A layout needs at least one tile')
+
+        footprints = [self._Footprint(tile) for tile in self.tiles]
+        self.width = max(x + w for x, y, w, h in footprints) if width is None else width
+        self.height = max(y + h for x, y, w, h in footprints) if height is None else height
+        self.index_map = self._Compile(footprints)
+        self.num_pixels = len(self.index_map)
+        #identifies the mapping in caches (ie Frame_Store.py)
+        self.key = hashlib.sha1('{}x{}'.format(self.width, self.height).encode() + self.index_map.tobytes()).hexdigest()[:12]
+
+    @classmethod
+    def FromDict(cls, config):
+        return cls(config['tiles'], config.get('tile_width', PANEL_WIDTH), config.get('tile_height', PANEL_HEIGHT),
+                   config.get('width'), config.get('height'))
+
+    #(x, y, width, height) the tile covers in the frame, turned tiles swap width and height
+    @staticmethod
+    def _Footprint(tile):
+        if tile['rotation'] in (90, 270):
+            return tile['x'], tile['y'], tile['height'], tile['width']
+        return tile['x'], tile['y'], tile['width'], tile['height']
+
+    def _Compile(self, footprints):
+        frame_index = np.arange(self.width * self.height, dtype=np.intp).reshape(self.height, self.width)
+        covered = np.zeros((self.height, self.width), dtype=bool)
+        tile_maps = []
+        for tile, (x, y, w, h) in zip(self.tiles, footprints):
+            if x < 0 or y < 0 or x + w > self.width or y + h > self.height:
+                raise ValueError('Tile at ({}, {}) does not fit in the {}x{} frame'.format(x, y, self.width, self.height))
+            if covered[y:y + h, x:x + w].any():
+                raise ValueError('Tile at ({}, {}) overlaps another tile'.format(x, y))
+            covered[y:y + h, x:x + w] = True
+
+            #frame pixels under the tile, turned back counterclockwise so they line up with the unrotated tile's rows
+            local = np.rot90(frame_index[y:y + h, x:x + w], tile['rotation'] // 90)
+            tile_maps.append(local.reshape(-1)[ZigZagMap(tile['width'], tile['height'], tile['origin'])])
+
+        index_map = np.concatenate(tile_maps)
+        index_map.flags.writeable = False
+        return index_map
+
+    def Describe(self):
+        strip_pixel = np.full(self.width * self.height, -1, dtype=np.intp)
+        strip_pixel[self.index_map] = np.arange(self.num_pixels)
+        cell = len(str(self.num_pixels - 1))
+        rows = [' '.join(str(p).rjust(cell) if p >= 0 else '.'.rjust(cell) for p in row) for row in strip_pixel.reshape(self.height, self.width)]
+        return '{}x{} frame, {} tiles, {} pixels\n'.format(self.width, self.height, len(self.tiles), self.num_pixels) + '\n'.join(rows)
+
+
+#The original single panel
+def SinglePanel(width = PANEL_WIDTH, height = PANEL_HEIGHT, origin = DEFAULT_ORIGIN):
+    return PanelLayout([{'origin': origin}], width, height)
+
+#Layout from a JSON file, for None the file named by AVE_PANEL_LAYOUT in the environment or else the single 10x10 panel
+def LoadLayout(path = None):
+    if path is None:
+        path = os.environ.get('AVE_PANEL_LAYOUT') or None
+    if path is None:
+        return SinglePanel()
+    with open(path) as f:
+        return PanelLayout.FromDict(json.load(f))
+
+
+if __name__ == '__main__':
+    if(len(sys.argv) < 2):
+        sys.exit('usage: python Panel_Layout.py layout.json')
+    print(LoadLayout(sys.argv[1]).Describe())
@@ -0,0 +1,299 @@
+#Per stage and end to end benchmark of the spectrum and level visualizer pipelines, on simulated hardware
+
+#Every stage runs in isolation against the FakeSpiDev and a SimulatedStrip, for both the original code
+#paths (legacy, see Legacy_Pipeline.py) and the current ones:
+#    acquisition   reading one window of samples from the ADC
+#    fft           magnitude spectrum of the window
+#    bands         averaging the spectrum into columns
+#    normalize     auto-gain of the columns (the legacy code did a fixed -10000 and / 500 inside bands)
+#    colors        turning column heights into an image (ColorPicker / BarPalette)
+#    remap         Zig-Zag remapping of the image
+#    write_show    writing the pixels to the strip and show()
+#    end_to_end    one whole frame
+#The live pipeline reads the ADC in a background thread and only needs hop_size new samples per frame, so its
+#end to end case acquires one hop; end_to_end_window acquires a full window like the legacy code did.
+
+#Results are printed as a table and can be saved as JSON (--json) and compared against an earlier run
+#(--compare), which exits with status 1 if any case got slower than its regression limit.
+#A single run of a case is mostly measuring noise (turbo, caches, other processes), so the iterations of every case
+#are split into --repeats rounds, run one after the other for all the cases so a slow patch of the machine hits
+#them all alike. A case is compared by the median of its per round medians, and its spread is how far those
+#round medians are apart (max - min, relative to the median). The regression limit of a case is --threshold or
+#SPREAD_FACTOR times the larger spread of the two runs, whichever is higher, so noisy cases need a bigger change.
+#usage: python Pipeline_Benchmark.py [--iterations N] [--repeats N] [--json FILE] [--compare FILE] [--filter TEXT]
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+
+import Legacy_Pipeline as legacy
+from Fake_SpiDev import FakeSpiDev
+from Hardware import DefaultSources
+from MCP3004 import MCP3004Reader
+from STFT import StreamingSTFT
+from Stereo_FFT import StereoSpectrum
+from Band_Engine import BandEngine
+from Palette import BarPalette, BarHeights
+from Pixel_Map import RemapFrame
+from Pixel_Output import FrameOutput, SimulatedStrip
+from Auto_Gain import DCTracker, BandNormalizer
+
+SPREAD_FACTOR = 2.0
+
+
+def ParseArgs(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the A.V.E. visualizer pipelines on simulated hardware')
+    parser.add_argument('--iterations', type=int, default=200, help='timed calls per case, over all the rounds')
+    parser.add_argument('--repeats', type=int, default=5, help='rounds every case is timed in')
+    parser.add_argument('--num-samples', type=int, default=1500, help='FFT window size')
+    parser.add_argument('--hop-size', type=int, default=256, help='new samples per frame in the live pipeline')
+    parser.add_argument('--ioctl-latency-us', type=float, default=0.0, help='simulated cost of each SPI transfer')
+    parser.add_argument('--transmit', action='store_true', help='simulate the ~30us per pixel WS2812 transmit in show()')
+    parser.add_argument('--filter', default='', help='only run cases whose name contains this text')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='compare against results previously saved with --json')
+    parser.add_argument('--threshold', type=float, default=0.10, help='smallest relative slowdown of the median reported as a regression')
+    return parser.parse_args(argv)
+
+
+#Per call times in ns of fn, after a few warmup calls
+def Measure(fn, iterations, warmup = 3):
+    for i in range(warmup):
+        fn()
+    times = np.empty(iterations, dtype=np.int64)
+    for i in range(iterations):
+        start = time.perf_counter_ns()
+        fn()
+        times[i] = time.perf_counter_ns() - start
+    return times
+
+#rounds is the per call times of every round
+def Summarize(pipeline, stage, variant, rounds, samples_per_call):
+    times_ns = np.concatenate(rounds)
+    mean_s = times_ns.mean() / 1e9
+    round_p50 = np.array([np.percentile(times, 50) for times in rounds]) / 1e3
+    median = float(np.median(round_p50))
+    return {
+        'name': '{}/{}/{}'.format(pipeline, stage, variant),
+        'pipeline': pipeline,
+        'stage': stage,
+        'variant': variant,
+        'iterations': len(times_ns),
+        'repeats': len(rounds),
+        'median_us': median,
+        'spread': float((round_p50.max() - round_p50.min()) / median) if median > 0 else 0.0,
+        'mean_us': mean_s * 1e6,
+        'p50_us': float(np.percentile(times_ns, 50)) / 1e3,
+        'p90_us': float(np.percentile(times_ns, 90)) / 1e3,
+        'p99_us': float(np.percentile(times_ns, 99)) / 1e3,
+        'frames_per_s': 1.0 / mean_s,
+        'samples_per_s': samples_per_call / mean_s,
+    }
+
+
+class Rig:
+    def __init__(self, args):
+        self.args = args
+        self.spi = FakeSpiDev(DefaultSources(), latency=args.ioctl_latency_us * 1e-6)
+        transmit_time = 100 * 30e-6 if args.transmit else 0.0
+        self.strip = SimulatedStrip(100, transmit_time=transmit_time)
+        self.frame_output = FrameOutput(SimulatedStrip(100, transmit_time=transmit_time), 100, 'GRB', skip_unchanged=False)
+        self.bars = BarPalette(10)
+        self.stereo_fft_method = None #the StereoSpectrum method 'auto' picked, set by SpectrumCases
+
+
+#(pipeline, stage, variant, fn, samples per call) for every case
+def SpectrumCases(rig):
+    n = rig.args.num_samples
+    hop = rig.args.hop_size
+    spi = rig.spi
+    cases = []
+
+    #legacy mono, stage inputs are computed once up front so each stage is timed on its own
+    image = legacy.NewImage()
+    sample, fs = legacy.MonoAcquire(spi, 3, n)
+    fft = legacy.MonoFFT(sample, n)
+    mags = legacy.MonoBands(fft)
+    legacy.MonoColors(mags, image)
+    output = legacy.ZigZag(image)
+    cases += [
+        ('spectrum_mono', 'acquisition', 'legacy', lambda: legacy.MonoAcquire(spi, 3, n), n),
+        ('spectrum_mono', 'fft', 'legacy', lambda: legacy.MonoFFT(sample, n), n),
+        ('spectrum_mono', 'bands', 'legacy', lambda: legacy.MonoBands(fft), 0),
+        ('spectrum_mono', 'colors', 'legacy', lambda: legacy.MonoColors(mags, image), 0),
+        ('spectrum_mono', 'remap', 'legacy', lambda: legacy.ZigZag(image), 0),
+        ('spectrum_mono', 'write_show', 'legacy', lambda: legacy.WriteAndShow(rig.strip, output), 0),
+        ('spectrum_mono', 'end_to_end', 'legacy', lambda: legacy.MonoSpectrumVisualizer(spi, rig.strip, image, 3, n), n),
+    ]
+
+    #current mono
+    reader = MCP3004Reader(spi, (3,))
+    window = reader.Read(n)
+    hop_buf = np.empty((hop, 1), dtype=np.uint16)
+    stft = StreamingSTFT(n, hop)
+    stft.Push(window)
+    spectrum = stft.Spectrum().copy()
+    engine = BandEngine(10)
+    band_mags = engine.Apply(spectrum[0], n)
+    gain = BandNormalizer(10, min_range=200)
+    mags_normalized = gain.Update(band_mags)
+    frame = np.zeros((10, 10, 3), dtype=np.uint8)
+    strip_pixels = RemapFrame(frame)
+    remap_out = np.empty((100, 3), dtype=np.uint8)
+
+    def MonoFrame(num_new):
+        buf = window if num_new == n else hop_buf
+        stft.Push(reader.ReadInto(buf))
+        m = gain.Update(engine.Apply(stft.Spectrum()[0], n))
+        rig.bars.Frame(BarHeights(m), out=frame)
+        rig.frame_output.ShowFrame(frame)
+
+    cases += [
+        ('spectrum_mono', 'acquisition', 'current', lambda: reader.ReadInto(window), n),
+        ('spectrum_mono', 'fft', 'current', lambda: stft.Spectrum(), n),
+        ('spectrum_mono', 'bands', 'current', lambda: engine.Apply(spectrum[0], n), 0),
+        ('spectrum_mono', 'normalize', 'current', lambda: gain.Update(band_mags), 0),
+        ('spectrum_mono', 'colors', 'current', lambda: rig.bars.Frame(BarHeights(mags_normalized), out=frame), 0),
+        ('spectrum_mono', 'remap', 'current', lambda: RemapFrame(frame, out=remap_out), 0),
+        ('spectrum_mono', 'write_show', 'current', lambda: rig.frame_output.Show(strip_pixels), 0),
+        ('spectrum_mono', 'end_to_end', 'current', lambda: MonoFrame(hop), hop),
+        ('spectrum_mono', 'end_to_end_window', 'current', lambda: MonoFrame(n), n),
+    ]
+
+    #legacy stereo, banding and coloring are one stage since the original interleaved them
+    stereo_image = legacy.NewImage()
+    sample_L, sample_R, fs = legacy.StereoAcquire(spi, 1, 2, n)
+    fft_L, fft_R = legacy.StereoFFT(sample_L, sample_R, n)
+    cases += [
+        ('spectrum_stereo', 'acquisition', 'legacy', lambda: legacy.StereoAcquire(spi, 1, 2, n), 2*n),
+        ('spectrum_stereo', 'fft', 'legacy', lambda: legacy.StereoFFT(sample_L, sample_R, n), 2*n),
+        ('spectrum_stereo', 'bands_colors', 'legacy', lambda: legacy.StereoBandsAndColors(fft_L, fft_R, stereo_image), 0),
+        ('spectrum_stereo', 'end_to_end', 'legacy', lambda: legacy.StereoSpectrumVisualizer(spi, rig.strip, stereo_image, 1, 2, n), 2*n),
+    ]
+
+    #current stereo
+    stereo_reader = MCP3004Reader(spi, (1, 2))
+    stereo_window = stereo_reader.Read(n)
+    stereo_hop_buf = np.empty((hop, 2), dtype=np.uint16)
+    stereo_fft = StereoSpectrum(n, 'auto')
+    rig.stereo_fft_method = stereo_fft.method #depends on the machine, so it goes in the metadata instead of the case name
+    stereo_stft = StreamingSTFT(n, hop, 'hann', 2, stereo_fft)
+    stereo_stft.Push(stereo_window)
+    stereo_spectrum = stereo_stft.Spectrum().copy()
+    stereo_engine = BandEngine(5)
+    stereo_gain = BandNormalizer(10, min_range=200)
+
+    def StereoColors(m):
+        m = stereo_gain.Update(m.reshape(-1)).reshape(2, -1)
+        heights = np.concatenate((BarHeights(m[0, ::-1]), BarHeights(m[1])))
+        rig.bars.Frame(heights, out=frame)
+
+    def StereoFrame(num_new):
+        buf = stereo_window if num_new == n else stereo_hop_buf
+        stereo_stft.Push(stereo_reader.ReadInto(buf))
+        StereoColors(stereo_engine.Apply(stereo_stft.Spectrum(), n))
+        rig.frame_output.ShowFrame(frame)
+
+    cases += [
+        ('spectrum_stereo', 'acquisition', 'current', lambda: stereo_reader.ReadInto(stereo_window), 2*n),
+        ('spectrum_stereo', 'fft', 'current', lambda: stereo_stft.Spectrum(), 2*n),
+        ('spectrum_stereo', 'bands_colors', 'current', lambda: StereoColors(stereo_engine.Apply(stereo_spectrum, n)), 0),
+        ('spectrum_stereo', 'end_to_end', 'current', lambda: StereoFrame(hop), 2*hop),
+        ('spectrum_stereo', 'end_to_end_window', 'current', lambda: StereoFrame(n), 2*n),
+    ]
+    return cases
+
+def LevelCases(rig):
+    spi = rig.spi
+    image = legacy.NewImage()
+    frame = np.zeros((10, 10, 3), dtype=np.uint8)
+    mono_dc, mono_gain = DCTracker(1, initial=512), BandNormalizer(1, min_range=20)
+    stereo_dc, stereo_gain = DCTracker(2, initial=512), BandNormalizer(2, min_range=20)
+
+    def MonoLevel():
+        ch_comp = mono_gain.Update(np.abs(mono_dc.Update([legacy.ReadChannel(spi, 3)])))[0]
+        rig.bars.Frame(BarHeights(np.full(10, ch_comp)), out=frame)
+        rig.frame_output.ShowFrame(frame)
+
+    def StereoLevel():
+        l_comp, r_comp = stereo_gain.Update(np.abs(stereo_dc.Update([legacy.ReadChannel(spi, 1), legacy.ReadChannel(spi, 2)])))
+        rig.bars.Frame(BarHeights(np.repeat([l_comp, r_comp], 5)), out=frame)
+        rig.frame_output.ShowFrame(frame)
+
+    return [
+        ('level_mono', 'acquisition', 'legacy', lambda: legacy.ReadChannel(spi, 3), 1),
+        ('level_mono', 'end_to_end', 'legacy', lambda: legacy.MonoLevelVisualizer(spi, rig.strip, image), 1),
+        ('level_mono', 'end_to_end', 'current', MonoLevel, 1),
+        ('level_stereo', 'end_to_end', 'legacy', lambda: legacy.StereoLevelVisualizer(spi, rig.strip, image), 2),
+        ('level_stereo', 'end_to_end', 'current', StereoLevel, 2),
+    ]
+
+
+def GitCommit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def Metadata(args, rig):
+    return {
+        'commit': GitCommit(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'stereo_fft': rig.stereo_fft_method,
+        'args': vars(args),
+    }
+
+def PrintTable(results):
+    print('{:<48} {:>10} {:>7} {:>10} {:>10} {:>11} {:>13}'.format('case', 'median us', 'spread', 'mean us', 'p99 us', 'frames/s', 'samples/s'))
+    for r in results:
+        samples = '{:13.0f}'.format(r['samples_per_s']) if r['samples_per_s'] else '{:>13}'.format('-')
+        print('{:<48} {:10.1f} {:7.1%} {:10.1f} {:10.1f} {:11.1f} {}'.format(r['name'], r['median_us'], r['spread'], r['mean_us'], r['p99_us'], r['frames_per_s'], samples))
+
+#Prints the change in median time of every case that is in both runs against its regression limit, returns the
+#names of the regressions. Results saved before there were rounds only have a mean and no spread
+def Compare(results, old_path, threshold):
+    with open(old_path) as f:
+        old = {r['name']: r for r in json.load(f)['results']}
+    regressions = []
+    print('\nCompared to {}:'.format(old_path))
+    print('{:<48} {:>8} {:>8}'.format('case', 'change', 'limit'))
+    for r in results:
+        if r['name'] not in old:
+            continue
+        before = old[r['name']]
+        change = r['median_us'] / before.get('median_us', before['mean_us']) - 1
+        limit = max(threshold, SPREAD_FACTOR * max(r['spread'], before.get('spread', 0.0)))
+        flag = ''
+        if change > limit:
+            flag = '  REGRESSION'
+            regressions.append(r['name'])
+        print('{:<48} {:+8.1%} {:8.1%}{}'.format(r['name'], change, limit, flag))
+    return regressions
+
+
+if __name__ == '__main__':
+    args = ParseArgs(sys.argv[1:])
+    rig = Rig(args)
+
+    cases = [case for case in SpectrumCases(rig) + LevelCases(rig) if args.filter in '{}/{}/{}'.format(*case[:3])]
+    rounds = [[] for case in cases]
+    iterations = max(1, args.iterations // args.repeats)
+    for repeat in range(args.repeats):
+        for times, (pipeline, stage, variant, fn, samples) in zip(rounds, cases):
+            times.append(Measure(fn, iterations))
+    results = [Summarize(pipeline, stage, variant, times, samples) for times, (pipeline, stage, variant, fn, samples) in zip(rounds, cases)]
+
+    PrintTable(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'metadata': Metadata(args, rig), 'results': results}, f, indent=1)
+    if args.compare and Compare(results, args.compare, args.threshold):
+        sys.exit(1)
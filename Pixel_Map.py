@@ -0,0 +1,49 @@
+#Precomputed pixel mapping tables for Zig-Zag wired neopixel panels
+
+#Neopixels rows are commonly soldered end to end into a Zig-Zag pattern to minimize wiring,
+#but this can make addressing of individual pixels more complicated.
+
+#Instead of walking the panel with nested loops on every frame, the serpentine permutation is built
+#once per panel geometry and origin corner as an integer index array. Remapping a frame is then a
+#single fancy-index on a (height, width, 3) uint8 array, where row 0 is the top of the image (the same
+#layout PIL and numpy use).
+
+#optional arg origin is used to specify (in cartesian coordinates) where the 0th pixel of the frame should be assigned.
+#    (0,0) = bottom left corner
+#    (0,1) = top left corner
+#    (1,0) = bottom right corner
+#    (1,1) = top right corner
+
+#For the particular panel we are using, the first pixel is physically in the bottom right corner.
+import numpy as np
+from functools import lru_cache
+
+PANEL_WIDTH = 10
+PANEL_HEIGHT = 10
+DEFAULT_ORIGIN = (0,1)
+
+#Returns a read only 1D index array of length width*height, strip pixel i takes the color of
+#flattened frame pixel ZigZagMap(...)[i]. Tables are cached, so this is only computed once per geometry.
+@lru_cache(maxsize=None)
+def ZigZagMap(width = PANEL_WIDTH, height = PANEL_HEIGHT, origin = DEFAULT_ORIGIN):
+    index = np.arange(width * height, dtype=np.intp).reshape(height, width)
+
+    #flip into correct orientation
+    if(origin[0] == 1):
+        index = index[:, ::-1]
+    if(origin[1] == 1):
+        index = index[::-1, :]
+
+    index = index.copy()
+    index[0::2] = index[0::2, ::-1] #Even rows need to be flipped horizontally, odd rows can be mapped as is
+
+    index = index.ravel()
+    index.flags.writeable = False
+    return index
+
+#Maps a (height, width, 3) frame to a (height*width, 3) array in strip order.
+#Pass a preallocated out array to avoid allocating a new one every frame.
+def RemapFrame(frame, origin = DEFAULT_ORIGIN, out = None):
+    height, width = frame.shape[:2]
+    index = ZigZagMap(width, height, tuple(origin))
+    return np.take(frame.reshape(height * width, -1), index, axis=0, out=out)
@@ -0,0 +1,58 @@
+#Microbenchmark comparing the precomputed Pixel_Map tables against the old ZigZag implementations
+#usage: python Pixel_Map_Benchmark.py [iterations]
+import sys
+import timeit
+import numpy as np
+
+from Pixel_Map import RemapFrame, ZigZagMap
+#Old ZigZag from Spectrum_Visualizer.py and Level_Visualizer.py takes image[x][y] with y = 0 at the bottom,
+#the PIL based one and ZigZag1D come from Image_Color_Morph.py and Still_Image_Output.py
+from Legacy_Pipeline import ZigZag as LegacyZigZag, ZigZagPIL as LegacyZigZagPIL, ZigZag1D as LegacyZigZag1D
+
+
+def AsTuples(arr):
+    return [tuple(p) for p in arr.tolist()]
+
+#Make sure the new tables produce exactly what the old functions did before timing anything
+def CheckEquivalence(frame):
+    frame_list = AsTuples(frame.reshape(-1, 3))
+    image_xy = [[tuple(frame[9-y][x].tolist()) for y in range(10)] for x in range(10)]
+
+    assert AsTuples(RemapFrame(frame)) == LegacyZigZag(image_xy)
+    assert AsTuples(RemapFrame(frame, origin=(0,0))) == LegacyZigZag1D(frame_list)
+    for origin in [(0,0), (0,1), (1,0), (1,1)]:
+        assert AsTuples(RemapFrame(frame, origin=origin)) == LegacyZigZagPIL(frame_list, origin=origin)
+
+
+def Report(name, seconds, iterations, baseline=None):
+    per_call = seconds / iterations * 1e6
+    line = '{:<32} {:>10.2f} us/frame'.format(name, per_call)
+    if baseline is not None:
+        line += '  ({:.1f}x)'.format(baseline / seconds)
+    print(line)
+
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, size=(10, 10, 3), dtype=np.uint8)
+    CheckEquivalence(frame)
+
+    frame_list = AsTuples(frame.reshape(-1, 3))
+    image_xy = [[tuple(frame[9-y][x].tolist()) for y in range(10)] for x in range(10)]
+    out = np.empty((100, 3), dtype=np.uint8)
+    ZigZagMap() #build the table outside of the timed region, like the visualizers do at startup
+
+    print('ZigZag remap of a 10x10 frame, {} iterations'.format(iterations))
+    t_pil = timeit.timeit(lambda: LegacyZigZagPIL(frame_list), number=iterations)
+    t_2d = timeit.timeit(lambda: LegacyZigZag(image_xy), number=iterations)
+    t_1d = timeit.timeit(lambda: LegacyZigZag1D(frame_list), number=iterations)
+    t_new = timeit.timeit(lambda: RemapFrame(frame), number=iterations)
+    t_new_out = timeit.timeit(lambda: RemapFrame(frame, out=out), number=iterations)
+
+    Report('ZigZag (PIL, Image_Color_Morph)', t_pil, iterations)
+    Report('ZigZag (2D, Spectrum/Level)', t_2d, iterations)
+    Report('ZigZag1D', t_1d, iterations)
+    Report('RemapFrame', t_new, iterations, t_2d)
+    Report('RemapFrame (preallocated out)', t_new_out, iterations, t_2d)
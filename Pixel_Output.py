@@ -0,0 +1,194 @@
+#Bulk framebuffer output to the neopixel strip
+
+#Writing a frame with "for i in range(100): pixels[i] = output[i]" costs 100 __setitem__ calls, each doing
+#color order and brightness conversion in python. FrameOutput keeps its own contiguous uint8 framebuffer
+#already in wire order (ie GRB), with brightness and gamma applied through a 256 entry lookup table, and
+#copies it into the strip's byte buffer in one go right before show().
+
+#Supported strips:
+#    adafruit_pixelbuf based neopixel objects (the bytes live in _post_brightness_buffer)
+#    older neopixel.py objects that keep their bytes in buf
+#    SimulatedStrip below, for measuring without LEDs
+#The strip's own brightness is folded into the lookup table and then set to 1.0, so show() sends the
+#buffer untouched.
+
+#With a layout (see Panel_Layout.py) frames are mapped through the layout's index map instead of the single
+#panel Zig-Zag, so walls of several tiles still take one gather per frame.
+
+#show() is skipped when the new framebuffer is identical to the last one sent (silence, still images),
+#which frees CPU and bus time for acquisition. With refresh_interval set, an unchanged frame is still
+#resent once that many seconds have passed since the last transmit. frames_shown and frames_skipped count both cases.
+import time
+import numpy as np
+from collections import deque
+
+from Pixel_Map import ZigZagMap, DEFAULT_ORIGIN
+
+COLOR_CHANNELS = 'RGBW'
+
+
+#Index of the frame color channel that goes in each wire byte, pixel_order is a neopixel order
+#string (ie 'GRB') or tuple (ie (1, 0, 2), which lists the same thing as indices)
+def WireOrder(pixel_order):
+    if isinstance(pixel_order, str):
+        return np.array([COLOR_CHANNELS.index(ch) for ch in pixel_order], dtype=np.intp)
+    return np.array(pixel_order, dtype=np.intp)
+
+#out = round(255 * brightness * (in / 255) ** gamma)
+def BrightnessLUT(brightness = 1.0, gamma = 1.0):
+    levels = np.arange(256, dtype=np.float64) / 255.0
+    return np.rint(255.0 * brightness * levels ** gamma).astype(np.uint8)
+
+#Writable memoryview of the bytes the strip transmits on show()
+def StripBuffer(strip, num_bytes):
+    buf = getattr(strip, '_post_brightness_buffer', None)
+    if buf is None:
+        buf = strip.buf
+    offset = getattr(strip, '_offset', 0)
+    return memoryview(buf)[offset:offset + num_bytes]
+
+
+class FrameOutput:
+    def __init__(self, strip, num_pixels, pixel_order = 'GRB', brightness = 1.0, gamma = 1.0, skip_unchanged = True, refresh_interval = None, layout = None):
+        if layout is not None and layout.num_pixels != num_pixels:
+            raise ValueError('Layout has {} pixels, the strip {}'.format(layout.num_pixels, num_pixels))
+        self.strip = strip
+        self.num_pixels = num_pixels
+        self.layout = layout
+        self.wire_order = WireOrder(pixel_order)
+        self.bpp = len(self.wire_order)
+
+        brightness *= getattr(strip, 'brightness', 1.0)
+        if getattr(strip, 'brightness', 1.0) != 1.0:
+            strip.brightness = 1.0
+        self.SetBrightness(brightness, gamma)
+
+        self.framebuffer = np.zeros((num_pixels, self.bpp), dtype=np.uint8)
+        self._flat = self.framebuffer.reshape(-1)
+        self._target = StripBuffer(strip, self.framebuffer.nbytes)
+        self._byte_index = {}
+
+        self.skip_unchanged = skip_unchanged
+        self.refresh_interval = refresh_interval
+        self.frames_shown = 0
+        self.frames_skipped = 0
+        self._last_sent = None #bytes of the last transmitted framebuffer
+        self._last_show_time = 0.0
+
+    def SetBrightness(self, brightness, gamma = 1.0):
+        self.brightness = brightness
+        self.gamma = gamma
+        self.lut = BrightnessLUT(brightness, gamma)
+
+    #Index into a flattened (height, width, channels) frame for every wire byte, combining the
+    #Zig-Zag map (or the layout's) with the color order so a frame goes to wire order in a single take
+    def _ByteIndex(self, shape, origin):
+        key = (shape, origin)
+        if key not in self._byte_index:
+            height, width, channels = shape
+            if channels < self.bpp:
+                raise ValueError('{} channel frames cannot drive a {} byte per pixel strip'.format(channels, self.bpp))
+            if self.layout is None:
+                pixel_index = ZigZagMap(width, height, origin)
+            elif (height, width) == (self.layout.height, self.layout.width):
+                pixel_index = self.layout.index_map
+            else:
+                raise ValueError('{}x{} frames do not fit the {}x{} layout'.format(width, height, self.layout.width, self.layout.height))
+            self._byte_index[key] = (pixel_index[:, np.newaxis] * channels + self.wire_order).reshape(-1)
+        return self._byte_index[key]
+
+    #strip_pixels is (num_pixels, 3 or 4) uint8 in RGB(W) order and already in strip order
+    def Write(self, strip_pixels):
+        colors = np.take(strip_pixels, self.wire_order, axis=1)
+        np.take(self.lut, colors, out=self.framebuffer)
+        return self.framebuffer
+
+    #frame is a (height, width, 3 or 4) uint8 image, it gets mapped onto the Zig-Zag panel on the way
+    #(origin is not used with a layout, every tile has its own)
+    def WriteFrame(self, frame, origin = DEFAULT_ORIGIN):
+        index = self._ByteIndex(frame.shape, tuple(origin))
+        np.take(self.lut, np.take(frame.reshape(-1), index), out=self._flat)
+        return self.framebuffer
+
+    #wire_bytes is a whole framebuffer that is already mapped, color ordered and brightness corrected (ie from
+    #Frame_Store.py), it is copied in as is
+    def WriteWire(self, wire_bytes):
+        self._flat[:] = np.frombuffer(wire_bytes, dtype=np.uint8)
+        return self.framebuffer
+
+    #True if the framebuffer matches what was last sent and the refresh interval (if any) has not run out
+    def Unchanged(self, now):
+        if not self.skip_unchanged or self._last_sent is None:
+            return False
+        if self.refresh_interval is not None and now - self._last_show_time >= self.refresh_interval:
+            return False
+        return self._flat.tobytes() == self._last_sent #one memcmp, much cheaper than np.array_equal at this size
+
+    #Sends the framebuffer (after writing strip_pixels into it, if given), returns False if it was skipped
+    def Show(self, strip_pixels = None, force = False):
+        if strip_pixels is not None:
+            self.Write(strip_pixels)
+        now = time.monotonic()
+        if not force and self.Unchanged(now):
+            self.frames_skipped += 1
+            return False
+
+        self._target[:] = self._flat
+        self.strip.show()
+        self._last_sent = self._flat.tobytes()
+        self._last_show_time = now
+        self.frames_shown += 1
+        return True
+
+    def ShowFrame(self, frame, origin = DEFAULT_ORIGIN, force = False):
+        self.WriteFrame(frame, origin)
+        return self.Show(force=force)
+
+    def ShowWire(self, wire_bytes, force = False):
+        self.WriteWire(wire_bytes)
+        return self.Show(force=force)
+
+
+#Stand-in for a neopixel object, pixels[i] = color behaves like adafruit_pixelbuf (color order and
+#brightness done in python per pixel) so the old per-pixel path can be timed against FrameOutput.
+#transmit_time is how long show() blocks, a WS2812 takes about 30us per pixel.
+#With max_frames set, the last max_frames transmitted buffers are kept in frames with their show() times.
+class SimulatedStrip:
+    def __init__(self, num_pixels, brightness = 1.0, pixel_order = 'GRB', transmit_time = 0.0, max_frames = 0):
+        self.num_pixels = num_pixels
+        self.brightness = brightness
+        self.pixel_order = pixel_order
+        self._byteorder = [int(i) for i in np.argsort(WireOrder(pixel_order))] #wire byte of each color channel
+        self.bpp = len(self._byteorder)
+        self.buf = bytearray(num_pixels * self.bpp)
+        self.transmit_time = transmit_time
+        self.shows = 0
+        self.frames = deque(maxlen=max_frames) #(time.monotonic(), bytes in wire order)
+
+    def __len__(self):
+        return self.num_pixels
+
+    def __setitem__(self, index, value):
+        offset = index * self.bpp
+        for ch in range(self.bpp):
+            self.buf[offset + self._byteorder[ch]] = int(value[ch] * self.brightness)
+
+    def __getitem__(self, index):
+        offset = index * self.bpp
+        return tuple(self.buf[offset + self._byteorder[ch]] for ch in range(self.bpp))
+
+    def show(self):
+        if self.transmit_time:
+            time.sleep(self.transmit_time)
+        self.shows += 1
+        if self.frames.maxlen:
+            self.frames.append((time.monotonic(), bytes(self.buf)))
+
+    #Recorded frames as a (num_frames, num_pixels, 3 or 4) uint8 array in RGB(W) order, plus their timestamps
+    def RecordedFrames(self):
+        times = np.array([t for t, buf in self.frames], dtype=np.float64)
+        wire = np.frombuffer(b''.join(buf for t, buf in self.frames), dtype=np.uint8).reshape(-1, self.num_pixels, self.bpp)
+        return wire[:, :, self._byteorder], times
+
+    def deinit(self):
+        pass
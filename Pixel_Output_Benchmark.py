@@ -0,0 +1,56 @@
+#Compares the per-pixel pixels[i] = output[i] loop against FrameOutput, on a SimulatedStrip
+#usage: python Pixel_Output_Benchmark.py [iterations]
+import sys
+import timeit
+import numpy as np
+
+from Pixel_Map import RemapFrame
+from Pixel_Output import FrameOutput, SimulatedStrip
+from Panel_Layout import PanelLayout
+
+
+#What the visualizer scripts used to do every frame
+def PerPixelShow(pixels, frame):
+    output = RemapFrame(frame).tolist()
+    for i in range(100):
+        pixels[i] = output[i]
+    pixels.show()
+
+#Grid of tiles x tiles_high 10x10 panels, every other one turned around, like a chained wall
+def WallLayout(tiles_wide, tiles_high):
+    tiles = [{'x': 10*x, 'y': 10*y, 'rotation': 180 * ((x + y) % 2)} for y in range(tiles_high) for x in range(tiles_wide)]
+    return PanelLayout(tiles)
+
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    frame = np.random.default_rng(0).integers(0, 256, size=(10, 10, 3), dtype=np.uint8)
+
+    legacy_strip = SimulatedStrip(100, brightness=1.0)
+    bulk_strip = SimulatedStrip(100, brightness=1.0)
+    output = FrameOutput(bulk_strip, 100, 'GRB', skip_unchanged=False)
+    skipping_output = FrameOutput(SimulatedStrip(100), 100, 'GRB')
+
+    #same bytes on the wire either way
+    PerPixelShow(legacy_strip, frame)
+    output.ShowFrame(frame)
+    assert legacy_strip.buf == bulk_strip.buf
+
+    t_legacy = timeit.timeit(lambda: PerPixelShow(legacy_strip, frame), number=iterations)
+    t_bulk = timeit.timeit(lambda: output.ShowFrame(frame), number=iterations)
+    print('Frame write + show() of 100 pixels, {} iterations (transmit time not simulated)'.format(iterations))
+    print('{:<28} {:>10.2f} us/frame'.format('pixels[i] = output[i] loop', t_legacy / iterations * 1e6))
+    t_skip = timeit.timeit(lambda: skipping_output.ShowFrame(frame), number=iterations)
+    print('{:<28} {:>10.2f} us/frame  ({:.1f}x)'.format('FrameOutput.ShowFrame', t_bulk / iterations * 1e6, t_legacy / t_bulk))
+    print('{:<28} {:>10.2f} us/frame  ({} shown, {} skipped)'.format('  same frame, dirty check', t_skip / iterations * 1e6,
+        skipping_output.frames_shown, skipping_output.frames_skipped))
+
+    #the layout map is folded into the same single gather, so the cost per pixel stays flat as walls grow
+    print('FrameOutput.ShowFrame through a panel layout, {} iterations'.format(iterations))
+    for tiles_wide, tiles_high in [(1, 1), (3, 1), (2, 2), (5, 4), (10, 10)]:
+        layout = WallLayout(tiles_wide, tiles_high)
+        wall_output = FrameOutput(SimulatedStrip(layout.num_pixels), layout.num_pixels, 'GRB', skip_unchanged=False, layout=layout)
+        wall_frame = np.random.default_rng(0).integers(0, 256, size=(layout.height, layout.width, 3), dtype=np.uint8)
+        t_wall = timeit.timeit(lambda: wall_output.ShowFrame(wall_frame), number=iterations)
+        print('{:<28} {:>10.2f} us/frame  ({:.1f} ns/pixel)'.format('  {}x{} ({} pixels)'.format(layout.width, layout.height, layout.num_pixels),
+            t_wall / iterations * 1e6, t_wall / iterations / layout.num_pixels * 1e9))
@@ -0,0 +1,185 @@
+#Acquisition, DSP and LED output as three supervised processes connected by shared memory
+
+#With the acquisition thread everything still shares one core through the GIL. ProcessPipeline runs each
+#stage in its own process instead:
+#    acquisition  fills blocks of the sample ring from the ADC reader, as fast as the bus allows
+#    dsp          paced by a FrameScheduler, calls render() which reads the sample ring and returns a frame
+#    output       shows every new frame on the strip through a FrameOutput
+#Samples and frames go through SampleRingBuffers in multiprocessing.shared_memory, frames are rows of a
+#uint8 ring with one block per frame. Nothing on the data path is pickled, the only thing passed between
+#processes besides the rings is a semaphore release per frame to wake up the output process.
+
+#The stage processes are forked, so render, the reader and the FrameOutput (and everything they use,
+#ie the module globals of the visualizer script) are inherited as they were when Start() was called.
+#They ignore ctrl-c, the main process supervises them: Wait() returns as soon as any stage exits (or raises
+#KeyboardInterrupt on ctrl-c), and Stop() tells the rest to finish, joins them and frees the shared memory. The output process
+#always runs strip.deinit() on its way out, the same cleanup the single process scripts do.
+import multiprocessing
+import multiprocessing.connection
+import queue
+import signal
+import time
+import traceback
+import numpy as np
+from multiprocessing import shared_memory
+
+from ADC_Acquisition import SampleRingBuffer, DEFAULT_BLOCK_SIZE
+from Frame_Scheduler import FrameScheduler
+
+#Counters the stages keep in shared memory, so any process can read them while running
+STATS = ('blocks_read', 'frames_rendered', 'render_ns', 'frames_shown', 'frames_skipped', 'show_ns', 'latency_ns')
+
+
+#Target of every stage process
+def _RunStage(stage, args):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        stage(*args)
+    except Exception:
+        traceback.print_exc()
+        raise
+
+
+class ProcessPipeline:
+    def __init__(self, channels, capacity, block_size = DEFAULT_BLOCK_SIZE, frame_shape = (10, 10, 3), frame_slots = 4):
+        self._context = multiprocessing.get_context('fork')
+        self.ring = SampleRingBuffer(capacity, channels, block_size, shared=True)
+        self.frames = SampleRingBuffer(frame_slots, int(np.prod(frame_shape)), 1, np.uint8, shared=True)
+        self.frame_shape = tuple(frame_shape)
+
+        self._stats_shm = shared_memory.SharedMemory(create=True, size=8 * len(STATS))
+        self._stats = np.ndarray(len(STATS), np.int64, self._stats_shm.buf)
+        self._stats[:] = 0
+
+        self._stop_event = self._context.Event()
+        self._frame_ready = self._context.Semaphore(0)
+        self._results = self._context.Queue() #one summary line per stage, sent once at shutdown
+        self.processes = []
+        self.summaries = []
+        self.final_stats = None
+
+    def _Count(self, name, value = 1):
+        self._stats[STATS.index(name)] += value
+
+    def _Acquire(self, reader):
+        ring = self.ring
+        stats = self._stats
+        blocks_read = STATS.index('blocks_read')
+        while ring.WaitForDemand(self._stop_event) and not self._stop_event.is_set():
+            reader.ReadInto(ring.NextBlock())
+            ring.PublishBlock(time.monotonic())
+            stats[blocks_read] += 1
+
+    def _Render(self, render, fps, init):
+        if init is not None:
+            init()
+        scheduler = FrameScheduler(fps)
+        frames = self.frames
+        while not self._stop_event.is_set():
+            scheduler.Wait()
+            start = time.perf_counter_ns()
+            frame = render()
+            if frame is None:
+                continue
+            frames.WriteBlock(frame.reshape(1, -1), time.monotonic())
+            self._frame_ready.release()
+            self._Count('render_ns', time.perf_counter_ns() - start)
+            self._Count('frames_rendered')
+        self._results.put('dsp: ' + scheduler.Summary())
+
+    def _Output(self, frame_output):
+        frames = self.frames
+        frame = np.zeros(self.frame_shape, dtype=np.uint8)
+        shown = 0
+        try:
+            while not self._stop_event.is_set():
+                if not self._frame_ready.acquire(timeout=0.1):
+                    continue
+                end = frames.write_count
+                if end == shown: #woken up for a frame that was already shown
+                    continue
+                frames.ReadLatest(1, frame.reshape(1, -1))
+                shown = end
+
+                start = time.perf_counter_ns()
+                frame_output.ShowFrame(frame)
+                self._Count('show_ns', time.perf_counter_ns() - start)
+                self._Count('latency_ns', int((time.monotonic() - frames.block_times[(end - 1) % frames.capacity]) * 1e9))
+                self._stats[STATS.index('frames_shown')] = frame_output.frames_shown
+                self._stats[STATS.index('frames_skipped')] = frame_output.frames_skipped
+            self._results.put('output: Frames shown: {}, skipped (unchanged): {}'.format(frame_output.frames_shown, frame_output.frames_skipped))
+        finally:
+            frame_output.strip.deinit()
+
+    #render() returns the next frame (shape frame_shape) or None when there is nothing new to show
+    #init() is called once at the start of the dsp process, ie to start threads that render() relies on
+    def Start(self, reader, render, frame_output, fps, init = None):
+        stages = [
+            ('acquisition', self._Acquire, (reader,)),
+            ('dsp', self._Render, (render, fps, init)),
+            ('output', self._Output, (frame_output,)),
+        ]
+        for name, stage, args in stages:
+            process = self._context.Process(target=_RunStage, args=(stage, args), name=name, daemon=True)
+            process.start()
+            self.processes.append(process)
+        return self
+
+    #Blocks until any stage exits, returns the names of the stages that are no longer running
+    #Waits in short slices so a KeyboardInterrupt raised from another thread is not held up
+    def Wait(self, timeout = None, poll_interval = 0.2):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        sentinels = [p.sentinel for p in self.processes]
+        while True:
+            wait = poll_interval if deadline is None else min(poll_interval, max(0.0, deadline - time.monotonic()))
+            ready = multiprocessing.connection.wait(sentinels, wait)
+            if ready or (deadline is not None and time.monotonic() >= deadline):
+                return [p.name for p in self.processes if p.sentinel in ready]
+
+    def Stats(self):
+        stats = dict(zip(STATS, self._stats.tolist()))
+        rendered, shown = stats['frames_rendered'], stats['frames_shown'] + stats['frames_skipped']
+        return {
+            'sample_rate': self.ring.SampleRate(),
+            'adc_overruns': self.ring.overruns,
+            'adc_underruns': self.ring.underruns,
+            'frames_rendered': rendered,
+            'frames_shown': stats['frames_shown'],
+            'frames_skipped': stats['frames_skipped'],
+            'frames_dropped': rendered - shown, #rendered but overwritten before the output process got to them
+            'render_mean_us': stats['render_ns'] / rendered / 1e3 if rendered else 0.0,
+            'show_mean_us': stats['show_ns'] / shown / 1e3 if shown else 0.0,
+            'latency_mean_us': stats['latency_ns'] / shown / 1e3 if shown else 0.0,
+        }
+
+    #Stops every stage, killing any that do not finish within timeout, and frees the shared memory
+    def Stop(self, timeout = 2.0):
+        self._stop_event.set()
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        while True:
+            try:
+                self.summaries.append(self._results.get(timeout=0.1))
+            except queue.Empty:
+                break
+
+        self.final_stats = self.Stats()
+        self.ring.Close()
+        self.frames.Close()
+        del self._stats
+        self._stats_shm.close()
+        self._stats_shm.unlink()
+
+    def Summary(self):
+        stats = self.final_stats if self.final_stats is not None else self.Stats()
+        lines = list(self.summaries)
+        lines.append(('ADC overruns: {adc_overruns}, underruns: {adc_underruns}, frames rendered: {frames_rendered}, '
+                      'dropped between processes: {frames_dropped}, render {render_mean_us:.0f}us, show {show_mean_us:.0f}us, '
+                      'render to show latency {latency_mean_us:.0f}us').format(**stats))
+        for process in self.processes:
+            if process.exitcode not in (0, None, -signal.SIGTERM):
+                lines.append('{} stage exited with code {}'.format(process.name, process.exitcode))
+        return '\n'.join(lines)
@@ -0,0 +1,79 @@
+#Streaming short time fourier transform
+
+#Originally every spectrum frame was computed from a fresh, unwindowed block of num_samples, so the frame rate
+#was tied to the FFT size. This keeps a sliding window of the last fft_size samples and produces a new
+#windowed spectrum every hop_size samples, so frames can come much faster than one per FFT size without
+#losing frequency resolution. All the buffers are allocated once up front.
+
+#Windows are periodic and scaled to a mean of 1, so magnitudes stay comparable to the unwindowed FFT the
+#normalization constants in the visualizers were tuned against.
+import numpy as np
+
+STFT_WINDOWS = ('hann', 'blackman', 'rect')
+
+#numpy >= 2.0 can write fft output into a preallocated array
+FFT_HAS_OUT = np.lib.NumpyVersion(np.__version__) >= '2.0.0'
+
+
+def MakeWindow(name, size):
+    if name == 'hann':
+        window = np.hanning(size + 1)[:-1]
+    elif name == 'blackman':
+        window = np.blackman(size + 1)[:-1]
+    elif name == 'rect':
+        window = np.ones(size)
+    else:
+        raise ValueError('Unknown window {!r}, expected one of {}'.format(name, STFT_WINDOWS))
+    return window / window.mean()
+
+
+#|rfft| of each column of a (num_samples, channels) array, same interface as Stereo_FFT.StereoSpectrum
+class RfftSpectrum:
+    def __init__(self, num_samples, channels = 1):
+        num_bins = num_samples // 2 + 1
+        self._spectrum = np.empty((num_bins, channels), dtype=np.complex128)
+        self._magnitudes = np.empty((channels, num_bins), dtype=np.float64)
+
+    def Magnitudes(self, samples):
+        if FFT_HAS_OUT:
+            spectrum = np.fft.rfft(samples, axis=0, out=self._spectrum)
+        else:
+            spectrum = np.fft.rfft(samples, axis=0)
+        np.abs(spectrum.T, out=self._magnitudes)
+        return self._magnitudes
+
+
+class StreamingSTFT:
+    #spectrum is anything with a Magnitudes((fft_size, channels)) method, ie Stereo_FFT.StereoSpectrum,
+    #by default one rfft per channel
+    def __init__(self, fft_size, hop_size, window = 'hann', channels = 1, spectrum = None):
+        if not 0 < hop_size <= fft_size:
+            raise ValueError('hop_size must be between 1 and fft_size')
+        self.fft_size = fft_size
+        self.hop_size = hop_size
+        self.channels = channels
+        self.window = MakeWindow(window, fft_size)[:, np.newaxis]
+        self.spectrum = spectrum if spectrum is not None else RfftSpectrum(fft_size, channels)
+
+        self._input = np.zeros((fft_size, channels), dtype=np.float64) #the last fft_size samples, oldest first
+        self._windowed = np.empty_like(self._input)
+        self._pending = 0 #samples pushed since the last hop
+        self.hops = 0 #total hops completed
+
+    #Appends new samples, shape (n, channels), to the sliding window and returns how many hops they completed
+    def Push(self, samples):
+        n = len(samples)
+        if n >= self.fft_size:
+            self._input[:] = samples[-self.fft_size:]
+        elif n > 0:
+            self._input[:-n] = self._input[n:]
+            self._input[-n:] = samples
+        self._pending += n
+        hops, self._pending = divmod(self._pending, self.hop_size)
+        self.hops += hops
+        return hops
+
+    #Windowed magnitude spectrum of the current window, (channels, fft_size // 2 + 1), reused between calls
+    def Spectrum(self):
+        np.multiply(self._input, self.window, out=self._windowed)
+        return self.spectrum.Magnitudes(self._windowed)
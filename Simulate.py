@@ -0,0 +1,75 @@
+#Runs one of the visualizer scripts, unchanged, on simulated hardware (see Hardware.py)
+#usage: python Simulate.py [--wav FILE] [--seconds N] [--fast] Script.py [script args...]
+#ie:    python Simulate.py --seconds 10 Spectrum_Visualizer.py stereo
+#--seconds stops the script with a KeyboardInterrupt after N seconds, like pressing ctrl-c
+#--fast lets the simulated ADC run as fast as the CPU allows instead of at the real bus rate
+#--record FILE captures every ADC conversion the script reads, --replay FILE feeds a capture back instead of
+#the simulated signal (see ADC_Capture.py), the script stops when the capture runs out. With --fast the capture is
+#replayed at the pace the script reads it, a frame at a time, instead of with the recorded timing, and the frames
+#are rendered back to back without waiting for the frame rate
+import argparse
+import os
+import runpy
+import signal
+import sys
+import threading
+import _thread
+import numpy as np
+
+from Hardware import InstallSimulatedHardware
+from ADC_Capture import InstallRecorder, InstallReplay
+
+
+def ParseArgs(argv):
+    parser = argparse.ArgumentParser(description='Run an A.V.E. script on simulated hardware')
+    parser.add_argument('--wav', help='WAV file to feed the simulated ADC, default is a synthetic test signal')
+    parser.add_argument('--seconds', type=float, help='stop the script after this many seconds')
+    parser.add_argument('--fast', action='store_true', help='do not pace the simulated ADC to the SPI bus rate')
+    parser.add_argument('--record', help='capture the ADC conversions the script reads to this file')
+    parser.add_argument('--replay', help='read the ADC from this capture instead of the simulated signal')
+    parser.add_argument('script')
+    parser.add_argument('script_args', nargs=argparse.REMAINDER)
+    return parser.parse_args(argv)
+
+#Frame rate and timing summary of everything a simulated strip recorded
+def StripReport(strip):
+    frames, times = strip.RecordedFrames()
+    if len(times) < 2:
+        return '{} shows, {} frames recorded'.format(strip.shows, len(times))
+    intervals = np.diff(times) * 1e3
+    return '{} shows, {:.1f} fps, frame interval mean {:.2f}ms p99 {:.2f}ms, {} distinct frames'.format(
+        strip.shows, (len(times) - 1) / (times[-1] - times[0]), intervals.mean(), np.percentile(intervals, 99),
+        len(np.unique(frames.reshape(len(frames), -1), axis=0)))
+
+
+if __name__ == '__main__':
+    args = ParseArgs(sys.argv[1:])
+    hardware = InstallSimulatedHardware(args.wav, realtime=not args.fast)
+    if args.replay is not None:
+        #ctrl-c for the main process, also from the forked stages of the multiprocess pipeline (which ignore it themselves)
+        main_pid = os.getpid()
+        capture, replay_devices = InstallReplay(args.replay, realtime=not args.fast, on_end=lambda: os.kill(main_pid, signal.SIGINT))
+        print('Replaying ' + capture.Summary())
+    if args.record is not None:
+        writer = InstallRecorder(args.record)
+
+    if args.seconds is not None:
+        timer = threading.Timer(args.seconds, _thread.interrupt_main)
+        timer.daemon = True
+        timer.start()
+
+    sys.argv = [args.script] + args.script_args
+    try:
+        runpy.run_path(args.script, run_name='__main__')
+    except (SystemExit, KeyboardInterrupt):
+        pass
+
+    print('MUX modes: ' + ' -> '.join(hardware.gpio.mux_modes))
+    if args.replay is not None:
+        for spi in replay_devices:
+            print(spi.Summary())
+    if args.record is not None:
+        writer.Close()
+        print(writer.Summary())
+    for strip in hardware.strips:
+        print('Strip: ' + StripReport(strip))
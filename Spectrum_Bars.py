@@ -0,0 +1,80 @@
+#Spectrum visualizer settings and the band magnitude to bar height steps, shared by Spectrum_Visualizer.py and Offline_Render.py
+
+#Offline_Render.py is the reference output for the live visualizer, so both take their analysis, band, auto-gain and
+#beat settings and the per frame math from here instead of each keeping a copy that could drift apart.
+import numpy as np
+
+from Band_Engine import BandEngine
+from Auto_Gain import BandNormalizer
+from Palette import FlashPalette, BarHeights
+from Beat_Detector import BeatDetector
+from Pixel_Map import PANEL_WIDTH, PANEL_HEIGHT
+
+NUM_SAMPLES = 1500 #Number of samples per FFT window, needs to be tuned
+HOP_SIZE = 256 #New samples between spectrum frames, the windows overlap so new spectra come at sample rate / hop_size
+
+#Window applied to each FFT frame, one of 'hann', 'blackman' or 'rect' (see STFT.py)
+FFT_WINDOW = 'hann'
+
+#Band layout of the spectrum columns, one of 'linear', 'log', 'mel' or 'custom' (see Band_Engine.py)
+#'custom' widens every column by FRAC_COLUMN_GROWTH over the one before, ie [1 + 0.3*i for every column i] in mono
+BAND_SCALE = 'linear'
+FRAC_COLUMN_GROWTH_MONO = 0.3
+FRAC_COLUMN_GROWTH_STEREO = 0.6
+
+#Smallest floor to peak span of a column in band magnitude, caps the auto-gain so silence stays dark
+#200 lets it go up to 25x the old fixed scale (band_mags / 500 per row)
+AUTO_GAIN_MIN_RANGE = 200
+
+#The background behind the bars flashes this color on every beat and fades out (see Beat_Detector.py), None turns it off.
+#BEAT_SENSITIVITY is how many running deviations over the mean spectral flux make an onset
+BEAT_FLASH_COLOR = (0, 0, 48)
+BEAT_SENSITIVITY = 1.5
+
+
+#Relative column widths for the 'custom' band scale
+def ColumnWidths(columns, growth):
+    return [1 + growth*i for i in range(columns)]
+
+
+#Band magnitudes to bar heights, one column per frame column (half of them per channel in stereo) and one row per frame row
+class SpectrumHeights:
+    def __init__(self, stereo = False, scale = BAND_SCALE, min_range = AUTO_GAIN_MIN_RANGE, width = PANEL_WIDTH, height = PANEL_HEIGHT, sensitivity = BEAT_SENSITIVITY):
+        self.stereo = stereo
+        self.height = height
+        #bin to column weights are precomputed once and only rebuilt if the window or sample rate changes
+        if stereo:
+            columns = width // 2
+            self.bands = BandEngine(columns, scale, ColumnWidths(columns, FRAC_COLUMN_GROWTH_STEREO))
+            num_bands = 2 * columns
+        else:
+            self.bands = BandEngine(width, scale, ColumnWidths(width, FRAC_COLUMN_GROWTH_MONO))
+            num_bands = width
+        #Streaming auto-gain, every column is mapped between its tracked noise floor and peak (see Auto_Gain.py)
+        self.gain = BandNormalizer(num_bands, height, min_range = min_range)
+        #Onsets, tempo and a beat clock from the spectral flux of the same band magnitudes (see Beat_Detector.py)
+        self.beats = BeatDetector(num_bands, sensitivity)
+        self.stereo_gap = np.zeros(width % 2, dtype=np.intp) #an odd middle column stays dark in stereo
+
+    #band_mags is (channels, columns), now the time of the frame (None for time.monotonic()), returns the bar height of every frame column
+    def Heights(self, band_mags, now = None):
+        if self.stereo:
+            #L and R are scaled together so the balance is kept, left channel mirrored so the lows meet in the middle
+            mags_normalized_L, mags_normalized_R = self.gain.Update(band_mags.reshape(-1), now).reshape(2, -1)
+            self.beats.Update(band_mags, now)
+            return np.concatenate((BarHeights(mags_normalized_L[::-1], self.height), self.stereo_gap, BarHeights(mags_normalized_R, self.height)))
+        #scaling each column between its running noise floor and peak also takes care of the DC and low frequency
+        #energy that used to swamp column 0
+        mags_normalized = self.gain.Update(band_mags[0], now)
+        self.beats.Update(band_mags[0], now)
+        return BarHeights(mags_normalized, self.height)
+
+    #How far the background flash is faded in at now, 0.0 when flash_color is None
+    def Flash(self, now = None, flash_color = BEAT_FLASH_COLOR):
+        return self.beats.Pulse(now) if flash_color is not None else 0.0
+
+
+#Colors of each row when lit (green, orange then red at the top), see Palette.py for gradients. The unlit background
+#fades through precomputed palettes for the beat flash, flash_color None is no flash (a black background)
+def SpectrumPalette(height, flash_color = BEAT_FLASH_COLOR):
+    return FlashPalette(height, flash_color if flash_color is not None else (0, 0, 0))
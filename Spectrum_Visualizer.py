@@ -1,16 +1,61 @@
 #script to test ability to sample and perform fft in realtime
 #prints the dominant frequency of the current sampling window
 import spidev
-import time
 import sys
 import neopixel
 import board
 import wiringpi
 import numpy as np
-from collections import deque
-
-
-FRAC_COLUMN_WIDTHS_MONO = [1 + 0.3*i for i in range(10)]
+from Pixel_Output import FrameOutput
+from ADC_Acquisition import StartBulkAcquisition, SampleRateEstimator
+from MCP3004 import MCP3004Reader
+from Stereo_FFT import StereoSpectrum
+from STFT import StreamingSTFT
+from Goertzel_Bands import GoertzelBands
+from Half_FFT_Bands import HalfFFTBands
+from Frame_Scheduler import FrameScheduler
+from Metrics import StartMetrics
+from Process_Pipeline import ProcessPipeline
+from Panel_Layout import LoadLayout
+from Spectrum_Bars import SpectrumHeights, SpectrumPalette, NUM_SAMPLES, HOP_SIZE, FFT_WINDOW, BAND_SCALE, AUTO_GAIN_MIN_RANGE, BEAT_FLASH_COLOR
+
+
+#Panel layout file (see Panel_Layout.py), None uses $AVE_PANEL_LAYOUT or else the single 10x10 panel. The spectrum gets one column per
+#frame column (half of them per channel in stereo) and one row per frame row
+PANEL_LAYOUT = None
+layout = LoadLayout(PANEL_LAYOUT)
+
+#The FFT size, hop, window, band layout, auto-gain and beat flash settings are in Spectrum_Bars.py, which
+#Offline_Render.py renders with too, so its output stays the reference for this script
+
+#How the stereo spectra are computed, 'packed' (one complex FFT of L + jR), 'rfft' (one per channel)
+#or 'auto' to time both at startup and use the faster one on this CPU (see Stereo_FFT.py)
+STEREO_FFT = 'auto'
+
+#Run ADC acquisition, FFT/banding and LED output as three processes sharing memory (see Process_Pipeline.py)
+#instead of one process with an acquisition thread. Turned on by passing multiprocess after the input, ie:
+#python Spectrum_Visualizer.py stereo multiprocess
+MULTIPROCESS = 'multiprocess' in sys.argv[2:]
+
+#Spectrum analysis engine, 'fft' computes the whole spectrum of every window and averages it into the columns.
+#The other two only compute some of the bins, which is lighter on slow CPUs like the Pi Zero (time them there with
+#Goertzel_Bands_Benchmark.py), picked by passing their name after the input, ie:
+#python Spectrum_Visualizer.py stereo goertzel
+#'goertzel' keeps GOERTZEL_BINS_PER_BAND bins per column up to date with a sliding DFT as samples arrive (see
+#Goertzel_Bands.py), the fewest bins but the columns flicker more than with the FFT and can miss a pure tone
+#'half_fft' gets every other bin from a half size FFT and fills in the ones between (see Half_FFT_Bands.py), within a
+#few percent of the FFT. Columns narrower than HALF_FFT_EXACT_BINS bins get all their bins computed instead, it ships
+#off (0) since it costs about as much as it saves, 8 covers the lowest few columns of the 'log' band scale
+SPECTRUM_ENGINE = 'goertzel' if 'goertzel' in sys.argv[2:] else 'half_fft' if 'half_fft' in sys.argv[2:] else 'fft'
+GOERTZEL_BINS_PER_BAND = 4
+HALF_FFT_EXACT_BINS = 0
+
+#Per stage timings, frame/sample rates and drop counters (see Metrics.py), cheap enough to leave on
+#Logged as a JSON line every METRICS_LOG_INTERVAL seconds and served on METRICS_ADDRESS (a localhost port or
+#Unix socket path), None turns either off. AVE_METRICS=0 in the environment disables everything
+METRICS = True
+METRICS_LOG_INTERVAL = 30
+METRICS_ADDRESS = None
 
 #ADC Channel list:
 # channel | Input
@@ -20,152 +65,69 @@ FRAC_COLUMN_WIDTHS_MONO = [1 + 0.3*i for i in range(10)]
 #       2 | AUX R
 #       3 | AUX MONO
 
-#function to read SPI data from mcp3004
-def ReadChannel(channel):
-    adc = spi.xfer2([1,(8+channel)<<4, 0])
-    data = ((adc[1]&3) << 8) + adc[2]
-    return data
-
-#function to set color of pixels based on row height
-def ColorPicker(row_num, state):
-    if (not state):
-        return (0, 0, 0)
-    elif (row_num <= 4):
-        return (0, 255, 0)
-    elif (row_num >= 5 and row_num <= 7):
-        return (255, 128, 0)
-    else: #row_num = 8 or 9
-        return(255, 0, 0)
-
-#Neopixels are physically soldered into a Zig-Zag pattern to minimize wiring,
-#but this messes up addressing on neopixel software object.
-    
-#This function takes a 2D array of tuples, which is easier to visualize, and flips rows needed to
-#produce desired output on Zig-Zagged neopixel panel, returning a 1D array to be outputted
-def ZigZag(input_arr):
-    output_arr = [(0,0,0) for i in range(100)]
-
-    for y in range(10):
-        for x in range(10):
-            if( y % 2 == 0):# Even rows need to be flipped horizontally
-                output_arr[(10*y) + x] = input_arr[9-x][y]
-            else: #Odd rows can be mapped as is
-                output_arr[(10*y) + x] = input_arr[x][y]
-    return output_arr
-
 
 
-def MonoSpectrumVisualizer():
-    #Sample time and ADC value from channel
-    sample_tuples = [(time.time(), ReadChannel(adc_ch)) for i in range(num_samples)]
+#Averages fft_mags into the columns of spectrum.bands, or with the goertzel and half_fft engines (fft_mags is None)
+#reads the band magnitudes straight off their bins, returns (channels, columns)
+def SpectrumBands(fft_mags, sampling_frequency):
+    if(fft_mags is None):
+        return stft.Bands(sampling_frequency)
+    return spectrum.bands.Apply(fft_mags, num_samples, sampling_frequency)
 
-    #Separate time and sample values
-    start_time = sample_tuples[0][0]
-    times = [t[0]-start_time for t in sample_tuples]
-    sample = [t[1] for t in sample_tuples]
 
-    sampling_frequency = num_samples/times[-1]
-
-    #Perform FFT
-    fft = np.fft.fft(sample)
-    fft = fft[:num_samples // 2] #We only care about the first half since FFT is symmetric
-
-    # x = np.argsort(fft[:num_samples // 2])
-    # dom_f = (x[0] / num_samples) * sampling_frequency
-    # x_max = abs(fft[x[0]])
-    # print(dom_f, x_max)
+#fft_mags is the latest windowed magnitude spectrum from the STFT, shape (1, num_samples // 2 + 1), None with the goertzel and half_fft engines
+def MonoSpectrumVisualizer(fft_mags):
+    sampling_frequency = sample_rate.Update()
 
     #Generate Image:
 
-    #Divide the FFT bandwidth (10 kHz) into 10 output bands, one for each column of the array
-    #Currently they're just divided evenly, but in the future the widtch of each output band will be
-    #tuned to have the most movement on the LED matrix
-    column_bw = len(fft) // 10
-
-    for x in range(10):
-        #Average the magnitudes of the frequencies in each output band
-        band_mag = np.mean( [ abs(fft[x*column_bw+w]) for w in range(column_bw) ] )
-        if(x == 0):
-            #lowest frequencies always seem to have MUCH higher magnitude than the rest, this just makes it look nicer
-            #Will be tuned in the future
-            band_mag -= 10000
-
-        #This normalization value will need to be tuned as well
-        mag_normalized = band_mag / 500 # normalize to value between 0 and 10 to compare against row height 
+    #Average the FFT magnitudes into output bands, one for each column of the array
+    #The width of each output band is picked with BAND_SCALE, see Band_Engine.py
+    band_mags = SpectrumBands(fft_mags, sampling_frequency)
+    metrics.Lap('bands')
 
-        #turn on neopixels in each respective column
-        for y in range(10):
-            if (y <= mag_normalized):
-                image[x][y] = ColorPicker(y, 1)
-            else:
-                image[x][y] = ColorPicker(y, 0)
+    #scale each column between its running noise floor and peak and feed the beat detector (see Spectrum_Bars.py),
+    #then turn on neopixels in each respective column, one lookup in the precomputed column bitmaps
+    bars.Frame(spectrum.Heights(band_mags), spectrum.Flash(flash_color = BEAT_FLASH_COLOR), out=image)
+    metrics.Lap('render')
 
 
-    output = ZigZag(image)
-
-    for i in range(100):
-        pixels[i] = output[i]
-
-    pixels.show()
-
-
-def StereoSpectrumVisualizer():
-    #Sample time and ADC value from channel
-    sample_tuples = [(time.time(), ReadChannel(adc_ch_L), ReadChannel(adc_ch_R)) for i in range(num_samples)]
-
-    #Separate time and sample values
-    start_time = sample_tuples[0][0]
-    times = [t[0]-start_time for t in sample_tuples]
-    sample_L = [t[1] for t in sample_tuples]
-    sample_R = [t[2] for t in sample_tuples]
-
-    sampling_frequency = num_samples/times[-1]
-
-    #Perform FFT
-    fft_L = np.fft.fft(sample_L)
-    fft_L = fft_L[1:num_samples // 2] #We only care about the first half since FFT is symmetric
-    
-    fft_R = np.fft.fft(sample_R)
-    fft_R = fft_R[1:num_samples // 2]
-    
+#fft_mags is the latest windowed L/R magnitude spectrum from the STFT, shape (2, num_samples // 2 + 1), None with the goertzel and half_fft engines
+def StereoSpectrumVisualizer(fft_mags):
+    sampling_frequency = sample_rate.Update()
 
     #Generate Image:
-    #AUX_L Spectrum will be on left half of the image, AUX_R Spectrum on the right half (5 columns each)
-    #Spectrums will mirror each other, with lowest frequencies in the middle of the image
-    #Divide the each FFT bandwidth (5 kHz per channel) into 5 output bands, one per column
-    #Currently they're just divided evenly, but in the future the width of each output band will be
-    #tuned to have the most movement on the LED matrix
-    column_bw = len(fft_L) // 5 #len(fft_L) == len(fft_R)
-    column
-
-
-    for y in range(10):
-        for x in range(5): 
-            #Average the magnitudes of the frequencies in each output band
-            band_mag_L = np.mean( [ abs(fft_L[x*column_bw+w]) for w in range(column_bw) ] )
-            band_mag_R = np.mean( [ abs(fft_R[x*column_bw+w]) for w in range(column_bw) ] )
-            if(x == 0):
-                #lowest frequencies always seem to have MUCH higher magnitude than the rest, this just makes it look nicer
-                #Will be tuned in the future
-                band_mag_L -= 10000
-                band_mag_R -= 10000
-
-            #This normalization value will need to be tuned as well
-            mag_normalized_L = band_mag_L / 500 # normalize to value between 0 and 10 to compare against row height 
-            mag_normalized_R = band_mag_R / 500
-            #turn on neopixels in each respective column
-            if(mag_normalized_L < y)
-                image[4 - x][y] = ColorPicker(y, 1)
-            if(mag_normalized_R < y)
-                image[5 + x][y] = ColorPicker(y, 0)
-
-
-    output = ZigZag(image)
-
-    for i in range(100):
-        pixels[i] = output[i]
-
-    pixels.show()
+    #AUX_L Spectrum will be on left half of the image, AUX_R Spectrum on the right half
+    #Spectrums will mirror each other, with lowest frequencies in the middle of the image (an odd middle column stays dark)
+    #Average the FFT magnitudes of both channels into output bands, one per column of their half
+    #The band means are computed once per frame, not once per row
+    band_mags = SpectrumBands(fft_mags, sampling_frequency)
+    metrics.Lap('bands')
+
+    #scale each column between its running noise floor and peak, L and R together so the balance is kept, then
+    #turn on neopixels in each respective column, left channel mirrored so the lows meet in the middle
+    bars.Frame(spectrum.Heights(band_mags), spectrum.Flash(flash_color = BEAT_FLASH_COLOR), out=image)
+    metrics.Lap('render')
+
+
+#Feeds whatever was sampled since last time into the STFT and draws the next image
+#returns None until a whole hop of new samples is in
+def RenderFrame():
+    metrics.BeginFrame()
+    if(stft.Push(ring.ReadNew(sample_buf, hop_size)) == 0):
+        return None
+    metrics.Lap('read')
+    if(SPECTRUM_ENGINE != 'fft'):
+        fft_mags = None #the bins are already up to date, the bands are read off them in the visualizer
+    else:
+        fft_mags = stft.Spectrum()
+        metrics.Lap('fft')
+
+    if(isStereo):
+        StereoSpectrumVisualizer(fft_mags)
+    else: #MONO AUX or MIC Input
+        MonoSpectrumVisualizer(fft_mags)
+    return image
 
 
 
@@ -220,24 +182,116 @@ spi.max_speed_hz=1000000
 
 #Configure NeoPixel Strip
 pixel_pin = board.D18
-num_pixels = 100
+num_pixels = layout.num_pixels
 ORDER = neopixel.GRB
 
-num_samples = 1500 #Number of samples taken per loop, needs to be tuned and hopefully multiprocessing helps
+num_samples = NUM_SAMPLES
+hop_size = HOP_SIZE
+FRAME_RATE = 60 #target frames per second, should be at or below sample rate / hop_size
+
+#Bands, auto-gain and beat detection of the columns, the same steps Offline_Render.py takes (see Spectrum_Bars.py)
+spectrum = SpectrumHeights(isStereo, BAND_SCALE, AUTO_GAIN_MIN_RANGE, layout.width, layout.height)
+
+#The STFT slides a window of num_samples over the sample stream and produces a new spectrum every hop_size samples
+#The goertzel and half_fft engines slide the same window, but only compute the bins they average into the columns
+if(SPECTRUM_ENGINE == 'goertzel'):
+    stft = GoertzelBands(num_samples, hop_size, spectrum.bands, FFT_WINDOW, 2 if isStereo else 1, GOERTZEL_BINS_PER_BAND)
+elif(SPECTRUM_ENGINE == 'half_fft'):
+    stft = HalfFFTBands(num_samples, hop_size, spectrum.bands, FFT_WINDOW, 2 if isStereo else 1, HALF_FFT_EXACT_BINS)
+elif(isStereo):
+    stft = StreamingSTFT(num_samples, hop_size, FFT_WINDOW, 2, StereoSpectrum(num_samples, STEREO_FFT))
+else:
+    stft = StreamingSTFT(num_samples, hop_size, FFT_WINDOW)
 
 pixels = neopixel.NeoPixel(pixel_pin, num_pixels, brightness=0.2, auto_write = False, pixel_order=ORDER)
+#brightness is applied through a lookup table in FrameOutput, which then writes whole frames to the strip
+frame_output = FrameOutput(pixels, num_pixels, ORDER, layout = layout)
+
+#image[row][column] with row 0 at the top of the panel, bar heights are counted up from the bottom row
+image = np.zeros((layout.height, layout.width, 3), dtype=np.uint8)
 
-image = [[(0, 0, 0) for x in range(10)] for y in range(10)]
+#Colors of each row when lit, the unlit background fades through precomputed palettes for the beat flash
+bars = SpectrumPalette(layout.height, BEAT_FLASH_COLOR)
+
+#Start sampling in the background, the ring buffer holds a few windows so the render loop never waits on the ADC.
+#Each block of samples is read with one batched SPI transfer instead of a ReadChannel call per sample
+if(isStereo):
+    adc_reader = MCP3004Reader(spi, (adc_ch_L, adc_ch_R))
+else:
+    adc_reader = MCP3004Reader(spi, (adc_ch,))
+if(MULTIPROCESS):
+    #the ring lives in shared memory, acquisition only starts with the other processes below
+    pipeline = ProcessPipeline(len(adc_reader.channels), 4*num_samples, block_size = 128, frame_shape = image.shape)
+    ring = pipeline.ring
+else:
+    acquisition = StartBulkAcquisition(adc_reader, 4*num_samples, block_size = 128)
+    ring = acquisition.ring
+    ring.WaitForSamples(num_samples)
+sample_buf = np.empty((num_samples, ring.channels), dtype=np.uint16)
+#the sample rate picks the FFT bins of each column, it is fitted over many block timestamps and smoothed so
+#timing jitter doesn't shift the bands from frame to frame
+sample_rate = SampleRateEstimator(ring)
+
+
+if(MULTIPROCESS):
+    #The dsp process paces itself with its own FrameScheduler, metrics are kept and published from there, which is where the frames are rendered
+    def StartRenderMetrics():
+        global reporter, metrics
+        reporter = StartMetrics(METRICS, METRICS_LOG_INTERVAL, METRICS_ADDRESS)
+        metrics = reporter.metrics
+        metrics.AddSource('pipeline', pipeline.Stats)
+        metrics.AddSource('beat', spectrum.beats.Stats)
+
+    def RenderAndCount():
+        frame = RenderFrame()
+        if(frame is not None):
+            metrics.EndFrame()
+        return frame
+
+    pipeline.Start(adc_reader, RenderAndCount, frame_output, FRAME_RATE, StartRenderMetrics)
+    try:
+        stopped = pipeline.Wait()
+        print('Pipeline stage exited: ' + ', '.join(stopped))
+    except KeyboardInterrupt:
+        pass
+    #the output process has already deinitialized the strip by the time Stop() returns
+    pipeline.Stop()
+    print(pipeline.Summary())
+    wiringpi.digitalWrite(E_pin, 1) #disable MUX output
+    sys.exit()
 
 
+#Paces the render loop on monotonic deadlines, frames that overrun are dropped rather than piling up
+scheduler = FrameScheduler(FRAME_RATE)
+
+#counters the objects above already keep are only read when the metrics are published
+reporter = StartMetrics(METRICS, METRICS_LOG_INTERVAL, METRICS_ADDRESS)
+metrics = reporter.metrics
+metrics.AddSource('adc', lambda: {'sample_rate': ring.SampleRate(), 'sample_rate_smoothed': sample_rate.rate, 'overruns': ring.overruns, 'underruns': ring.underruns})
+metrics.AddSource('scheduler', scheduler.Stats)
+metrics.AddSource('beat', spectrum.beats.Stats)
+metrics.AddSource('output', lambda: {'frames_shown': frame_output.frames_shown, 'frames_skipped': frame_output.frames_skipped})
+
 try:
     while True:
-        if(isStereo):
-            StereoSpectrumVisualizer()
-        else: #MONO AUX or MIC Input
-            MonoSpectrumVisualizer()
+        scheduler.Wait()
+
+        #Only show once the STFT has a new spectrum
+        if(RenderFrame() is None):
+            continue
+
+        #flip image onto the Zig-Zag panel and update the strip in one bulk write
+        frame_output.ShowFrame(image)
+        metrics.Lap('show')
+        metrics.EndFrame()
 
 except KeyboardInterrupt:
+    acquisition.Stop()
+    reporter.Stop()
+    print('ADC overruns: {}, underruns: {}'.format(ring.overruns, ring.underruns))
+    print(scheduler.Summary())
+    print(spectrum.beats.Summary())
+    print('Frames shown: {}, skipped (unchanged): {}'.format(frame_output.frames_shown, frame_output.frames_skipped))
     pixels.deinit()
     wiringpi.digitalWrite(E_pin, 1) #disable MUX output
     sys.exit()
@@ -0,0 +1,71 @@
+#Stereo magnitude spectra from a single FFT
+
+#L and R are both real, so they can be packed into one complex signal z = L + jR and transformed with a
+#single FFT. Conjugate symmetry then separates the two spectra again:
+#    L[k] = (Z[k] + conj(Z[n-k])) / 2
+#    R[k] = (Z[k] - conj(Z[n-k])) / 2j
+#Which of this and two plain rffts is faster depends on the CPU and numpy build, so 'auto' times both
+#once at startup and keeps the winner.
+
+#Methods:
+#    'packed' = one complex FFT of L + jR
+#    'rfft'   = one rfft per channel
+#    'auto'   = whichever of the two measures faster on this machine
+import timeit
+import numpy as np
+
+STEREO_FFT_METHODS = ('packed', 'rfft', 'auto')
+
+
+class StereoSpectrum:
+    def __init__(self, num_samples, method = 'auto'):
+        if method not in STEREO_FFT_METHODS:
+            raise ValueError('Unknown stereo FFT method {!r}, expected one of {}'.format(method, STEREO_FFT_METHODS))
+        self.num_samples = num_samples
+        num_bins = num_samples // 2 + 1
+        #preallocated so the steady state only allocates inside numpy's fft
+        self._packed = np.empty(num_samples, dtype=np.complex128)
+        self._mirror = (-np.arange(num_bins)) % num_samples #n-k, with bin 0 mapping to itself
+        self._sum = np.empty(num_bins, dtype=np.complex128)
+        self._magnitudes = np.empty((2, num_bins), dtype=np.float64)
+
+        if method == 'auto':
+            method = self.PickFastest()
+        self.method = method
+
+    def Packed(self, samples):
+        z = self._packed
+        z.real = samples[:, 0]
+        z.imag = samples[:, 1]
+        spectrum = np.fft.fft(z)
+        head = spectrum[:len(self._mirror)]
+        mirror = np.conj(spectrum[self._mirror])
+        np.add(head, mirror, out=self._sum)
+        np.abs(self._sum, out=self._magnitudes[0])
+        np.subtract(head, mirror, out=self._sum)
+        np.abs(self._sum, out=self._magnitudes[1])
+        self._magnitudes *= 0.5
+        return self._magnitudes
+
+    def Rfft(self, samples):
+        np.abs(np.fft.rfft(samples, axis=0).T, out=self._magnitudes)
+        return self._magnitudes
+
+    #samples has shape (num_samples, 2) (L, R columns, as read from the ring buffer)
+    #returns |rfft| of both channels as a (2, num_samples // 2 + 1) array, which is reused between calls
+    def Magnitudes(self, samples):
+        if self.method == 'packed':
+            return self.Packed(samples)
+        return self.Rfft(samples)
+
+    #Seconds per call of each method on a representative window
+    def TimeMethods(self, repeats = 200):
+        samples = np.random.default_rng(0).integers(0, 1024, size=(self.num_samples, 2)).astype(np.uint16)
+        return {
+            'packed': min(timeit.repeat(lambda: self.Packed(samples), number=repeats, repeat=3)) / repeats,
+            'rfft': min(timeit.repeat(lambda: self.Rfft(samples), number=repeats, repeat=3)) / repeats,
+        }
+
+    def PickFastest(self, repeats = 200):
+        times = self.TimeMethods(repeats)
+        return min(times, key=times.get)
@@ -0,0 +1,27 @@
+#Times the packed single-FFT stereo path against two rffts for a few window sizes
+#usage: python Stereo_FFT_Benchmark.py [num_samples ...]
+import sys
+import numpy as np
+
+from Stereo_FFT import StereoSpectrum
+
+
+#Both methods have to agree with two independent rffts before timing anything
+def CheckEquivalence(num_samples):
+    samples = np.random.default_rng(1).integers(0, 1024, size=(num_samples, 2)).astype(np.uint16)
+    expected = np.abs(np.fft.rfft(samples.T.astype(np.float64), axis=-1))
+    spectrum = StereoSpectrum(num_samples, 'rfft')
+    assert np.allclose(spectrum.Packed(samples), expected)
+    assert np.allclose(spectrum.Rfft(samples), expected)
+
+
+if __name__ == '__main__':
+    sizes = [int(n) for n in sys.argv[1:]] or [512, 1024, 1500, 2048, 4096]
+
+    print('{:>8} {:>14} {:>14}  {}'.format('samples', 'packed (us)', 'rfft (us)', 'auto picks'))
+    for num_samples in sizes:
+        CheckEquivalence(num_samples)
+        spectrum = StereoSpectrum(num_samples, 'rfft')
+        times = spectrum.TimeMethods()
+        fastest = min(times, key=times.get)
+        print('{:>8} {:>14.1f} {:>14.1f}  {}'.format(num_samples, times['packed'] * 1e6, times['rfft'] * 1e6, fastest))
@@ -1,77 +1,48 @@
 import sys
 import neopixel
 import board
-from PIL import Image
+from Pixel_Output import FrameOutput
+from Frame_Store import FrameStore, DEFAULT_STORE_DIR
+from Panel_Layout import LoadLayout
+from Frame_Scheduler import FrameScheduler
 
-#Neopixels rows are commonly soldered end to end  into a Zig-Zag pattern to minimize wiring,
-#but this can make addressing of individual pixels more complicated
+#Frames are remapped onto the Zig-Zag wired panel and written to the strip by FrameOutput (Pixel_Output.py)
 
-#This function is an output driver for our neopixel panel, it takes a 1 or 2 dimensional list  as input,
-#flips the necessary rows to generate proper output, and returns a 1 dimensional list that can be directly
-#copied to the neopixel object.
-#optional arg origin is used to specify (in cartesian coordinates) where the 0th pixel of input_arr should be assigned.
-#    (0,0) = bottom left corner
-#    (0,1) = top left corner
-#    (1,0) = bottom right corner
-#    (1,1) = top right corner
+#Images are rendered once into a memory-mapped frame store (Frame_Store.py) and shown straight from there,
+#PIL is only loaded for images that are new or have changed since they were stored.
+#usage: python Still_Image_Output.py image [image ...]
+#With more than one image they are shown in turn, IMAGE_INTERVAL seconds each, until ctrl-c
 
-#For the particular panel we are using, the first pixel is physically in the bottom right corner.
-def ZigZag(input_lst, is1D = True, origin = (0,1) ):
-    output_lst = [(0,0,0) for i in range(100)]
-    im = Image.new(mode='RGB', size=(10,10))
-
-    if (is1D):
-        input_lst_cp = input_lst
-    else: #2D array input
-        input_lst_cp = [input_lst[x][y] for x in range(10) for y in range(10)]
-
-    #Load into Image object to flip image into correct orientation
-    im.putdata(input_lst_cp)
-
-    if(origin[0] == 1):
-        im = im.transpose(Image.FLIP_LEFT_RIGHT)
-    if(origin[1] == 1):
-        im = im.transpose(Image.FLIP_TOP_BOTTOM)
-
-    im_data = list(im.getdata())
-
-    for y in range(10):
-        for x in range(10):
-            if( y % 2 == 0): #Even rows need to be flipped horizontally
-                output_lst[(10*y) + x] = im_data[(10*y) + (9-x)]
-            else: #Odd rows can be mapped as is
-                output_lst[(10*y) + x] = im_data[(10*y) + x]
-    return output_lst
-
-#Like ZigZag but for 1-Dimensional array of tuples
-def ZigZag1D(input_arr):
-    output_arr = [(0,0,0) for i in range(100)]
-
-    for y in range(10):
-        for x in range(10):
-            if( y % 2 == 0):# Even rows need to be flipped horizontally
-                output_arr[(10*y) + x] = input_arr[(10*y) + (9-x)]
-            else: #Odd rows can be mapped as is
-                output_arr[(10*y) + x] = input_arr[(10*y) + x]
-    return output_arr
+FRAME_STORE_DIR = DEFAULT_STORE_DIR
+PANEL_LAYOUT = None #panel layout file (see Panel_Layout.py), None uses $AVE_PANEL_LAYOUT or else the single 10x10 panel
+IMAGE_INTERVAL = 5.0 #seconds
 
 
 #Configure NeoPixel Strip
 pixel_pin = board.D18
-num_pixels = 100
+layout = LoadLayout(PANEL_LAYOUT)
+num_pixels = layout.num_pixels
 ORDER = neopixel.GRB
 
 pixels = neopixel.NeoPixel(pixel_pin, num_pixels, brightness=1.0, auto_write = False, pixel_order=ORDER)
+frame_output = FrameOutput(pixels, num_pixels, ORDER, layout = layout)
 
-im = Image.open(sys.argv[1]) #open the image
-im = im.convert("RGB")
-im = im.resize((10,10))
+store = FrameStore(FRAME_STORE_DIR)
+frames = [store.Load(path, frame_output) for path in sys.argv[1:]]
 
-im_data = list(im.getdata())
-output_data = ZigZag(im_data)
+if(len(frames) == 1):
+    frame_output.ShowWire(frames[0])
+    sys.exit()
 
-for i in range(num_pixels):
-	pixels[i] = output_data[i]
+#Paces the playlist on monotonic deadlines
+scheduler = FrameScheduler(1.0 / IMAGE_INTERVAL)
 
-pixels.show()
+try:
+    while True:
+        for frame in frames:
+            scheduler.Wait()
+            frame_output.ShowWire(frame)
 
+except KeyboardInterrupt:
+    pixels.deinit()
+    sys.exit()